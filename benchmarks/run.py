@@ -0,0 +1,395 @@
+"""
+Time the hot paths of the project on a synthetic match
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The results are saved as JSON to be compared between runs, with the recall of the
+corner kicks finder on the planted corner kicks.
+
+Usage (from the root of the repository):
+    python -m benchmarks.run --frames 54000 --corners 10
+    python -m benchmarks.run --compare benchmarks/results/previous.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic_match import CORNER_DURATION, generate_match
+from code.corner_kicks_finder import DEFAULT_CONFIG, CornerKickFinder
+from code.match_toolbox import Match
+from code.tracking_store import GROUP_CODES
+
+MATCH_ID = 1
+
+# Modules imported by the batch workers, and the modules they must not load
+CORE_MODULES = ("code.batch", "code.live_detector", "code.playbook")
+PLOTTING_MODULES = ("matplotlib", "IPython", "PIL")
+
+# Run in a new process to import a module, the modules already imported by the
+# benchmark would not be imported again
+_IMPORT_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+try:
+    # ru_maxrss may keep the peak of the parent process on Linux
+    with open("/proc/self/status") as file:
+        line = next(line for line in file if line.startswith("VmHWM"))
+    rss_mb = int(line.split()[1]) / 1024
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({{
+    "time": duration,
+    "peak_rss_mb": rss_mb,
+    "plotting_modules": [name for name in {plotting} if name in sys.modules],
+}}))
+"""
+
+
+def measure(function, repeat: int = 3, number: int = 1) -> dict:
+    """
+    Time a function
+
+    Args:
+        function (callable): function without arguments
+        repeat (int): number of measures
+        number (int): number of calls in each measure
+
+    Returns:
+        dict: best, median and mean time of one call over the measures (s)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "best": min(times),
+        "median": float(np.median(times)),
+        "mean": float(np.mean(times)),
+    }
+
+
+def measure_import(module: str, repeat: int = 3) -> tuple:
+    """
+    Time the import of a module in new processes, like a worker starting
+
+    Args:
+        module (str): name of the module
+        repeat (int): number of measures
+
+    Returns:
+        tuple: the timing like measure (s), the peak memory of the process (MB)
+        and the plotting modules loaded by the import
+    """
+    script = _IMPORT_SCRIPT.format(module=module, plotting=PLOTTING_MODULES)
+    measures = [
+        json.loads(
+            subprocess.run(
+                [sys.executable, "-c", script],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+    times = [result["time"] for result in measures]
+    timing = {
+        "repeat": repeat,
+        "number": 1,
+        "best": min(times),
+        "median": float(np.median(times)),
+        "mean": float(np.mean(times)),
+    }
+    return (
+        timing,
+        max(result["peak_rss_mb"] for result in measures),
+        measures[0]["plotting_modules"],
+    )
+
+
+def detection_scores(
+    df_potential: pd.DataFrame, planted: list, tolerance: int
+) -> dict:
+    """
+    Compare the potentiel corner kicks with the planted ones. A potentiel corner kick
+    matches a planted one when it is found between tolerance frames before it and
+    tolerance frames after the ball leaves the corner coin.
+
+    Returns:
+        dict: recall, precision and the planted corner kicks not found
+    """
+    frames = df_potential["frame"].to_numpy()
+    is_matched = np.zeros(len(frames), dtype=bool)
+    missed = []
+    for corner in planted:
+        found = (frames >= corner["frame"] - tolerance) & (
+            frames < corner["frame"] + CORNER_DURATION + tolerance
+        )
+        if not found.any():
+            missed.append(corner["frame"])
+        is_matched |= found
+    return {
+        "planted": len(planted),
+        "found": len(frames),
+        "recall": 1 - len(missed) / len(planted) if planted else None,
+        "precision": float(is_matched.mean()) if len(frames) else None,
+        "missed": missed,
+        "duplicates": int(is_matched.sum()) - (len(planted) - len(missed)),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    data_dir: str,
+    n_frames: int = 54_000,
+    players_per_frame: int = 16,
+    dropout_rate: float = 0.05,
+    missing_ball_rate: float = 0.2,
+    n_corners: int = 10,
+    seed: int = 0,
+    repeat: int = 3,
+    loop: bool = False,
+) -> dict:
+    """
+    Generate a synthetic match and time the hot paths on it
+
+    Args:
+        data_dir (str): folder where the synthetic match and its cache are written
+        n_frames, players_per_frame, dropout_rate, missing_ball_rate, n_corners, seed:
+            parameters of the synthetic match, see generate_match
+        repeat (int): number of measures of each timing
+        loop (bool): also time the frame by frame version of the finder, which is slow
+
+    Returns:
+        dict: the parameters, the timings (s), the memory and the modules loaded by
+        the import of the core modules and the detection scores
+    """
+    params = {
+        "n_frames": n_frames,
+        "players_per_frame": players_per_frame,
+        "dropout_rate": dropout_rate,
+        "missing_ball_rate": missing_ball_rate,
+        "n_corners": n_corners,
+        "seed": seed,
+    }
+    timings = {}
+
+    # The core must be imported without the plotting modules
+    imports = {}
+    for module in CORE_MODULES:
+        timing, peak_rss, plotting = measure_import(module, repeat)
+        timings[f"import {module}"] = timing
+        imports[module] = {"peak_rss_mb": peak_rss, "plotting_modules": plotting}
+
+    planted = []
+    timings["generate_match"] = measure(
+        lambda: planted.extend(generate_match(data_dir, MATCH_ID, **params)), 1
+    )
+    print(f"Synthetic match of {n_frames} frames with {len(planted)} corner kicks")
+
+    def gather(cache_dir):
+        match = Match(MATCH_ID, data_dir=data_dir, cache_dir=cache_dir)
+        match.gather_information()
+        return match
+
+    timings["gather_information"] = measure(lambda: gather(None), repeat)
+    cache_dir = os.path.join(data_dir, "cache")
+    gather(cache_dir)
+    timings["gather_information_cached"] = measure(lambda: gather(cache_dir), repeat)
+
+    match = gather(None)
+    rng = np.random.default_rng(seed)
+    # Frames with players, count_players_in_box needs at least one
+    tracking = match.tracking
+    is_player = np.isin(
+        tracking.group, [GROUP_CODES["home team"], GROUP_CODES["away team"]]
+    )
+    has_players = np.bincount(tracking.entry_rows[is_player], minlength=len(tracking))
+    frames = rng.choice(tracking.frames[has_players > 0], 200)
+    calls = iter(np.tile(frames, repeat))
+    timings["get_coordinates_from_frame"] = measure(
+        lambda: match.get_coordinates_from_frame(next(calls)), repeat, len(frames)
+    )
+    calls = iter(np.tile(frames, repeat))
+    timings["get_frame"] = measure(
+        lambda: match.get_frame(next(calls)), repeat, len(frames)
+    )
+    calls = iter(np.tile(frames, repeat))
+    timings["count_players_in_box"] = measure(
+        lambda: match.count_players_in_box(next(calls)), repeat, len(frames)
+    )
+
+    def kinematics():
+        # Computed again every time
+        match._kinematics = {}
+        return match.kinematics()
+
+    timings["kinematics"] = measure(kinematics, repeat)
+
+    def plot(frame_id):
+        fig, _ = match.plot_frame(frame_id, trajectories_from=20)
+        fig.canvas.draw()
+        plt.close(fig)
+
+    calls = iter(np.tile(frames[:5], repeat))
+    timings["plot_frame"] = measure(lambda: plot(next(calls)), repeat, 5)
+
+    def find(vectorized, prune=True):
+        # The ball track is computed again every time
+        match._ball_tracks = {}
+        match._track_chunks = {}
+        finder = CornerKickFinder(MATCH_ID, store_path=None, match=match)
+        finder.find_potentiel_corner_kicks(vectorized=vectorized, prune=prune)
+        return finder.df_potential
+
+    timings["find_potentiel_corner_kicks"] = measure(lambda: find(True), repeat)
+    timings["find_potentiel_corner_kicks_full"] = measure(
+        lambda: find(True, prune=False), repeat
+    )
+    if loop:
+        timings["find_potentiel_corner_kicks_loop"] = measure(lambda: find(False), 1)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__,
+        },
+        "params": params,
+        "timings": timings,
+        "imports": imports,
+        "detection": detection_scores(
+            find(True), planted, tolerance=DEFAULT_CONFIG["ball_window"]
+        ),
+        # The pruning must not change the frames found
+        "pruning_same_frames": bool(find(True).equals(find(True, prune=False))),
+    }
+
+
+def compare(results: dict, previous: dict):
+    """Print the best times of two runs and their ratio"""
+    if previous.get("params") != results["params"]:
+        print(f"The synthetic matches are different: {previous.get('params')}")
+    print(f"{'':32}{'previous (s)':>14}{'current (s)':>14}{'ratio':>8}")
+    for name, timing in results["timings"].items():
+        before = previous["timings"].get(name, {}).get("best")
+        after = timing["best"]
+        ratio = f"{after / before:8.2f}" if before else f"{'-':>8}"
+        before = f"{before:14.6f}" if before is not None else f"{'-':>14}"
+        print(f"{name:32}{before}{after:14.6f}{ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths of the project on a synthetic match"
+    )
+    parser.add_argument("--frames", type=int, default=54_000, help="frames of play")
+    parser.add_argument(
+        "--players", type=int, default=16, help="players in the view of the camera"
+    )
+    parser.add_argument(
+        "--dropout", type=float, default=0.05, help="probability to miss a player"
+    )
+    parser.add_argument(
+        "--missing-ball", type=float, default=0.2, help="part of frames without the ball"
+    )
+    parser.add_argument(
+        "--corners", type=int, default=10, help="number of planted corner kicks"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="measures of each timing")
+    parser.add_argument(
+        "--loop", action="store_true", help="also time the frame by frame finder"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="folder where the synthetic match is kept, a temporary folder if None",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="JSON file of the results, in benchmarks/results by default",
+    )
+    parser.add_argument("--compare", default=None, help="JSON file of a previous run")
+    args = parser.parse_args()
+
+    kwargs = {
+        "n_frames": args.frames,
+        "players_per_frame": args.players,
+        "dropout_rate": args.dropout,
+        "missing_ball_rate": args.missing_ball,
+        "n_corners": args.corners,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "loop": args.loop,
+    }
+    if args.data_dir is None:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run(data_dir, **kwargs)
+    else:
+        results = run(args.data_dir, **kwargs)
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("benchmarks", "results", f"benchmark-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for name, timing in results["timings"].items():
+        print(f"{name:32}{timing['best']:12.6f} s")
+    detection = results["detection"]
+    print(
+        f"recall {detection['recall']} - precision {detection['precision']} - "
+        f"missed {detection['missed']} - duplicates {detection['duplicates']}"
+    )
+    print(f"same frames with and without pruning: {results['pruning_same_frames']}")
+    for module, imported in results["imports"].items():
+        plotting = ", ".join(imported["plotting_modules"]) or "no plotting module"
+        print(f"import {module}: {imported['peak_rss_mb']:.1f} MB, {plotting}")
+    print(f"Results saved in {output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Generate synthetic matches with the format of the SkillCorner open data
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The players and the ball move randomly and stay away from the corners of the
+pitch, except during the planted corner kicks: the ball is put in a corner coin,
+a player of one team takes the corner and the players of the other team stay out
+of the 10 yards circle. The planted corner kicks are the ground truth of the
+corner kicks finder.
+"""
+
+import json
+import os
+import numpy as np
+
+METERS_PER_YARD = 0.9144
+PITCH_SIZE = (105.0, 68.0)
+BALL_ID = 55
+REFEREE_ID = 9
+
+# Number of frames before the kick-off and during the half time, without data
+FRAMES_BEFORE_KICK_OFF = 100
+FRAMES_HALF_TIME = 200
+# Number of frames during which the ball stays in the corner coin
+CORNER_DURATION = 50
+# Distance from the corners kept by the ball and the players out of the corner kicks (m)
+CORNER_EXCLUSION = 2.0
+
+
+def _match_data(match_id: int) -> dict:
+    players = [
+        {
+            "number": number + 1,
+            "first_name": "Player",
+            "last_name": f"{side.capitalize()} {number + 1}",
+            "trackable_object": 1000 + 100 * index + number,
+            "team_id": 100 * (index + 1),
+        }
+        for index, side in enumerate(("home", "away"))
+        for number in range(11)
+    ]
+    return {
+        "id": match_id,
+        "date_time": "2023-05-20T15:00:00Z",
+        "home_team": {
+            "id": 100,
+            "name": "Home Football Club",
+            "short_name": "Home",
+            "acronym": "HOM",
+        },
+        "away_team": {
+            "id": 200,
+            "name": "Away Football Club",
+            "short_name": "Away",
+            "acronym": "AWY",
+        },
+        "home_team_kit": {
+            "id": 1,
+            "team_id": 100,
+            "jersey_color": "#e00000",
+            "number_color": "#ffffff",
+        },
+        "away_team_kit": {
+            "id": 2,
+            "team_id": 200,
+            "jersey_color": "#ffffff",
+            "number_color": "#000000",
+        },
+        "players": players,
+        "referees": [{"trackable_object": REFEREE_ID}],
+        "ball": {"trackable_object": BALL_ID},
+        "pitch_length": PITCH_SIZE[0],
+        "pitch_width": PITCH_SIZE[1],
+    }
+
+
+def _corners() -> np.ndarray:
+    length, width = PITCH_SIZE
+    return np.array(
+        [(sx * length / 2, sy * width / 2) for sx in (1, -1) for sy in (1, -1)]
+    )
+
+
+def _keep_in_pitch(positions: np.ndarray) -> np.ndarray:
+    """Keep the positions on the pitch and away from the corners"""
+    length, width = PITCH_SIZE
+    positions = np.clip(positions, [-length / 2, -width / 2], [length / 2, width / 2])
+    for corner in _corners():
+        offset = positions - corner
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+        close = distance < CORNER_EXCLUSION
+        # Push the positions out of the corner, towards the centre of the pitch
+        direction = np.where(
+            distance[close, None] > 0,
+            offset[close] / np.maximum(distance[close, None], 1e-9),
+            -corner / np.hypot(*corner),
+        )
+        positions[close] = corner + direction * CORNER_EXCLUSION
+    return positions
+
+
+def _clock(frame_in_period: int, period: int) -> str:
+    seconds = frame_in_period / 10 + 45 * 60 * (period - 1)
+    return f"{int(seconds // 60):02d}:{seconds % 60:04.1f}"
+
+
+def generate_match(
+    data_dir: str,
+    match_id: int = 1,
+    n_frames: int = 54_000,
+    players_per_frame: int = 16,
+    dropout_rate: float = 0.05,
+    missing_ball_rate: float = 0.2,
+    n_corners: int = 10,
+    seed: int = 0,
+) -> list:
+    """
+    Write the match_data.json and structured_data.json files of a synthetic match
+    in data_dir/match_id, with 10 frames per second
+
+    Args:
+        data_dir (str): folder with one folder by match
+        match_id (int): identifier of the match
+        n_frames (int): number of frames of play, without the frames before the
+            kick-off and during the half time
+        players_per_frame (int): number of players in the view of the camera,
+            the closest to the ball
+        dropout_rate (float): probability for a player in the view to be missing
+            from a frame
+        missing_ball_rate (float): part of the frames without the ball, in gaps
+            of 10 frames on average
+        n_corners (int): number of corner kicks planted in the match
+        seed (int): seed of the random generator
+
+    Returns:
+        list: the planted corner kicks, dict with the first frame where the ball is in
+        the corner coin, the corner (x, y) and the team taking it
+    """
+    rng = np.random.default_rng(seed)
+    match_data = _match_data(match_id)
+    players = match_data["players"]
+    teams = np.array([0] * 11 + [1] * 11)
+    corners = _corners()
+    length, width = PITCH_SIZE
+
+    # Frames of play of each half
+    half = n_frames // 2
+    first_frames = FRAMES_BEFORE_KICK_OFF
+    periods = {
+        1: range(first_frames, first_frames + half),
+        2: range(
+            first_frames + half + FRAMES_HALF_TIME,
+            first_frames + n_frames + FRAMES_HALF_TIME,
+        ),
+    }
+    last_frame = periods[2].stop
+
+    # Beginnings of the corner kicks, spread over the match, far from the halves limits
+    play_frames = np.concatenate([np.arange(r.start, r.stop) for r in periods.values()])
+    margin = 3 * CORNER_DURATION
+    slots = np.array_split(play_frames[margin:-margin], max(n_corners, 1))
+    planted = []
+    for slot in slots[:n_corners]:
+        slot = slot[margin // 2 : len(slot) - margin // 2]
+        slot = slot[np.isin(slot + CORNER_DURATION + 20, play_frames)]
+        if len(slot) == 0:
+            continue
+        corner = int(rng.integers(len(corners)))
+        planted.append(
+            {
+                "frame": int(rng.choice(slot)),
+                "corner": [float(value) for value in corners[corner]],
+                "team": int(rng.integers(2)),
+            }
+        )
+    corner_of_frame = {}
+    for index, corner in enumerate(planted):
+        for frame in range(corner["frame"], corner["frame"] + CORNER_DURATION):
+            corner_of_frame[frame] = index
+
+    # Probabilities of the ball gaps, a two states Markov chain
+    gap_end = 0.1
+    gap_start = min(missing_ball_rate * gap_end / max(1 - missing_ball_rate, 1e-9), 1)
+
+    positions = _keep_in_pitch(
+        rng.uniform([-length / 2, -width / 2], [length / 2, width / 2], (22, 2))
+    )
+    velocities = np.zeros((22, 2))
+    ball = np.zeros(2)
+    ball_velocity = np.zeros(2)
+    ball_missing = False
+    kick_target = None
+
+    match_dir = os.path.join(data_dir, str(match_id))
+    os.makedirs(match_dir, exist_ok=True)
+    with open(os.path.join(match_dir, "match_data.json"), "w", encoding="utf-8") as file:
+        json.dump(match_data, file)
+
+    with open(
+        os.path.join(match_dir, "structured_data.json"), "w", encoding="utf-8"
+    ) as file:
+        file.write("[")
+        separator = ""
+        for frame in range(last_frame + FRAMES_BEFORE_KICK_OFF):
+            period = next((p for p, r in periods.items() if frame in r), None)
+            if period is None:
+                item = {"frame": frame, "time": None, "period": None, "data": []}
+                file.write(separator + json.dumps(item))
+                separator = ", "
+                continue
+
+            # Random moves of the players and of the ball
+            velocities = 0.9 * velocities + rng.normal(0, 0.05, velocities.shape)
+            positions = _keep_in_pitch(positions + velocities)
+            if kick_target is not None:
+                ball_velocity = (kick_target - ball) / 5
+                if np.hypot(*(kick_target - ball)) < 1:
+                    kick_target = None
+            else:
+                ball_velocity = 0.9 * ball_velocity + rng.normal(0, 0.15, 2)
+            ball = _keep_in_pitch((ball + ball_velocity)[None])[0]
+            ball_z = float(rng.uniform(0, 0.15))
+
+            taker = None
+            index = corner_of_frame.get(frame)
+            if index is not None:
+                corner = np.array(planted[index]["corner"])
+                team = planted[index]["team"]
+                inwards = -np.sign(corner)
+                ball = corner + inwards * 0.35
+                ball_velocity = np.zeros(2)
+                ball_z = 0.0
+                taker = 11 * team
+                positions[taker] = corner + inwards * 0.6
+                # The defenders stay out of the 10 yards circle
+                offset = positions - corner
+                distance = np.hypot(offset[:, 0], offset[:, 1])
+                close = (teams != team) & (distance < 10.5 * METERS_PER_YARD)
+                positions[close] = (
+                    corner
+                    + offset[close]
+                    / np.maximum(distance[close, None], 1e-9)
+                    * 11
+                    * METERS_PER_YARD
+                )
+                if frame == planted[index]["frame"] + CORNER_DURATION - 1:
+                    # The ball is kicked towards the penalty spot
+                    kick_target = np.array([corner[0] - np.sign(corner[0]) * 11, 0.0])
+
+            # Players in the view of the camera
+            distance = np.hypot(*(positions - ball).T)
+            visible = np.argsort(distance)[:players_per_frame]
+            visible = visible[rng.random(len(visible)) >= dropout_rate]
+            if taker is not None and taker not in visible:
+                visible = np.append(visible, taker)
+
+            data = []
+            for player in sorted(visible.tolist()):
+                entry = {
+                    "x": round(float(positions[player, 0]), 2),
+                    "y": round(float(positions[player, 1]), 2),
+                    "trackable_object": players[player]["trackable_object"],
+                    "track_id": players[player]["trackable_object"],
+                    "group_name": "home team" if teams[player] == 0 else "away team",
+                }
+                data.append(entry)
+            data.append(
+                {
+                    "x": round(float(ball[0]) / 2, 2),
+                    "y": round(float(ball[1]) / 2, 2),
+                    "trackable_object": REFEREE_ID,
+                    "track_id": REFEREE_ID,
+                    "group_name": "referee",
+                }
+            )
+
+            # The ball is visible at the beginning of the corner kicks
+            ball_missing = (
+                rng.random() >= gap_end if ball_missing else rng.random() < gap_start
+            )
+            if not ball_missing or (
+                index is not None and frame == planted[index]["frame"]
+            ):
+                data.append(
+                    {
+                        "x": round(float(ball[0]), 2),
+                        "y": round(float(ball[1]), 2),
+                        "z": round(ball_z, 2),
+                        "trackable_object": BALL_ID,
+                        "track_id": BALL_ID,
+                    }
+                )
+
+            item = {
+                "frame": frame,
+                "time": _clock(frame - periods[period].start, period),
+                "period": period,
+                "data": data,
+            }
+            file.write(separator + json.dumps(item))
+            separator = ", "
+        file.write("]")
+
+    with open(
+        os.path.join(match_dir, "planted_corners.json"), "w", encoding="utf-8"
+    ) as file:
+        json.dump(planted, file)
+    return planted
@@ -0,0 +1,280 @@
+"""
+Define the class TrackingArchive
+Author : Chloe Gobe
+Date : 20.05.2023
+
+An archive holds the tracking data of many matches in one folder: one binary file
+by array of the tracking store, the matches being written one after the other,
+and an index.json with the rows of the frames of each match and its match data.
+The files are read with memory mapping, so that opening a match or a window of
+frames only slices the arrays, without parsing, and the processes reading the
+same archive share the same pages of memory. The size and modification time of
+the source files of each match are kept in the index: a match whose files changed
+since it was archived is read again from its files, like a stale cache.
+
+Usage (from the root of the repository):
+    python -m code.archive data/archive 2068 2269 2417
+    match = Match(2068, archive="data/archive")
+"""
+
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from code.cache import load_match, source_key
+from code.tracking_store import ENTRY_DTYPES, TrackingStore
+
+# Increase when the content of the archive changes
+ARCHIVE_VERSION = 1
+
+# Type of the files of the archive, by array of the tracking store. The time is
+# stored as fixed width text, an empty text being a frame without time.
+TIME_DTYPE = "S16"
+ARRAY_DTYPES = {
+    "frames": np.int64,
+    "period": np.int8,
+    "time": TIME_DTYPE,
+    "offsets": np.int64,
+    **ENTRY_DTYPES,
+}
+
+
+class TrackingArchive:
+    """
+    Define the class TrackingArchive reading the tracking data of many matches
+    from memory mapped files
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): folder of the archive, written by write_archive
+        """
+        self.path = path
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as file:
+            self.index = json.load(file)
+        if self.index["version"] != ARCHIVE_VERSION:
+            raise ValueError(
+                f"{path} is an archive of version {self.index['version']}, "
+                f"rebuild it with the version {ARCHIVE_VERSION}"
+            )
+        n_frames = self.index["n_frames"]
+        n_entries = self.index["n_entries"]
+
+        self.frames = self._open("frames", n_frames)
+        self.period = self._open("period", n_frames)
+        self.time = self._open("time", n_frames)
+        self.offsets = self._open("offsets", n_frames + 1)
+        self.columns = {name: self._open(name, n_entries) for name in ENTRY_DTYPES}
+
+    def _open(self, name: str, length: int) -> np.ndarray:
+        dtype = ARRAY_DTYPES[name]
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            os.path.join(self.path, f"{name}.bin"),
+            dtype=dtype,
+            mode="r",
+            shape=(length,),
+        )
+
+    @property
+    def match_ids(self) -> list:
+        return [int(match_id) for match_id in self.index["matches"]]
+
+    def __contains__(self, match_id: int) -> bool:
+        return str(match_id) in self.index["matches"]
+
+    def __len__(self) -> int:
+        return len(self.index["matches"])
+
+    def _match(self, match_id: int) -> dict:
+        try:
+            return self.index["matches"][str(match_id)]
+        except KeyError:
+            raise KeyError(f"The match {match_id} is not in the archive {self.path}")
+
+    def is_up_to_date(self, match_id: int, sources: list) -> bool:
+        """
+        Check that the source files of a match did not change since it was written
+        in the archive. A match whose source files are all missing is up to date,
+        the archive being its only copy.
+
+        Args:
+            match_id (int): identifier of the match
+            sources (list): paths of match_data.json and structured_data.json
+
+        Returns:
+            bool: False if the match is not in the archive or if a source file has
+            a different path, size or modification time
+        """
+        if match_id not in self:
+            return False
+        if not any(os.path.exists(source) for source in sources):
+            return True
+        try:
+            keys = [source_key(source) for source in sources]
+        except OSError:
+            return False
+        return self._match(match_id)["sources"] == keys
+
+    def match_data(self, match_id: int) -> dict:
+        """Content of the match_data.json of a match"""
+        return self._match(match_id)["match_data"]
+
+    def tracking(
+        self, match_id: int, frame_start: int = None, frame_end: int = None
+    ) -> TrackingStore:
+        """
+        Open the tracking data of a match, or of a window of frames of a match.
+        The per entry arrays are views on the memory mapped files.
+
+        Args:
+            match_id (int): identifier of the match
+            frame_start (int): first frame of the window, the beginning of the match
+                if None
+            frame_end (int): last frame of the window (included), the end of the match
+                if None
+
+        Returns:
+            TrackingStore
+        """
+        first_row, last_row = self._match(match_id)["rows"]
+        frames = self.frames[first_row:last_row]
+        row_start, row_end = first_row, last_row
+        if frame_start is not None:
+            row_start = first_row + int(np.searchsorted(frames, frame_start))
+        if frame_end is not None:
+            row_end = first_row + int(np.searchsorted(frames, frame_end, "right"))
+            row_end = max(row_start, row_end)
+
+        offsets = self.offsets[row_start : row_end + 1]
+        entries = slice(int(offsets[0]), int(offsets[-1]))
+        time = self.time[row_start:row_end].astype(str).astype(object)
+        time[time == ""] = None
+        return TrackingStore(
+            self.frames[row_start:row_end],
+            time,
+            self.period[row_start:row_end],
+            offsets - offsets[0],
+            {name: array[entries] for name, array in self.columns.items()},
+        )
+
+
+def _load_source(match_id: int, data_dir: str, cache_dir: str) -> tuple:
+    """Read a match from the binary cache if up to date, from its files otherwise"""
+    sources = [
+        os.path.join(data_dir, str(match_id), "match_data.json"),
+        os.path.join(data_dir, str(match_id), "structured_data.json"),
+    ]
+    if cache_dir is not None:
+        cached = load_match(os.path.join(cache_dir, str(match_id)), sources)
+        if cached is not None:
+            return cached + (sources,)
+    with open(sources[0], "r", encoding="utf-8") as file:
+        match_data = json.load(file)
+    return match_data, TrackingStore.from_file(sources[1]), sources
+
+
+def write_archive(
+    path: str,
+    match_ids: list,
+    data_dir: str = "data/matches",
+    cache_dir: str = "data/cache",
+):
+    """
+    Write the tracking data of several matches in an archive. The matches are
+    appended one by one to the files, so that only one match is in memory. The
+    archive is written next to its final place and then renamed.
+
+    Args:
+        path (str): folder of the archive, replaced if it exists
+        match_ids (list): identifiers of the matches
+        data_dir (str): folder with one folder by match
+        cache_dir (str): folder of the binary cache of the parsed matches, used when
+            it is up to date, not used if None
+    """
+    temporary_dir = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(temporary_dir, exist_ok=True)
+    files = {
+        name: open(os.path.join(temporary_dir, f"{name}.bin"), "wb")
+        for name in ARRAY_DTYPES
+    }
+    matches = {}
+    n_frames = 0
+    n_entries = 0
+    try:
+        files["offsets"].write(np.zeros(1, dtype=np.int64).tobytes())
+        for match_id in match_ids:
+            match_data, tracking, sources = _load_source(match_id, data_dir, cache_dir)
+            time = np.array(
+                ["" if value is None else value for value in tracking.time],
+                dtype=TIME_DTYPE,
+            )
+            arrays = {
+                "frames": tracking.frames,
+                "period": tracking.period,
+                "time": time,
+                # Offsets in the entries of all the matches
+                "offsets": tracking.offsets[1:] + n_entries,
+            }
+            arrays.update(tracking.columns())
+            for name, array in arrays.items():
+                files[name].write(
+                    np.ascontiguousarray(array, dtype=ARRAY_DTYPES[name]).tobytes()
+                )
+
+            matches[str(match_id)] = {
+                "rows": [n_frames, n_frames + len(tracking)],
+                "sources": [source_key(source) for source in sources],
+                "match_data": match_data,
+            }
+            n_frames += len(tracking)
+            n_entries += tracking.n_entries
+    finally:
+        for file in files.values():
+            file.close()
+
+    index = {
+        "version": ARCHIVE_VERSION,
+        "n_frames": n_frames,
+        "n_entries": n_entries,
+        "matches": matches,
+    }
+    with open(os.path.join(temporary_dir, "index.json"), "w", encoding="utf-8") as file:
+        json.dump(index, file)
+
+    # Replace the previous archive if there is one
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temporary_dir, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the tracking data of several matches in an archive"
+    )
+    parser.add_argument("path", help="folder of the archive")
+    parser.add_argument(
+        "match_ids", type=int, nargs="+", help="identifiers of the matches"
+    )
+    parser.add_argument(
+        "--data-dir", default="data/matches", help="folder with one folder by match"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="data/cache",
+        help="folder of the binary cache of the parsed matches",
+    )
+    args = parser.parse_args()
+
+    write_archive(args.path, args.match_ids, args.data_dir, args.cache_dir)
+    archive = TrackingArchive(args.path)
+    print(
+        f"{len(archive)} matches, {archive.index['n_frames']} frames and "
+        f"{archive.index['n_entries']} entries in {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
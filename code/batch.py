@@ -0,0 +1,178 @@
+"""
+Run the corner kicks finder on many matches in parallel
+Author : Chloe Gobe
+Date : 20.05.2023
+
+Usage (from the root of the repository):
+    python -m code.batch 2068 2269 2417 --workers 4 --output-dir results
+    python -m code.batch 2068 2269 2417 --archive data/archive
+"""
+
+import argparse
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from tqdm import tqdm
+from code import profiling
+from code.corner_kicks_finder import CornerKickFinder
+from code.match_toolbox import Match
+
+MATCH_IDS = [2068, 2269, 2417, 2440, 2841, 3442, 3518, 3749, 4039]
+
+
+def find_corner_kicks(
+    match_id: int, output_dir: str, archive: str = None, **finder_kwargs
+) -> tuple:
+    """
+    Find the potentiel corner kicks of one match. Run in a worker process,
+    an error is returned instead of being raised so that it does not stop the batch.
+
+    Args:
+        match_id (int): identifier of the match
+        output_dir (str): folder of the results store
+        archive (str): folder of an archive holding the match, read instead of
+            the files of the match if given
+        finder_kwargs: thresholds given to CornerKickFinder
+
+    Returns:
+        match_id, df_potential (None if it failed), error (None if it succeeded),
+        records of the profiling of the match (None if it is disabled)
+    """
+    # The worker process may have analysed other matches before
+    profiling.reset()
+    try:
+        # Only read by the finder if the match is not in the results store. The
+        # workers map the same files of the archive, the pages are shared
+        match = Match(match_id, archive=archive)
+        analyzer = CornerKickFinder(
+            match_id,
+            match=match,
+            store_path=os.path.join(output_dir, "corner_kicks.sqlite"),
+            **finder_kwargs,
+        )
+        analyzer.find_potentiel_corner_kicks()
+        df_potential, error = analyzer.df_potential, None
+    except Exception:
+        df_potential, error = None, traceback.format_exc()
+    records = profiling.snapshot() if profiling.is_enabled() else None
+    return match_id, df_potential, error, records
+
+
+def run_batch(
+    match_ids: list,
+    workers: int = None,
+    output_dir: str = "results",
+    archive: str = None,
+    **finder_kwargs,
+) -> pd.DataFrame:
+    """
+    Find the potentiel corner kicks of several matches with a pool of processes
+
+    Args:
+        match_ids (list): identifiers of the matches
+        workers (int): number of processes, the number of CPUs if None
+        output_dir (str): folder where the results are saved, in the results store
+            corner_kicks.sqlite and in corner_kicks.csv
+        archive (str): folder of an archive holding the matches (see
+            code.archive), read instead of the files of the matches if given
+        finder_kwargs: thresholds given to CornerKickFinder
+
+    Returns:
+        pd.DataFrame: the potentiel corner kicks of all the matches with the columns
+        match_id, frame and time. The errors by match_id are in attrs["failures"].
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    failures = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                find_corner_kicks, match_id, output_dir, archive, **finder_kwargs
+            ): match_id
+            for match_id in match_ids
+        }
+        with tqdm(total=len(futures), desc="Matches") as progress:
+            for future in as_completed(futures):
+                try:
+                    match_id, df_potential, error, records = future.result()
+                except Exception:
+                    # The worker process itself died
+                    match_id, df_potential, records = futures[future], None, None
+                    error = traceback.format_exc()
+
+                # The profiling of the workers is reported by the main process
+                if records is not None:
+                    profiling.merge(records)
+
+                if error is None:
+                    results.append(df_potential.assign(match_id=match_id))
+                else:
+                    failures[match_id] = error
+                    tqdm.write(f"{match_id} : failed - {error.splitlines()[-1]}")
+                progress.set_postfix(failed=len(failures))
+                progress.update()
+
+    df_candidates = (
+        pd.concat(results, ignore_index=True)
+        if results
+        else pd.DataFrame(columns=["frame", "time", "match_id"])
+    )
+    df_candidates = df_candidates[["match_id", "frame", "time"]].sort_values(
+        ["match_id", "frame"], ignore_index=True
+    )
+    df_candidates.to_csv(os.path.join(output_dir, "corner_kicks.csv"), index=False)
+    df_candidates.attrs["failures"] = failures
+    return df_candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the potentiel corner kicks of several matches in parallel"
+    )
+    parser.add_argument(
+        "match_ids",
+        type=int,
+        nargs="*",
+        default=MATCH_IDS,
+        help="identifiers of the matches",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--output-dir", default="results", help="folder where the results are saved"
+    )
+    parser.add_argument(
+        "--archive",
+        default=None,
+        help="folder of an archive holding the matches, written by code.archive",
+    )
+    parser.add_argument(
+        "--max-ball-gap",
+        type=int,
+        default=100,
+        help="maximum number of consecutive frames without the ball to interpolate",
+    )
+    args = parser.parse_args()
+
+    df_candidates = run_batch(
+        args.match_ids,
+        workers=args.workers,
+        output_dir=args.output_dir,
+        archive=args.archive,
+        max_ball_gap=args.max_ball_gap,
+    )
+    print(
+        f"{len(df_candidates)} potentiel corner kicks in "
+        f"{df_candidates['match_id'].nunique()} matches, "
+        f"{len(df_candidates.attrs['failures'])} failed"
+    )
+
+
+if __name__ == "__main__":
+    main()
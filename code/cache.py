@@ -0,0 +1,111 @@
+"""
+Binary cache of the parsed data of a match
+Author : Chloe Gobe
+Date : 20.05.2023
+
+A match is cached in a folder holding one .npy file by array of the tracking
+store, read with memory mapping, and a manifest.json with the match data.
+The cache is rebuilt when the schema version changes or when one of the source
+files has a different size or modification time.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+from code.tracking_store import TrackingStore
+
+# Increase when the content of the cache changes
+CACHE_VERSION = 1
+
+PER_FRAME_ARRAYS = ("frames", "period", "offsets")
+
+
+def source_key(path: str) -> dict:
+    """Identify a version of a source file by its path, size and modification time"""
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def load_match(cache_dir: str, sources: list) -> tuple:
+    """
+    Load a match from the cache if it is up to date
+
+    Args:
+        cache_dir (str): folder of the cached match
+        sources (list): paths of the source files of the match
+
+    Returns:
+        match_data, tracking : dict and TrackingStore, or None if the cache is missing or stale
+    """
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest["version"] != CACHE_VERSION or manifest["sources"] != [
+            source_key(path) for path in sources
+        ]:
+            return None
+
+        arrays = {
+            name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+            for name in PER_FRAME_ARRAYS + tuple(manifest["columns"])
+        }
+        # The time is stored as text, an empty text being a frame without time
+        time = np.load(os.path.join(cache_dir, "time.npy")).astype(object)
+    except (OSError, ValueError, KeyError):
+        return None
+    time[time == ""] = None
+
+    tracking = TrackingStore(
+        arrays["frames"],
+        time,
+        arrays["period"],
+        arrays["offsets"],
+        {name: arrays[name] for name in manifest["columns"]},
+    )
+    return manifest["match_data"], tracking
+
+
+def save_match(
+    cache_dir: str, sources: list, match_data: dict, tracking: TrackingStore
+):
+    """
+    Save a match in the cache. The folder is written next to its final place
+    and then renamed so that a reader never sees a partial cache.
+
+    Args:
+        cache_dir (str): folder of the cached match
+        sources (list): paths of the source files of the match
+        match_data (dict): content of match_data.json
+        tracking (TrackingStore): the tracking data of the match
+    """
+    temporary_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    os.makedirs(temporary_dir, exist_ok=True)
+
+    for name in PER_FRAME_ARRAYS:
+        np.save(os.path.join(temporary_dir, f"{name}.npy"), getattr(tracking, name))
+    for name, array in tracking.columns().items():
+        np.save(os.path.join(temporary_dir, f"{name}.npy"), array)
+    time = np.array(["" if value is None else value for value in tracking.time], dtype=str)
+    np.save(os.path.join(temporary_dir, "time.npy"), time)
+
+    manifest = {
+        "version": CACHE_VERSION,
+        "sources": [source_key(path) for path in sources],
+        "columns": list(tracking.columns()),
+        "match_data": match_data,
+    }
+    with open(os.path.join(temporary_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+    # Replace the stale cache if there is one
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    try:
+        os.rename(temporary_dir, cache_dir)
+    except OSError:
+        # Another process wrote the cache at the same time
+        shutil.rmtree(temporary_dir, ignore_errors=True)
@@ -0,0 +1,120 @@
+"""
+Conditions of the potentiel corner kicks on arrays of frames
+Author : Chloe Gobe
+Date : 20.05.2023
+
+A frame is a potentiel corner kick when (A or B) and C are met:
+    A. the ball is in a corner coin and low when it is visible, or in a corner coin
+       in the frames around when it is not,
+    B. a player is in a corner coin,
+    C. at least one corner does not have two opponents in its 10 yards circle,
+and the frame has a time and players. The vectorized CornerKickFinder, the
+corner kick rule of the EventDetector, the sweep of the thresholds and the live
+detector measure the positions in their own way and combine them with these
+functions, so that they find the same frames. The frame by frame finder is kept
+apart as their reference.
+"""
+
+import numpy as np
+
+
+def any_around(condition: np.ndarray, window: int) -> np.ndarray:
+    """
+    For every frame, check if the condition is met in one of the frames around it
+
+    Args:
+        condition (np.ndarray): the condition for each frame
+        window (int): number of frames before and after the frame
+
+    Returns:
+        np.ndarray: the condition for each frame
+    """
+    rows = np.arange(len(condition))
+    start = np.clip(rows - window, 0, len(condition))
+    end = np.clip(rows + window, 0, len(condition))
+    cumulated = np.concatenate([[0], np.cumsum(condition)])
+    return cumulated[end] - cumulated[start] > 0
+
+
+def ball_low_in_corner(
+    ball_in_corner: np.ndarray, z: np.ndarray, max_ball_height: float
+) -> np.ndarray:
+    """Condition A when the ball is visible, an unknown height being 0"""
+    return ball_in_corner & (np.nan_to_num(z, nan=0) < max_ball_height)
+
+
+def condition_on_ball(
+    is_visible: np.ndarray,
+    ball_in_corner: np.ndarray,
+    z: np.ndarray,
+    max_ball_height: float,
+    ball_around_corner: np.ndarray,
+) -> np.ndarray:
+    """
+    Condition A
+
+    Args:
+        is_visible (np.ndarray): True when the ball is observed in the frame
+        ball_in_corner (np.ndarray): True when the ball is in a corner coin
+        z (np.ndarray): height of the ball, NaN if unknown
+        max_ball_height (float): maximum height of the ball (m)
+        ball_around_corner (np.ndarray): ball_in_corner in the frames around, see
+            any_around
+
+    Returns:
+        np.ndarray: the condition for each frame
+    """
+    return np.where(
+        is_visible,
+        ball_low_in_corner(ball_in_corner, z, max_ball_height),
+        ball_around_corner,
+    )
+
+
+def condition_on_players_coordinates(players_in_corners: list) -> np.ndarray:
+    """
+    Condition B
+
+    Args:
+        players_in_corners (list): for each corner coin, the number of players in it
+            by frame, or True when there is at least one
+
+    Returns:
+        np.ndarray: the condition for each frame
+    """
+    return np.any([np.asarray(players) > 0 for players in players_in_corners], axis=0)
+
+
+def condition_on_distance_limit(opponents_in_circles: list) -> np.ndarray:
+    """
+    Condition C
+
+    Args:
+        opponents_in_circles (list): for each corner, the number of players of the
+            home team and of the away team in its 10 yards circle by frame, or True
+            when there is at least one
+
+    Returns:
+        np.ndarray: the condition for each frame
+    """
+    return np.any(
+        [
+            (np.asarray(home) == 0) | (np.asarray(away) == 0)
+            for home, away in opponents_in_circles
+        ],
+        axis=0,
+    )
+
+
+def is_eligible(
+    is_timed: np.ndarray, has_players: np.ndarray, on_distance_limit: np.ndarray
+) -> np.ndarray:
+    """Frames with a time and players meeting the condition C"""
+    return is_timed & has_players & on_distance_limit
+
+
+def is_candidate(
+    eligible: np.ndarray, on_ball: np.ndarray, on_players_coordinates: np.ndarray
+) -> np.ndarray:
+    """(A or B) and C, in the frames with a time and players, see is_eligible"""
+    return eligible & (on_ball | on_players_coordinates)
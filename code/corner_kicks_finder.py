@@ -5,33 +5,38 @@ Date : 20.05.2023
 """
 
 from math import sqrt
+import hashlib
+import json
 import pandas as pd
 import numpy as np
-import pickle
-import os
 from tqdm import tqdm
-from match_toolbox import Match
+from code import conditions
+from code.frame import Frame
+from code.match_toolbox import Match
+from code.profiling import profiled, stage
+from code.regions import CORNERS, SpatialIndex, pitch_regions
+from code.results_store import ResultsStore
+from code.tracking_store import TrackingStore
 
 pd.set_option("mode.chained_assignment", None)
 
-def linear_interpolation(data):
-    values = np.array(data, dtype=float)
-    indices = np.arange(len(values))
-    valid_indices = np.where(~np.isnan(values))
-    
-    if np.sum(valid_indices) == 0:
-        # Toutes les valeurs sont None, aucune interpolation possible
-        return [None] * len(data)
-    
-    interpolated = np.interp(indices, valid_indices[0], values[valid_indices])
-    
-    # Remplacer les None par les valeurs interpolées
-    interpolated_data = data.copy()
-    for i, val in enumerate(interpolated_data):
-        if val is None:
-            interpolated_data[i] = interpolated[i]
-    
-    return interpolated_data
+# Increase when a change of the code changes the frames found
+DETECTOR_VERSION = "2"
+
+DEFAULT_CONFIG = {
+    # Radius of the corner coins (m)
+    "corner_radius": 1,
+    # Maximum height of the ball, above it is a throw in (m)
+    "max_ball_height": 0.2,
+    # Distance of the defenders from the ball during a corner kick (m)
+    "distance_limit": 10 * 0.9144,
+    # Number of frames before and after a frame to look for the interpolated ball
+    "ball_window": 50,
+    # Maximum number of consecutive frames without the ball to interpolate
+    "max_ball_gap": 100,
+    # Minimum number of frames between the beginnings of two situations
+    "min_frames_between": 10,
+}
 
 
 class CornerKickFinder:
@@ -40,15 +45,63 @@ class CornerKickFinder:
     find the starting frame of potentiel corner kicks situations
     """
 
-    def __init__(self, match_id: int):
+    def __init__(
+        self,
+        match_id: int,
+        store_path: str = "results/corner_kicks.sqlite",
+        match: Match = None,
+        **config,
+    ):
+        """
+        Args:
+            match_id (int): identifier of the match
+            store_path (str): SQLite database where the potentiel corner kicks are saved,
+                nothing is saved if None
+            match (Match): the match, loaded from its files if None. Its information
+                is only gathered when the potentiel corner kicks are not in the store
+            config: thresholds of the conditions replacing the ones of DEFAULT_CONFIG
+        """
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise TypeError(f"Unknown parameters of CornerKickFinder: {sorted(unknown)}")
         self.match_id = match_id
-        self.match = Match(match_id)
-        self.match.gather_information()
-        self.df_tracking = self.match.df_tracking[
-            ~self.match.df_tracking["time"].isna()
-        ]
+        self.config = DEFAULT_CONFIG | config
+        self.store = None if store_path is None else ResultsStore(store_path)
+        self._match = Match(match_id) if match is None else match
+        self._regions = None
         self.df_potential = pd.DataFrame()
 
+    @property
+    def match(self) -> Match:
+        """The match, with its information gathered on first use"""
+        if self._match.match_data is None:
+            self._match.gather_information()
+        return self._match
+
+    @property
+    def regions(self) -> dict:
+        """Corner coins and 10 yards circles of the pitch with the thresholds"""
+        if self._regions is None:
+            self._regions = pitch_regions(
+                self.match.pitch_size,
+                corner_radius=self.config["corner_radius"],
+                distance_limit=self.config["distance_limit"],
+            )
+        return self._regions
+
+    @property
+    def df_tracking(self) -> pd.DataFrame:
+        """Tracking data of the frames with a time"""
+        if self.match.df_tracking is None:
+            return None
+        return self.match.df_tracking[~self.match.df_tracking["time"].isna()]
+
+    @property
+    def config_hash(self) -> str:
+        """Identify the configuration of the finder in the results store"""
+        text = json.dumps(self.config, sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
     def _corner_coordinates(self) -> tuple:
         length, width = self.match.pitch_size
         return [
@@ -67,19 +120,30 @@ class CornerKickFinder:
         if x is None and y is None:
             return False
         return any(
-            self._is_in_circle(x, y, corner[0], corner[1], 1)
+            self._is_in_circle(
+                x, y, corner[0], corner[1], self.config["corner_radius"]
+            )
             for corner in self._corner_coordinates()
         )
 
+    def _is_in_corner_coins(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Vectorized version of _is_in_corner_coin for arrays of positions"""
+        return np.any(
+            [self.regions[f"corner_arc_{corner}"].contains(x, y) for corner in CORNERS],
+            axis=0,
+        )
+
     def check_players_coordinatess_in_circle(
-        self, players_coordinates: pd.DataFrame, coin: tuple
+        self, players_coordinates, coin: tuple
     ) -> bool:
         """
         Check if there is two opponents in a 10 yards circle around the corners of the field
 
         Args:
         ------
-            players_coordinates (pd.DataFrame): the coordinates of the players_coordinates
+            players_coordinates (Frame or pd.DataFrame): the coordinates of the
+                players_coordinates, from Match.get_frame or
+                Match.get_coordinates_from_frame
             coin (tuple): coordinates of a corner
 
         Returns:
@@ -87,30 +151,184 @@ class CornerKickFinder:
             bool
         """
         # Filter players_coordinatess inside the circle
-        players_coordinates["distance"] = np.sqrt(
-            (players_coordinates["x"] - coin[0]) ** 2
-            + (players_coordinates["y"] - coin[1]) ** 2
+        distance = np.sqrt(
+            (np.asarray(players_coordinates["x"]) - coin[0]) ** 2
+            + (np.asarray(players_coordinates["y"]) - coin[1]) ** 2
         )
-        filtered_df = players_coordinates[
-            players_coordinates["distance"] <= 10 * 0.9144
-        ]
+        is_inside = distance <= self.config["distance_limit"]
+        if isinstance(players_coordinates, Frame):
+            # The ball and the referees are in the frame too
+            is_inside &= players_coordinates.is_player
 
         # Check if there are two players_coordinatess from different teams inside the circle
-        teams = filtered_df["team"].unique()
+        teams = np.unique(np.asarray(players_coordinates["team"])[is_inside])
         if len(teams) <= 1:
             return True  # There is one team present inside the circle or None
         else:
             return False  # There are two different teams present inside the circle
 
 
-    def find_potentiel_corner_kicks(self):
+    @profiled("CornerKickFinder.candidate_frames_vectorized")
+    def _candidate_frames_vectorized(self, prune: bool = True) -> list:
+        """
+        Evaluate the conditions (A or B) and C for all the frames of the match at once
+        with array operations on the tracking store
+
+        Args:
+            prune (bool): evaluate the players and the condition C only on the frames
+                found by _rows_near_corners, the others cannot meet A or B
+
+        Returns:
+            list: frames where the conditions meet
+        """
+        tracking = self.match.tracking
+
+        # A. Ball in a corner coin and not too high when the ball is visible,
+        # in a corner coin in the interpolated positions around the frame otherwise
+        ball = self.match.get_ball_track(self.config["max_ball_gap"])
+        with stage("CornerKickFinder.condition_on_ball"):
+            is_visible = (
+                ~np.isnan(ball["x"].to_numpy()) & ~ball["interpolated"].to_numpy()
+            )
+            ball_in_corner = self._is_in_corner_coins(
+                ball["x"].to_numpy(), ball["y"].to_numpy()
+            )
+            ball_around_corner = conditions.any_around(
+                ball_in_corner, self.config["ball_window"]
+            )
+            condition_on_ball = conditions.condition_on_ball(
+                is_visible,
+                ball_in_corner,
+                ball["z"].to_numpy(),
+                self.config["max_ball_height"],
+                ball_around_corner,
+            )
+
+        rows = None
+        if prune:
+            rows = self._rows_near_corners(
+                tracking, ball_in_corner | ball_around_corner
+            )
+        is_eligible, condition_on_players_coordinates = self._frame_conditions(
+            tracking, rows
+        )
+
+        is_candidate = conditions.is_candidate(
+            is_eligible, condition_on_ball, condition_on_players_coordinates
+        )
+        return tracking.frames[is_candidate].tolist()
+
+    @profiled("CornerKickFinder.rows_near_corners")
+    def _rows_near_corners(
+        self, tracking: TrackingStore, ball_near_corner: np.ndarray
+    ) -> np.ndarray:
+        """
+        Cheap first pass finding the frames that can meet the condition A or B: a
+        tracked object is in a corner coin, or the ball, interpolated when it is not
+        visible, is in a corner coin in the frames around. Only the few cells of the
+        grid at the corners are searched and the team of the objects is not needed.
+
+        Args:
+            tracking (TrackingStore): tracking data of the match or of some frames
+            ball_near_corner (np.ndarray): True for the frames where the ball is in a
+                corner coin or in one in the frames around
+
+        Returns:
+            np.ndarray: True for the rows of the frames to evaluate
+        """
+        index = self._spatial_index(tracking)
+        is_near = ball_near_corner.copy()
+        for corner in CORNERS:
+            is_near |= index.count_by_frame(self.regions[f"corner_arc_{corner}"]) > 0
+        return is_near
+
+    def _spatial_index(self, tracking: TrackingStore) -> SpatialIndex:
+        if tracking is self.match.tracking:
+            return self.match.spatial_index()
+        return SpatialIndex.from_tracking(tracking)
+
+    def _frame_conditions(
+        self, tracking: TrackingStore, rows: np.ndarray = None
+    ) -> tuple:
+        """
+        Evaluate the conditions that only depend on the content of each frame,
+        for all the frames of a tracking store at once
+
+        Args:
+            tracking (TrackingStore): tracking data of the match or of some frames
+            rows (np.ndarray): True for the rows of the frames to evaluate, all the
+                frames if None. The conditions are False in the other frames.
+
+        Returns:
+            is_eligible : np.ndarray, True when the frame has a time, players and
+                meets the condition C
+            condition_on_players_coordinates : np.ndarray, the condition B
+        """
+        n_frames = len(tracking)
+        entry_rows = tracking.entry_rows
+        index = self._spatial_index(tracking)
+
+        # Players of each frame, a frame without player is not a candidate.
+        # The team is only looked up for the entries of the frames evaluated.
+        if rows is None:
+            team = self.match.team_of_entries(tracking.trackable_object, tracking.group)
+        else:
+            entries = np.flatnonzero(rows[entry_rows])
+            team = np.full(tracking.n_entries, -1, dtype=np.int8)
+            team[entries] = self.match.team_of_entries(
+                tracking.trackable_object[entries], tracking.group[entries]
+            )
+        is_player = team >= 0
+        has_players = np.bincount(entry_rows[is_player], minlength=n_frames) > 0
+
+        # B. Player in a corner coin
+        with stage("CornerKickFinder.condition_on_players_coordinates"):
+            players_in_corners = [
+                index.count_by_frame(self.regions[f"corner_arc_{corner}"], is_player, rows)
+                for corner in CORNERS
+            ]
+            condition_on_players_coordinates = (
+                conditions.condition_on_players_coordinates(players_in_corners)
+            )
+
+        # C. Not two opponents in the 10 yards circle of at least one corner
+        with stage("CornerKickFinder.condition_on_distance_limit"):
+            is_home, is_away = team == 0, team == 1
+            opponents_in_circles = []
+            for corner in CORNERS:
+                circle = self.regions[f"ten_yards_circle_{corner}"]
+                home = index.count_by_frame(circle, is_home, rows)
+                away = index.count_by_frame(circle, is_away, rows)
+                opponents_in_circles.append((home, away))
+            condition_on_distance_limit = conditions.condition_on_distance_limit(
+                opponents_in_circles
+            )
+
+        is_timed = ~pd.isna(tracking.time)
+        is_eligible = conditions.is_eligible(
+            is_timed, has_players, condition_on_distance_limit
+        )
+        if rows is not None:
+            is_eligible &= rows
+        return is_eligible, condition_on_players_coordinates
+
+    @profiled("CornerKickFinder.find_potentiel_corner_kicks")
+    def find_potentiel_corner_kicks(self, vectorized: bool = True, prune: bool = True):
         """
         Find the starting frames of potentiel corner kicks candidates
+
+        Args:
+            vectorized (bool): evaluate the conditions on the whole match at once
+                instead of looping over the frames. Both give the same frames.
+            prune (bool): with vectorized, evaluate the conditions only on the frames
+                where an object or the ball is near a corner. It gives the same frames.
         """
-        # First check if the analysis has not yet been done, otherwise load the pickle
-        if os.path.exists(f"pickle/{self.match_id}.pkl"):
-            with open(f"pickle/{self.match_id}.pkl", "rb") as file:
-                self.df_potential = pickle.load(file)
+        # First check if the analysis has not yet been done with this configuration,
+        # otherwise load the results from the store
+        key = (self.match_id, self.config_hash, DETECTOR_VERSION)
+        if self.store is not None and self.store.has(*key):
+            with stage("CornerKickFinder.load_results"):
+                self.df_potential = self.store.load(*key)
             print(
                 f"{self.match_id} : Already found potentiel corner kicks - loading is over"
             )
@@ -120,59 +338,81 @@ class CornerKickFinder:
                 ~self.match.df_tracking["time"].isna()
             ]
             # List the frames where the conditions meet
-            list_frames = []
+            if vectorized:
+                list_frames = self._candidate_frames_vectorized(prune)
+            else:
+                list_frames = self._candidate_frames_loop()
 
-            for frame in tqdm(self.df_potential["frame"].to_list()):
-                (
-                    players_coordinates,
-                    ball_coordinates,
-                    _,
-                ) = self.match.get_coordinates_from_frame(frame)
+            # Filter the potentiel with the frames that respect the condition
+            self.df_potential = self.df_potential[
+                self.df_potential["frame"].isin(list_frames)
+            ][["frame", "time"]]
 
-                # If there is an empty frame continue to the next frame
-                if (len(players_coordinates) == 0) or (players_coordinates.empty):
-                    continue
+            # To be detected as a new situation
+            self.df_potential = self.df_potential[
+                self.df_potential["frame"].diff() > self.config["min_frames_between"]
+            ].reset_index(drop=True)
 
-                # If the ball is visible, get its location, otherwise the condition is False
+            # Save the results if needed
+            if self.store is not None:
+                with stage("CornerKickFinder.save_results"):
+                    self.store.save(
+                        *key, self.config, self.df_potential, self.match.match_data
+                    )
+
+    @profiled("CornerKickFinder.candidate_frames_loop")
+    def _candidate_frames_loop(self) -> list:
+        """
+        Evaluate the conditions (A or B) and C frame by frame
+
+        Returns:
+            list: frames where the conditions meet
+        """
+        list_frames = []
+        df_timed = self.match.df_tracking[~self.match.df_tracking["time"].isna()]
+        ball_track = self.match.get_ball_track(self.config["max_ball_gap"])
+
+        for frame in tqdm(df_timed["frame"].to_list()):
+            players_coordinates = self.match.get_frame(frame)
+
+            # If there is an empty frame continue to the next frame
+            if players_coordinates.n_players == 0:
+                continue
+
+            # If the ball is visible, get its location, otherwise the condition is False
+            with stage("CornerKickFinder.condition_on_ball"):
+                ball_coordinates = players_coordinates.ball
                 if ball_coordinates is not None:
+                    x_ball, y_ball, z_ball = ball_coordinates
                     condition_on_ball = (
-                        self._is_in_corner_coin(  # Corner coin ?
-                            ball_coordinates["x"], ball_coordinates["y"]
-                        )
-                        and ball_coordinates.get("z", 0) < 0.2
+                        self._is_in_corner_coin(x_ball, y_ball)  # Corner coin ?
+                        and (0 if np.isnan(z_ball) else z_ball)
+                        < self.config["max_ball_height"]
                     )  # Throw in ?
                 else:
-                    # If the ball is not visible we are going to do a linear interpolation
-                    # of its positions 30 frames before and after the frame to see if we can find something
-                    x_gps = []
-                    y_gps=[]
-                    for idx in range(frame-50, frame+50):
-                        _, ball_gps, _ = self.match.get_coordinates_from_frame(idx)
-                        if ball_gps is not None:
-                            x_gps.append(ball_gps["x"])
-                            y_gps.append(ball_gps["y"])
-                        else:
-                            x_gps.append(None)
-                            y_gps.append(None)
-                    
-                    # Interpolation
-                    y_gps = linear_interpolation(y_gps)
-                    x_gps = linear_interpolation(x_gps)
-                    
+                    # If the ball is not visible we use the linear interpolation of its
+                    # positions to see if it is in a corner in the 100 frames around the frame
+                    row = self.match.tracking.row(frame)
+                    window = self.config["ball_window"]
+                    window = ball_track.iloc[max(row - window, 0) : row + window]
                     condition_on_ball = any(
-                        self._is_in_corner_coin(a, b) for a, b in zip(x_gps, y_gps))
+                        self._is_in_corner_coin(a, b)
+                        for a, b in zip(window["x"], window["y"])
+                    )
 
-                # Is there a player on the corner of the field ?
-                condition_on_players_coordinates = (
-                    sum(
-                        players_coordinates.apply(
-                            lambda x: self._is_in_corner_coin(x["x"], x["y"]), axis=1
-                        )
+            # Is there a player on the corner of the field ?
+            with stage("CornerKickFinder.condition_on_players_coordinates"):
+                is_player = players_coordinates.is_player
+                condition_on_players_coordinates = any(
+                    self._is_in_corner_coin(a, b)
+                    for a, b in zip(
+                        players_coordinates.x[is_player],
+                        players_coordinates.y[is_player],
                     )
-                    != 0
                 )
 
-                # Does the situation abide by the law of distance of the defenders ?
+            # Does the situation abide by the law of distance of the defenders ?
+            with stage("CornerKickFinder.condition_on_distance_limit"):
                 condition_on_distance_limit = any(
                     [
                         self.check_players_coordinatess_in_circle(
@@ -182,29 +422,17 @@ class CornerKickFinder:
                     ]
                 )
 
-                # If the frame is a candidate, save it
-                if (
-                    condition_on_ball or condition_on_players_coordinates
-                ) and condition_on_distance_limit:
-                    list_frames.append(frame)
+            # If the frame is a candidate, save it
+            if (
+                condition_on_ball or condition_on_players_coordinates
+            ) and condition_on_distance_limit:
+                list_frames.append(frame)
 
-            # Filter the potentiel with the frames that respect the condition
-            self.df_potential = self.df_potential[
-                self.df_potential["frame"].isin(list_frames)
-            ][["frame", "time"]]
-
-            # To be detected as a new situation
-            self.df_potential = self.df_potential[
-                self.df_potential["frame"].diff() > 10
-            ]
-
-            # Save the file if needed
-            with open(f"pickle/{self.match_id}.pkl", "wb") as file:
-                pickle.dump(self.df_potential, file)
+        return list_frames
 
 
 if __name__ == "__main__":
-    for idf in tqdm([2068, 2269, 2417, 2440, 2841, 3442, 3518, 3749, 4039]):
-        print(f"Processing match : {idf}")
-        analyzer = CornerKickFinder(match_id=idf)
-        analyzer.find_potentiel_corner_kicks()
+    # The matches are processed in parallel by the batch runner
+    from code.batch import main
+
+    main()
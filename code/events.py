@@ -0,0 +1,440 @@
+"""
+Define the class EventDetector
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The set pieces are declared as rules: a function of the features of the frames of
+a match giving True for the frames where the set piece can begin. The features
+(position and height of the ball, players of each team in the regions of the
+pitch, players near the ball) are computed for all the frames at once the first
+time a rule uses them and are shared by the other rules, so that a new set piece
+only adds its own conditions instead of another pass over the match.
+
+Usage (from the root of the repository):
+    python -m code.events 2068
+    detector = EventDetector(match)
+    detector.add_rule("penalty_kick", penalty_kick)
+    df_events = detector.detect()
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from code import conditions
+from code.corner_kicks_finder import DEFAULT_CONFIG
+from code.match_toolbox import Match
+from code.profiling import profiled, stage
+from code.regions import CORNERS, SIDES, TOUCHLINES, pitch_regions
+
+EVENT_CONFIG = DEFAULT_CONFIG | {
+    # Distance from the touchlines of the ball held for a throw in (m)
+    "touchline_margin": 1.0,
+    # Maximum distance between the ball and the player taking a throw in (m)
+    "taker_distance": 1.5,
+    # Radius of the centre spot where the ball of a kick off is put (m)
+    "spot_radius": 1.0,
+}
+
+CORNER_ARCS = tuple(f"corner_arc_{corner}" for corner in CORNERS)
+
+
+class FrameFeatures:
+    """
+    Define the class FrameFeatures, the features of all the frames of a match used
+    by the rules, computed the first time they are asked and then kept
+    """
+
+    def __init__(self, match: Match, config: dict):
+        """
+        Args:
+            match (Match): match with its information gathered
+            config (dict): thresholds of the rules, see EVENT_CONFIG
+        """
+        self.match = match
+        self.config = config
+        self.tracking = match.tracking
+        self.n_frames = len(match.tracking)
+        self.regions = pitch_regions(
+            match.pitch_size,
+            corner_radius=config["corner_radius"],
+            distance_limit=config["distance_limit"],
+            spot_radius=config["spot_radius"],
+            touchline_margin=config["touchline_margin"],
+        )
+        self._cache = {}
+        self._last_rows = None
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def is_timed(self) -> np.ndarray:
+        """True for the frames with a time"""
+        return self._cached("is_timed", lambda: ~pd.isna(self.tracking.time))
+
+    def _team_of(self, entries: np.ndarray) -> np.ndarray:
+        """Team of some entries, 0 for the home team, 1 for the away team, else -1"""
+        return self.match.team_of_entries(
+            self.tracking.trackable_object[entries], self.tracking.group[entries]
+        )
+
+    def _entries_of_rows(self, rows: np.ndarray) -> tuple:
+        """
+        Entries of the frames of rows with their team. The entries of the last rows
+        asked are kept, the conditions of a rule usually use the same rows.
+        """
+        if self._last_rows is None or not np.array_equal(self._last_rows[0], rows):
+            row_indices = np.flatnonzero(rows)
+            entries, owners = self.tracking.entries_of_rows(row_indices)
+            self._last_rows = (
+                rows.copy(),
+                row_indices,
+                entries,
+                owners,
+                self._team_of(entries),
+            )
+        return self._last_rows[1:]
+
+    def has_players(self, rows: np.ndarray = None) -> np.ndarray:
+        """
+        True for the frames with at least one player
+
+        Args:
+            rows (np.ndarray): True for the frames to evaluate, all if None. The
+                other frames are False.
+        """
+        if rows is None:
+            return self._cached(
+                "has_players", lambda: self.has_players(np.ones(self.n_frames, bool))
+            )
+        row_indices, _, owners, team = self._entries_of_rows(rows)
+        has_players = np.zeros(self.n_frames, dtype=bool)
+        has_players[row_indices] = (
+            np.bincount(owners[team >= 0], minlength=len(row_indices)) > 0
+        )
+        return has_players
+
+    @property
+    def ball(self) -> dict:
+        """
+        x, y and z of the ball in every frame, interpolated in the gaps of at most
+        max_ball_gap frames, and visible, False for the frames without the ball
+        and the interpolated ones
+        """
+
+        def compute():
+            track = self.match.get_ball_track(self.config["max_ball_gap"])
+            x = track["x"].to_numpy()
+            return {
+                "x": x,
+                "y": track["y"].to_numpy(),
+                "z": track["z"].to_numpy(),
+                "visible": ~np.isnan(x) & ~track["interpolated"].to_numpy(),
+            }
+
+        return self._cached("ball", compute)
+
+    def ball_in(self, *region_names: str) -> np.ndarray:
+        """True for the frames where the ball is in one of the regions"""
+
+        def compute():
+            is_inside = np.zeros(self.n_frames, dtype=bool)
+            for name in region_names:
+                is_inside |= self.regions[name].contains(self.ball["x"], self.ball["y"])
+            return is_inside
+
+        return self._cached(("ball_in",) + region_names, compute)
+
+    def ball_below(self, height: float) -> np.ndarray:
+        """True for the frames where the ball is below a height, 0 if unknown"""
+        return self._cached(
+            ("ball_below", height),
+            lambda: np.nan_to_num(self.ball["z"], nan=0) < height,
+        )
+
+    def count(
+        self, region_name: str, team: int = None, rows: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Number of players in a region in every frame. The counts of all the frames
+        are found with the spatial index of the match and kept for the next rules.
+        When rows is given, only the entries of these frames are read and nothing
+        is kept, for a condition only needed after the cheap ones of a rule.
+
+        Args:
+            region_name (str): name of a region of pitch_regions
+            team (int): 0 for the home team, 1 for the away team, both if None
+            rows (np.ndarray): True for the frames to evaluate, all if None
+
+        Returns:
+            np.ndarray: number of players in the region by frame, 0 in the frames
+            not evaluated
+        """
+        region = self.regions[region_name]
+        if rows is None:
+
+            def compute():
+                entries, entry_team = self._region_entries(region_name)
+                is_counted = entry_team >= 0 if team is None else entry_team == team
+                return np.bincount(
+                    self.tracking.entry_rows[entries[is_counted]],
+                    minlength=self.n_frames,
+                )
+
+            return self._cached(("count", region_name, team), compute)
+
+        row_indices, entries, owners, entry_team = self._entries_of_rows(rows)
+        is_counted = entry_team >= 0 if team is None else entry_team == team
+        x, y = self.tracking.x[entries], self.tracking.y[entries]
+        is_counted &= region.contains(x, y)
+        counts = np.zeros(self.n_frames, dtype=np.int64)
+        counts[row_indices] = np.bincount(
+            owners[is_counted], minlength=len(row_indices)
+        )
+        return counts
+
+    def _region_entries(self, region_name: str) -> tuple:
+        """Entries in a region in all the frames, with their team"""
+
+        def compute():
+            entries = self.match.spatial_index().query(self.regions[region_name])
+            return entries, self._team_of(entries)
+
+        return self._cached(("entries", region_name), compute)
+
+    def around(self, condition: np.ndarray) -> np.ndarray:
+        """
+        True for the frames where the condition is met in one of the ball_window
+        frames before or after them, see conditions.any_around
+        """
+        return conditions.any_around(condition, self.config["ball_window"])
+
+    def players_near_ball(self, distance: float, rows: np.ndarray) -> np.ndarray:
+        """
+        Number of players at most at a distance from the ball. Only the entries of
+        the frames of rows are read, the cheap conditions of a rule should give them.
+
+        Args:
+            distance (float): maximum distance from the ball (m)
+            rows (np.ndarray): True for the frames to evaluate
+
+        Returns:
+            np.ndarray: number of players near the ball by frame, 0 in the frames
+            not evaluated
+        """
+        row_indices, entries, owners, entry_team = self._entries_of_rows(rows)
+        ball_rows = row_indices[owners]
+        is_near = (entry_team >= 0) & (
+            np.hypot(
+                self.tracking.x[entries] - self.ball["x"][ball_rows],
+                self.tracking.y[entries] - self.ball["y"][ball_rows],
+            )
+            <= distance
+        )
+        counts = np.zeros(self.n_frames, dtype=np.int64)
+        counts[row_indices] = np.bincount(owners[is_near], minlength=len(row_indices))
+        return counts
+
+
+def corner_kick(features: FrameFeatures) -> np.ndarray:
+    """
+    The conditions of CornerKickFinder: (A or B) and C, see code.conditions.
+    As in the finder, the players and the condition C are only evaluated in the
+    frames where A or B can be met.
+    """
+    ball = features.ball
+    ball_in_corner = features.ball_in(*CORNER_ARCS)
+    ball_around_corner = features.around(ball_in_corner)
+    condition_on_ball = conditions.condition_on_ball(
+        ball["visible"],
+        ball_in_corner,
+        ball["z"],
+        features.config["max_ball_height"],
+        ball_around_corner,
+    )
+    condition_on_players_coordinates = conditions.condition_on_players_coordinates(
+        [features.count(arc) for arc in CORNER_ARCS]
+    )
+
+    rows = (
+        ball_in_corner | ball_around_corner | condition_on_players_coordinates
+    ) & features.is_timed
+    condition_on_distance_limit = conditions.condition_on_distance_limit(
+        [
+            (
+                features.count(f"ten_yards_circle_{corner}", 0, rows),
+                features.count(f"ten_yards_circle_{corner}", 1, rows),
+            )
+            for corner in CORNERS
+        ]
+    )
+    is_eligible = conditions.is_eligible(
+        rows, features.has_players(rows), condition_on_distance_limit
+    )
+    return conditions.is_candidate(
+        is_eligible, condition_on_ball, condition_on_players_coordinates
+    )
+
+
+def throw_in(features: FrameFeatures) -> np.ndarray:
+    """
+    The ball is held above the ground near a touchline, out of the corner coins,
+    with a player next to it
+    """
+    ball = features.ball
+    is_possible = (
+        ball["visible"]
+        & features.ball_in(*(f"touchline_{touchline}" for touchline in TOUCHLINES))
+        & ~features.ball_in(*CORNER_ARCS)
+        & ~features.ball_below(features.config["max_ball_height"])
+        & features.is_timed
+    )
+    taker = features.players_near_ball(features.config["taker_distance"], is_possible)
+    return is_possible & (taker > 0)
+
+
+def goal_kick(features: FrameFeatures) -> np.ndarray:
+    """
+    The ball is on the ground in a six yards box, and the players in the box,
+    at least the goalkeeper, are all of the same team
+    """
+    is_ball_down = features.ball["visible"] & features.ball_below(
+        features.config["max_ball_height"]
+    )
+    is_goal_kick = np.zeros(features.n_frames, dtype=bool)
+    for side in SIDES:
+        rows = is_ball_down & features.ball_in(f"six_yards_box_{side}")
+        home = features.count(f"box_{side}", 0, rows)
+        away = features.count(f"box_{side}", 1, rows)
+        is_goal_kick |= rows & (home + away > 0) & ((home == 0) | (away == 0))
+    return is_goal_kick
+
+
+def kick_off(features: FrameFeatures) -> np.ndarray:
+    """
+    The ball is on the centre spot, the players of each team are in their half and
+    the players in the centre circle are all of the same team
+    """
+    rows = (
+        features.ball["visible"]
+        & features.ball_in("centre_spot")
+        & features.ball_below(features.config["max_ball_height"])
+        & features.is_timed
+    )
+    rows &= features.has_players(rows)
+    in_halves = np.zeros(features.n_frames, dtype=bool)
+    for side, other_side in (("left", "right"), ("right", "left")):
+        in_halves |= (features.count(f"half_{other_side}", 0, rows) == 0) & (
+            features.count(f"half_{side}", 1, rows) == 0
+        )
+    one_team_in_circle = (features.count("centre_circle", 0, rows) == 0) | (
+        features.count("centre_circle", 1, rows) == 0
+    )
+    return rows & in_halves & one_team_in_circle
+
+
+DEFAULT_RULES = {
+    "corner_kick": corner_kick,
+    "throw_in": throw_in,
+    "goal_kick": goal_kick,
+    "kick_off": kick_off,
+}
+
+
+class EventDetector:
+    """
+    Define the class EventDetector finding the starting frames of several kinds of
+    set pieces in one pass over the frames of a match
+    """
+
+    def __init__(self, match: Match, rules: dict = None, **config):
+        """
+        Args:
+            match (Match): match with its information gathered
+            rules (dict): rules by name of event, DEFAULT_RULES if None
+            config: thresholds of the rules replacing the ones of EVENT_CONFIG
+        """
+        unknown = set(config) - set(EVENT_CONFIG)
+        if unknown:
+            raise TypeError(f"Unknown parameters of EventDetector: {sorted(unknown)}")
+        self.match = match
+        self.config = EVENT_CONFIG | config
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.features = FrameFeatures(match, self.config)
+
+    def add_rule(self, name: str, rule):
+        """
+        Add a kind of event, or replace one
+
+        Args:
+            name (str): name of the event
+            rule (callable): function of a FrameFeatures giving an array with True
+                for the frames where the event can begin
+        """
+        self.rules[name] = rule
+
+    @profiled("EventDetector.detect")
+    def detect(self, events: list = None) -> pd.DataFrame:
+        """
+        Find the starting frames of the events
+
+        Args:
+            events (list): names of the events to find, all the rules if None
+
+        Returns:
+            pandas.DataFrame with the columns event, frame and time, sorted by frame
+        """
+        tracking = self.match.tracking
+        names = list(self.rules) if events is None else list(events)
+        event_rows = []
+        for name in names:
+            with stage(f"EventDetector.{name}"):
+                is_event = self.rules[name](self.features) & self.features.is_timed
+            rows = np.flatnonzero(is_event)
+
+            # To be detected as a new situation, as in CornerKickFinder
+            is_new = np.diff(tracking.frames[rows]) > self.config["min_frames_between"]
+            event_rows.append(rows[1:][is_new])
+
+        # One table for all the events, sorted by frame
+        event = np.repeat(np.arange(len(names)), [len(rows) for rows in event_rows])
+        rows = np.concatenate(event_rows) if event_rows else np.zeros(0, np.int64)
+        order = np.lexsort((event, rows))
+        return pd.DataFrame(
+            {
+                "event": np.array(names, dtype=object)[event[order]],
+                "frame": tracking.frames[rows[order]],
+                "time": tracking.time[rows[order]],
+            }
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the set pieces of a match in one pass over its frames"
+    )
+    parser.add_argument("match_id", type=int, help="identifier of the match")
+    parser.add_argument(
+        "--events",
+        nargs="+",
+        default=None,
+        choices=list(DEFAULT_RULES),
+        help="events to find (default: all)",
+    )
+    parser.add_argument(
+        "--output", default=None, help="CSV file where the events are saved"
+    )
+    args = parser.parse_args()
+
+    match = Match(args.match_id)
+    match.gather_information()
+    df_events = EventDetector(match).detect(args.events)
+    print(df_events["event"].value_counts().to_string())
+    if args.output is not None:
+        df_events.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Define the class Frame
+Author : Chloe Gobe
+Date : 20.05.2023
+
+A Frame holds the entries of one frame of a match as views on the arrays of the
+tracking store, with the team of each entry from the lookup tables of the match.
+Nothing is copied when a frame is built, the pandas DataFrame of the players is
+only built by to_dataframe.
+
+Usage:
+    frame = match.get_frame(frame_id)
+    x, y = frame.team_positions(0)
+    frame.to_dataframe()
+"""
+
+import numpy as np
+import pandas as pd
+from code.tracking_store import GROUP_NAMES
+
+
+class Frame:
+    """Define the class Frame, the tracked objects of one frame of a match"""
+
+    __slots__ = (
+        "match",
+        "frame_id",
+        "time",
+        "x",
+        "y",
+        "z",
+        "trackable_object",
+        "track_id",
+        "group",
+        "team",
+    )
+
+    def __init__(self, match, frame_id: int):
+        """
+        Args:
+            match (Match): match with its information gathered
+            frame_id (int): identifier of a frame
+
+        Raises:
+            KeyError: if the frame is not in the tracking data
+        """
+        tracking = match.tracking
+        row = tracking.row(frame_id)
+        entries = slice(tracking.offsets[row], tracking.offsets[row + 1])
+        self.match = match
+        self.frame_id = frame_id
+        self.time = tracking.time[row]
+        self.x = tracking.x[entries]
+        self.y = tracking.y[entries]
+        self.z = tracking.z[entries]
+        self.trackable_object = tracking.trackable_object[entries]
+        self.track_id = tracking.track_id[entries]
+        self.group = tracking.group[entries]
+        # 0 for the home team, 1 for the away team, -1 for the others
+        self.team = match.team_of_entries(self.trackable_object, self.group)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Per entry array of the frame, like the columns of a DataFrame"""
+        if name not in self.__slots__[3:]:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __repr__(self) -> str:
+        return f"Frame({self.frame_id}, {len(self)} entries, time={self.time!r})"
+
+    @property
+    def is_player(self) -> np.ndarray:
+        """True for the entries of the players of both teams"""
+        return self.team >= 0
+
+    @property
+    def n_players(self) -> int:
+        return int(np.count_nonzero(self.team >= 0))
+
+    @property
+    def ball_index(self) -> int:
+        """Index of the entry of the ball, None if it is not visible"""
+        index = np.flatnonzero(self.trackable_object == self.match.id_ball)
+        return int(index[0]) if len(index) > 0 else None
+
+    @property
+    def ball(self) -> tuple:
+        """(x, y, z) of the ball, z being NaN if unknown, None if it is not visible"""
+        index = self.ball_index
+        if index is None:
+            return None
+        return float(self.x[index]), float(self.y[index]), float(self.z[index])
+
+    def team_positions(self, team: int) -> tuple:
+        """
+        Positions of the players of a team
+
+        Args:
+            team (int): 0 for the home team, 1 for the away team
+
+        Returns:
+            tuple: x and y of the players
+        """
+        is_team = self.team == team
+        return self.x[is_team], self.y[is_team]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Players of the frame with their information
+
+        Returns:
+            pandas.DataFrame with the columns x, y, trackable_object, track_id,
+            group_name, number, first_name, last_name, team_id, team, short_name
+            and jersey_color
+        """
+        match = self.match
+        is_player = self.is_player
+        team = self.team[is_player]
+        trackable_object = self.trackable_object[is_player]
+        rows = match._object_rows(trackable_object)
+        number = match.object_number[rows]
+        if not np.isnan(number).any():
+            number = number.astype(np.int64)
+        group_names = np.array(GROUP_NAMES + (None,), dtype=object)
+        return pd.DataFrame(
+            {
+                "x": self.x[is_player],
+                "y": self.y[is_player],
+                "trackable_object": trackable_object.astype(np.int64),
+                "track_id": self.track_id[is_player].astype(np.int64),
+                "group_name": group_names[self.group[is_player]],
+                "number": number,
+                "first_name": match.object_first_name[rows],
+                "last_name": match.object_last_name[rows],
+                "team_id": match.team_ids[team],
+                "team": match.team_keys[team],
+                "short_name": match.team_short_names[team],
+                "jersey_color": match.team_jersey_colors[team],
+            }
+        )
@@ -0,0 +1,172 @@
+"""
+Render the frames of an action into a gif
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The pitch is drawn once, then for each frame only the players, the ball and the
+texts are drawn again on a copy of the background (blitting). The images are
+converted to the palette of the first one and given to the gif encoder from
+memory, without temporary files.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
+from code.pitch import plot_pitch, text_positions
+
+
+class FrameRenderer:
+    """
+    Define the class FrameRenderer drawing the frames of a match on one figure.
+    The images look like the ones of Match.plot_frame.
+    """
+
+    def __init__(self, pitch_size: tuple = (106.0, 68.0)):
+        self.fig, self.ax = plot_pitch(field_dimen=pitch_size, cached=True)
+        ax = self.ax
+        x_clock, y_frame, y_title = text_positions(pitch_size)
+
+        # Everything that changes from one frame to another is animated,
+        # so that it is not part of the background
+        (self.ball,) = ax.plot(
+            [], [], marker="D", markersize=17, color="k", alpha=0.2, animated=True
+        )
+        (self.home,) = ax.plot([], [], "o", markersize=10, animated=True)
+        (self.away,) = ax.plot([], [], "o", markersize=10, animated=True)
+        self.home_name = ax.text(
+            0, y_title, "", fontsize=18, weight="black", animated=True
+        )
+        ax.text(
+            0.5, y_title, " - ", fontsize=18, color="black", ha="center", weight="black"
+        )
+        self.away_name = ax.text(
+            5, y_title, "", fontsize=18, weight="black", animated=True
+        )
+        self.frame_id = ax.text(
+            x_clock,
+            y_frame,
+            "",
+            fontsize=14,
+            color="black",
+            weight="black",
+            animated=True,
+        )
+        self.time = ax.text(
+            x_clock,
+            y_title,
+            "",
+            fontsize=14,
+            color="black",
+            weight="black",
+            animated=True,
+        )
+        self.artists = [
+            self.ball,
+            self.home,
+            self.away,
+            self.home_name,
+            self.away_name,
+            self.frame_id,
+            self.time,
+        ]
+
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, drawing: dict) -> np.ndarray:
+        """
+        Draw a frame
+
+        Args:
+            drawing (dict): what is visible on the frame, from Match._get_frame_drawing
+
+        Returns:
+            np.ndarray: RGB image of the frame
+        """
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+
+        if drawing["ball"] is None:
+            self.ball.set_data([], [])
+        else:
+            self.ball.set_data([drawing["ball"][0]], [drawing["ball"][1]])
+        for side, line, name in (
+            ("home", self.home, self.home_name),
+            ("away", self.away, self.away_name),
+        ):
+            line.set_data(drawing[f"{side}_x"], drawing[f"{side}_y"])
+            line.set_color(drawing[f"{side}_color"])
+            name.set_text(drawing[f"{side}_name"])
+            name.set_color(drawing[f"{side}_title_color"])
+        self.home_name.set_x(-len(drawing["home_name"]) * 2.5)
+        self.frame_id.set_text(drawing["frame"])
+        self.time.set_text(drawing["time"])
+
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def render_frames(drawings: list, pitch_size: tuple = (106.0, 68.0)) -> list:
+    """
+    Draw several frames on the same figure and convert them to 256 colors,
+    using the palette of the first image for all of them
+
+    Args:
+        drawings (list): what is visible on each frame, from Match._get_frame_drawing
+        pitch_size (tuple): length and width of the pitch in meters
+
+    Returns:
+        list: PIL.Image of each frame
+    """
+    renderer = FrameRenderer(pitch_size)
+    images = []
+    try:
+        for drawing in drawings:
+            image = Image.fromarray(renderer.render(drawing))
+            if images:
+                image = image.quantize(palette=images[0], dither=Image.Dither.NONE)
+            else:
+                image = image.quantize(colors=256)
+            images.append(image)
+    finally:
+        renderer.close()
+    return images
+
+
+def write_gif(
+    path: str, drawings: list, workers: int = 1, pitch_size: tuple = (106.0, 68.0)
+):
+    """
+    Draw the frames and save them as a gif
+
+    Args:
+        path (str): path of the gif
+        drawings (list): what is visible on each frame, from Match._get_frame_drawing
+        workers (int): number of processes drawing the frames, each one
+            drawing a consecutive part of the frames
+        pitch_size (tuple): length and width of the pitch in meters
+    """
+    if workers <= 1:
+        images = render_frames(drawings, pitch_size)
+    else:
+        size = -(-len(drawings) // workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map gives the images in the order of the frames
+            images = [
+                image
+                for chunk in executor.map(
+                    render_frames,
+                    [drawings[i : i + size] for i in range(0, len(drawings), size)],
+                    repeat(pitch_size),
+                )
+                for image in chunk
+            ]
+
+    # The frames are already quantized, the encoder does not need to optimize them
+    images[0].save(path, save_all=True, append_images=images[1:], optimize=False)
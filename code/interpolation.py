@@ -0,0 +1,117 @@
+"""
+Functions to fill the gaps in the positions of the tracked objects
+Author : Chloe Gobe
+Date : 20.05.2023
+"""
+
+import numpy as np
+
+METHODS = ("linear", "spline")
+
+
+def gap_lengths(is_valid: np.ndarray) -> np.ndarray:
+    """
+    Give for every frame the length of the gap of missing values it belongs to
+
+    Args:
+        is_valid (np.ndarray): True when the value is known
+
+    Returns:
+        np.ndarray: 0 for the known values, the number of consecutive missing
+        values around the frame otherwise
+    """
+    is_missing = ~is_valid
+    # Identify each run of missing values by the number of known values before it
+    run = np.cumsum(is_valid)
+    lengths = np.bincount(run[is_missing], minlength=run[-1] + 1 if len(run) else 0)
+    result = np.zeros(len(is_valid), dtype=np.int64)
+    result[is_missing] = lengths[run[is_missing]]
+    return result
+
+
+def interpolate_gaps(
+    values: np.ndarray, max_gap: int = None, method: str = "linear"
+) -> tuple:
+    """
+    Interpolation of the missing values (NaN) of a trajectory.
+    Only the gaps between two known values are filled, and only if they
+    are not longer than max_gap frames.
+
+    Args:
+        values (np.ndarray): positions by frame, of shape (n_frames,) or (n_frames, n_dimensions).
+            A frame is missing when its first dimension is NaN.
+        max_gap (int): maximum number of consecutive missing frames to fill, no limit if None
+        method (str): "linear", or "spline" for a cubic Hermite spline following the
+            speed of the object in the frames just before and after the gap
+
+    Returns:
+        filled : np.ndarray with the same shape as values
+        is_interpolated : np.ndarray of bool, True for the filled frames
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown interpolation method {method!r}, use one of {METHODS}")
+    values = np.asarray(values, dtype=float)
+    filled = values.copy()
+    reference = values if values.ndim == 1 else values[:, 0]
+    is_valid = ~np.isnan(reference)
+    is_interpolated = np.zeros(len(values), dtype=bool)
+
+    valid_rows = np.flatnonzero(is_valid)
+    if len(valid_rows) < 2:
+        return filled, is_interpolated
+
+    # Missing frames between the first and the last known values
+    rows = np.arange(valid_rows[0] + 1, valid_rows[-1])
+    rows = rows[~is_valid[rows]]
+    if max_gap is not None:
+        rows = rows[gap_lengths(is_valid)[rows] <= max_gap]
+
+    if method == "spline":
+        filled[rows] = _hermite_gaps(values, is_valid, valid_rows, rows)
+    elif values.ndim == 1:
+        filled[rows] = np.interp(rows, valid_rows, values[valid_rows])
+    else:
+        for dimension in range(values.shape[1]):
+            filled[rows, dimension] = np.interp(
+                rows, valid_rows, values[valid_rows, dimension]
+            )
+    is_interpolated[rows] = True
+    return filled, is_interpolated
+
+
+def _hermite_gaps(
+    values: np.ndarray, is_valid: np.ndarray, valid_rows: np.ndarray, rows: np.ndarray
+) -> np.ndarray:
+    """
+    Cubic Hermite interpolation of the missing rows. The speed at each end of a gap
+    is the difference with the frame next to it, out of the gap, or the mean speed
+    over the gap when this frame is missing too. Only the frames next to the gap
+    are used, so that a window of the trajectory gives the same values.
+
+    Returns:
+        np.ndarray: the values of the rows
+    """
+    position = np.searchsorted(valid_rows, rows)
+    left = valid_rows[position - 1]
+    right = valid_rows[position]
+    before = np.maximum(left - 1, 0)
+    after = np.minimum(right + 1, len(values) - 1)
+    has_before = (left > 0) & is_valid[before]
+    has_after = (right + 1 < len(values)) & is_valid[after]
+    length = right - left
+    t = (rows - left) / length
+    if values.ndim > 1:
+        # One column by dimension
+        has_before, has_after = has_before[:, None], has_after[:, None]
+        length, t = length[:, None], t[:, None]
+
+    chord = (values[right] - values[left]) / length
+    left_speed = np.where(has_before, values[left] - values[before], chord)
+    right_speed = np.where(has_after, values[after] - values[right], chord)
+    t2, t3 = t * t, t * t * t
+    return (
+        (2 * t3 - 3 * t2 + 1) * values[left]
+        + (t3 - 2 * t2 + t) * length * left_speed
+        + (-2 * t3 + 3 * t2) * values[right]
+        + (t3 - t2) * length * right_speed
+    )
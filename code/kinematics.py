@@ -0,0 +1,345 @@
+"""
+Define the class Kinematics
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The kinematics give the smoothed position, the velocity, the speed, the
+acceleration, the heading and the distance covered of every tracked object in
+every frame of a match, on the plane of the pitch. The entries of the tracking
+store are put in arrays of shape (objects, frames) and every quantity is computed
+for all the objects at once. The time between two frames comes from their
+identifiers, so that the frames missing from the tracking data do not change the
+speeds. The short gaps where an object is not visible are filled linearly, the
+longer ones split its trajectory in segments: nothing is smoothed or derived
+across them.
+
+Usage:
+    kinematics = match.kinematics()
+    kinematics.speed  # shape (n_objects, n_frames), m/s
+    match.kinematics(frame_start, frame_end).to_dataframe()
+"""
+
+import numpy as np
+import pandas as pd
+
+# Number of frames per second of the tracking data
+FRAME_RATE = 10
+
+
+def _take(values: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """Value of each object at the given column of each of its frames"""
+    return np.take_along_axis(values, columns, axis=1)
+
+
+def _fill_gaps(x: np.ndarray, y: np.ndarray, frames: np.ndarray, max_gap: int):
+    """
+    Fill linearly in place the gaps of at most max_gap frames between two known
+    positions of an object, no limit if max_gap is None
+
+    Returns:
+        np.ndarray: True for the filled positions
+    """
+    n_objects, n_rows = x.shape
+    columns = np.broadcast_to(np.arange(n_rows), x.shape)
+    is_valid = ~np.isnan(x)
+    before = np.maximum.accumulate(np.where(is_valid, columns, -1), axis=1)
+    after = np.minimum.accumulate(
+        np.where(is_valid, columns, n_rows)[:, ::-1], axis=1
+    )[:, ::-1]
+    objects, rows = np.nonzero(~is_valid & (before >= 0) & (after < n_rows))
+    before, after = before[objects, rows], after[objects, rows]
+    if max_gap is not None:
+        is_short = frames[after] - frames[before] - 1 <= max_gap
+        objects, rows = objects[is_short], rows[is_short]
+        before, after = before[is_short], after[is_short]
+
+    weight = (frames[rows] - frames[before]) / (frames[after] - frames[before])
+    for values in (x, y):
+        start = values[objects, before]
+        values[objects, rows] = start + weight * (values[objects, after] - start)
+    is_interpolated = np.zeros(x.shape, dtype=bool)
+    is_interpolated[objects, rows] = True
+    return is_interpolated
+
+
+def _segments(is_valid: np.ndarray, frames: np.ndarray, max_gap: int) -> tuple:
+    """
+    Give the first and the last column of the segment of each known position. A
+    segment ends where the object is not known in the next frame of the tracking
+    data, or where more than max_gap frames are missing from the tracking data.
+    """
+    n_rows = is_valid.shape[1]
+    columns = np.broadcast_to(np.arange(n_rows), is_valid.shape)
+    is_cut = np.ones(n_rows + 1, dtype=bool)
+    if max_gap is not None:
+        is_cut[1:-1] = np.diff(frames) - 1 > max_gap
+    else:
+        is_cut[1:-1] = False
+    padded = np.pad(is_valid, ((0, 0), (1, 1)))
+    is_first = is_valid & (~padded[:, :-2] | is_cut[:-1])
+    is_last = is_valid & (~padded[:, 2:] | is_cut[1:])
+    first = np.maximum.accumulate(np.where(is_first, columns, 0), axis=1)
+    last = np.minimum.accumulate(
+        np.where(is_last, columns, n_rows - 1)[:, ::-1], axis=1
+    )[:, ::-1]
+    # The unknown positions are segments of one frame
+    first = np.where(is_valid, first, columns)
+    last = np.where(is_valid, last, columns)
+    return first, last
+
+
+def _smooth(
+    values: np.ndarray, first: np.ndarray, last: np.ndarray, half_window: int
+) -> np.ndarray:
+    """
+    Centered moving average over 2 * half_window + 1 frames, the window being
+    narrowed at the ends of the segments so that it stays centered
+    """
+    n_rows = values.shape[1]
+    columns = np.arange(n_rows)
+    half = np.minimum(np.minimum(columns - first, last - columns), half_window)
+    # Sum of the shifted values rather than a cumulated sum, so that the values
+    # do not depend on the first frame computed
+    padded = np.pad(values, ((0, 0), (half_window, half_window)))
+    total = values.copy()
+    for shift in range(1, half_window + 1):
+        is_inside = half >= shift
+        for start in (half_window - shift, half_window + shift):
+            total += np.where(is_inside, padded[:, start : start + n_rows], 0)
+    return total / (2 * half + 1)
+
+
+def _derivative(
+    values: np.ndarray, times: np.ndarray, first: np.ndarray, last: np.ndarray
+) -> np.ndarray:
+    """
+    Derivative with respect to the time, centered inside the segments and one
+    sided at their ends, NaN for the segments of one frame
+    """
+    columns = np.arange(values.shape[1])
+    before = np.maximum(columns - 1, first)
+    after = np.minimum(columns + 1, last)
+    duration = times[after] - times[before]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        derivative = (_take(values, after) - _take(values, before)) / duration
+    derivative[duration == 0] = np.nan
+    return derivative
+
+
+class Kinematics:
+    """
+    Define the class Kinematics, the movement of every tracked object in the frames
+    of a match. The arrays are of shape (n_objects, n_frames), NaN where the
+    position of the object is unknown.
+    """
+
+    QUANTITIES = ("x", "y", "vx", "vy", "speed", "acceleration", "heading")
+
+    def __init__(
+        self,
+        trackable_objects: np.ndarray,
+        frames: np.ndarray,
+        quantities: dict,
+        step: np.ndarray,
+        interpolated: np.ndarray,
+    ):
+        """
+        Args:
+            trackable_objects (np.ndarray): identifiers of the objects, in increasing
+                order
+            frames (np.ndarray): identifiers of the frames
+            quantities (dict): arrays of QUANTITIES
+            step (np.ndarray): distance covered since the previous frame, 0 at the
+                beginning of the segments
+            interpolated (np.ndarray): True for the filled positions
+        """
+        self.trackable_objects = trackable_objects
+        self.frames = frames
+        # Smoothed position (m)
+        self.x = quantities["x"]
+        self.y = quantities["y"]
+        # Velocity (m/s)
+        self.vx = quantities["vx"]
+        self.vy = quantities["vy"]
+        self.speed = quantities["speed"]
+        # Derivative of the speed (m/s²)
+        self.acceleration = quantities["acceleration"]
+        # Angle of the velocity with the x axis, in (-pi, pi] (rad)
+        self.heading = quantities["heading"]
+        self.step = step
+        self.interpolated = interpolated
+
+    @classmethod
+    def from_tracking(
+        cls,
+        tracking,
+        smoothing: int = 2,
+        max_gap: int = 10,
+        frame_rate: float = FRAME_RATE,
+        row_start: int = None,
+        row_end: int = None,
+    ):
+        """
+        Compute the kinematics of every tracked object of a TrackingStore, in all
+        its frames or in a range of rows. A range is computed with the rows around
+        it that can change its values, the values are the same as the ones of the
+        whole match.
+
+        The arrays hold 8 bytes by object and by frame each: about 110 MB are kept
+        for a whole match of 30 objects and 57 000 frames, and about twice as much
+        is used during the computation. A corner kick window only costs a few MB.
+
+        Args:
+            tracking (TrackingStore): tracking data of the match or of some frames
+            smoothing (int): half width of the moving average of the positions and
+                of the speeds, in frames, no smoothing if 0
+            max_gap (int): maximum number of consecutive missing frames to fill and
+                to derive across, no limit if None
+            frame_rate (float): number of frames per second
+            row_start (int): first row, the first row of the tracking data if None
+            row_end (int): row after the last one, the end of the tracking data if None
+        """
+        n_rows = len(tracking)
+        row_start = 0 if row_start is None else row_start
+        row_end = n_rows if row_end is None else row_end
+        # A gap filled, then the smoothing and the derivatives of the positions
+        # and of the speeds reach this number of rows
+        margin = n_rows if max_gap is None else max_gap + 2 * smoothing + 4
+        context_start = max(row_start - margin, 0)
+        context_end = min(row_end + margin, n_rows)
+        offsets = tracking.offsets[context_start : context_end + 1]
+        entries = slice(int(offsets[0]), int(offsets[-1]))
+        n_rows = context_end - context_start
+
+        trackable_object = tracking.trackable_object[entries]
+        objects = np.unique(trackable_object)
+        objects = objects[objects != -1]
+
+        # One row by object and one column by frame
+        index = np.searchsorted(objects, trackable_object)
+        is_known = trackable_object != -1
+        entry_rows = np.repeat(np.arange(n_rows), np.diff(offsets))
+        x = np.full((len(objects), n_rows), np.nan)
+        y = np.full((len(objects), n_rows), np.nan)
+        cells = (index[is_known], entry_rows[is_known])
+        x[cells] = tracking.x[entries][is_known]
+        y[cells] = tracking.y[entries][is_known]
+        y[np.isnan(x)] = np.nan
+
+        frames = np.asarray(tracking.frames[context_start:context_end], dtype=np.int64)
+        interpolated = _fill_gaps(x, y, frames, max_gap)
+        first, last = _segments(~np.isnan(x), frames, max_gap)
+        x = _smooth(x, first, last, smoothing)
+        y = _smooth(y, first, last, smoothing)
+
+        times = frames / frame_rate
+        vx = _derivative(x, times, first, last)
+        vy = _derivative(y, times, first, last)
+        speed = np.hypot(vx, vy)
+        smoothed_speed = _smooth(speed, first, last, smoothing)
+        acceleration = _derivative(smoothed_speed, times, first, last)
+
+        step = np.zeros_like(x)
+        step[:, 1:] = np.hypot(np.diff(x, axis=1), np.diff(y, axis=1))
+        step[first == np.arange(n_rows)] = 0
+        step[np.isnan(step)] = 0
+
+        quantities = {
+            "x": x,
+            "y": y,
+            "vx": vx,
+            "vy": vy,
+            "speed": speed,
+            "acceleration": acceleration,
+            "heading": np.arctan2(vy, vx),
+        }
+        kinematics = cls(objects, frames, quantities, step, interpolated)
+        if context_start == row_start and context_end == row_end:
+            return kinematics
+        return kinematics.window(row_start - context_start, row_end - context_start)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __repr__(self) -> str:
+        return f"Kinematics({len(self.trackable_objects)} objects, {len(self)} frames)"
+
+    def window(self, row_start: int, row_end: int):
+        """
+        Kinematics of the frames of a range of rows, as views on the arrays. The
+        distance is counted from the first frame of the window.
+
+        Args:
+            row_start (int): first row
+            row_end (int): row after the last one
+
+        Returns:
+            Kinematics
+        """
+        rows = slice(row_start, row_end)
+        step = self.step[:, rows].copy()
+        step[:, :1] = 0
+        return Kinematics(
+            self.trackable_objects,
+            self.frames[rows],
+            {name: getattr(self, name)[:, rows] for name in self.QUANTITIES},
+            step,
+            self.interpolated[:, rows],
+        )
+
+    @property
+    def distance(self) -> np.ndarray:
+        """Distance covered since the first frame (m)"""
+        return np.cumsum(self.step, axis=1)
+
+    @property
+    def distance_covered(self) -> pd.Series:
+        """Distance covered in all the frames by trackable_object (m)"""
+        return pd.Series(
+            self.step.sum(axis=1), index=self.trackable_objects, name="distance"
+        )
+
+    def object_index(self, trackable_object: int) -> int:
+        """
+        Row of an object in the arrays
+
+        Raises:
+            KeyError: if the object is never tracked
+        """
+        index = int(np.searchsorted(self.trackable_objects, trackable_object))
+        if (
+            index == len(self.trackable_objects)
+            or self.trackable_objects[index] != trackable_object
+        ):
+            raise KeyError(trackable_object)
+        return index
+
+    def to_dataframe(self, trackable_objects: list = None) -> pd.DataFrame:
+        """
+        Kinematics in a long format
+
+        Args:
+            trackable_objects (list): objects to give, all the objects if None
+
+        Returns:
+            pandas.DataFrame with the columns trackable_object, frame, x, y, vx, vy,
+            speed, acceleration, heading, distance and interpolated, without the
+            frames where the position is unknown
+        """
+        if trackable_objects is None:
+            indices = np.arange(len(self.trackable_objects))
+        else:
+            indices = np.array([self.object_index(obj) for obj in trackable_objects])
+        indices = indices.astype(np.int64)
+        is_known = ~np.isnan(self.x[indices])
+        rows, columns = np.nonzero(is_known)
+        objects = indices[rows]
+        data = {
+            "trackable_object": self.trackable_objects[objects].astype(np.int64),
+            "frame": self.frames[columns],
+        }
+        for name in self.QUANTITIES:
+            data[name] = getattr(self, name)[objects, columns]
+        data["distance"] = self.distance[objects, columns]
+        data["interpolated"] = self.interpolated[objects, columns]
+        return pd.DataFrame(data)
@@ -0,0 +1,331 @@
+"""
+Define the class LiveCornerDetector
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The frames of a live tracking feed are given one by one or by small batches.
+The conditions on the players (B and C) only need the frame itself, while the
+condition on the ball (A) needs the interpolated ball of the frames around it when
+the ball is not visible: these frames wait for the next ones, at most
+ball_window + max_ball_gap frames. The results are the same as the ones of
+CornerKickFinder on the whole match.
+
+Replay of a saved match (from the root of the repository):
+    python -m code.live_detector 2068 --rate 10
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from code import conditions
+from code.corner_kicks_finder import CornerKickFinder
+from code.match_toolbox import Match
+from code.tracking_store import TrackingStore, iter_frames
+
+
+class LiveCornerDetector:
+    """
+    Define the class LiveCornerDetector finding the starting frame of potentiel
+    corner kicks situations while the frames of a match arrive
+    """
+
+    def __init__(self, match_data: dict, match_id: int = None, **config):
+        """
+        Args:
+            match_data (dict): content of match_data.json, known before the match
+            match_id (int): identifier of the match, the id of match_data if None
+            config: thresholds of the conditions replacing the ones of DEFAULT_CONFIG
+        """
+        match = Match(match_data.get("id") if match_id is None else match_id)
+        match.set_match_data(match_data)
+        self.finder = CornerKickFinder(
+            match.match_id, store_path=None, match=match, **config
+        )
+        self.config = self.finder.config
+        window = self.config["ball_window"]
+        max_gap = self.config["max_ball_gap"]
+
+        # Maximum number of frames between a frame and its decision
+        self.max_delay = window + max_gap
+
+        # Ball of the last frames received: the rows of the current gap without the
+        # ball wait for the next visible ball to be interpolated, the gap is
+        # forgotten when it is longer than max_ball_gap
+        self._n_rows = 0
+        self._last_visible = None  # (row, x, y) of the last visible ball
+        self._gap = deque(maxlen=max_gap + 1)
+        self._gap_too_long = False
+        self._last_true_row = None  # last row with the ball in a corner coin
+
+        # Frames meeting the conditions on the players, by order of arrival,
+        # as [row, frame, time, decision] with decision None while it is unknown.
+        # A decision is known after max_delay frames, which bounds its length.
+        self._pending = deque()
+        self._last_candidate = None
+        self.events = []
+
+    def push(self, frame: dict) -> list:
+        """
+        Give one frame of the feed
+
+        Args:
+            frame (dict): a frame of structured_data.json
+
+        Returns:
+            list: potentiel corner kicks found, see push_frames
+        """
+        return self.push_frames([frame])
+
+    def push_frames(self, frames: list) -> list:
+        """
+        Give the next frames of the feed
+
+        Args:
+            frames (list): consecutive frames of structured_data.json
+
+        Returns:
+            list: potentiel corner kicks found, dict with the frame and the time of
+            the beginning of the situation and the frame received when it was found
+        """
+        if len(frames) == 0:
+            return []
+        tracking = TrackingStore.from_frames(frames)
+        is_eligible, condition_on_players_coordinates = self.finder._frame_conditions(
+            tracking
+        )
+        x, y, z = tracking.object_track(self.finder.match.id_ball)
+        ball_in_corner = self.finder._is_in_corner_coins(x, y)
+        ball_low_in_corner = conditions.ball_low_in_corner(
+            ball_in_corner, z, self.config["max_ball_height"]
+        )
+
+        for i, frame_id in enumerate(tracking.frames):
+            row = self._n_rows
+            is_visible = not np.isnan(x[i])
+            true_rows = self._add_ball(row, is_visible, x[i], y[i], ball_in_corner[i])
+
+            if is_eligible[i]:
+                if condition_on_players_coordinates[i]:
+                    decision = True
+                elif is_visible:
+                    decision = bool(ball_low_in_corner[i])
+                elif (
+                    self._last_true_row is not None
+                    and self._last_true_row >= row - self.config["ball_window"]
+                ):
+                    decision = True
+                else:
+                    decision = None
+                self._pending.append([row, int(frame_id), tracking.time[i], decision])
+
+            self._decide(true_rows)
+        return self._emit(int(tracking.frames[-1]))
+
+    def flush(self) -> list:
+        """
+        End of the feed: the frames waiting for the next ones are decided
+
+        Returns:
+            list: potentiel corner kicks found, see push_frames
+        """
+        self._gap.clear()
+        self._decide([], is_over=True)
+        last_frame = self._pending[-1][1] if self._pending else None
+        return self._emit(last_frame)
+
+    def _add_ball(
+        self, row: int, is_visible: bool, x: float, y: float, in_corner: bool
+    ) -> list:
+        """
+        Add the ball of a new frame and fill the gap before it when it is visible,
+        like Match.get_ball_track does on the whole match
+
+        Returns:
+            list: rows where the ball is now known to be in a corner coin
+        """
+        self._n_rows += 1
+        true_rows = []
+
+        if is_visible:
+            if self._gap:
+                # Linear interpolation between the last visible ball and this one
+                last_row, last_x, last_y = self._last_visible
+                rows = np.array(self._gap)
+                gap_x = np.interp(rows, [last_row, row], [last_x, x])
+                gap_y = np.interp(rows, [last_row, row], [last_y, y])
+                true_rows.extend(
+                    rows[self.finder._is_in_corner_coins(gap_x, gap_y)].tolist()
+                )
+                self._gap.clear()
+            if in_corner:
+                true_rows.append(row)
+            self._last_visible = (row, x, y)
+            self._gap_too_long = False
+
+        elif self._last_visible is not None and not self._gap_too_long:
+            # The gap is interpolated only after a visible ball
+            # and if it is not longer than max_ball_gap
+            self._gap.append(row)
+            if len(self._gap) > self.config["max_ball_gap"]:
+                self._gap.clear()
+                self._gap_too_long = True
+
+        if true_rows:
+            self._last_true_row = true_rows[-1]
+        return true_rows
+
+    def _decide(self, true_rows: list, is_over: bool = False):
+        """
+        Decide the condition A for the frames waiting for the ball around them
+
+        Args:
+            true_rows (list): rows where the ball has just been found in a corner coin
+            is_over (bool): True when no other frame will come
+        """
+        window = self.config["ball_window"]
+        # The ball is known in all the rows before this one
+        known_until = self._gap[0] if self._gap else self._n_rows
+        for pending in self._pending:
+            if pending[3] is not None:
+                continue
+            row = pending[0]
+            if any(row - window <= true_row < row + window for true_row in true_rows):
+                pending[3] = True
+            elif is_over or row + window <= known_until:
+                pending[3] = False
+
+    def _emit(self, last_frame: int) -> list:
+        """
+        Remove the decided frames in their order of arrival and keep the
+        beginnings of new situations, the same way CornerKickFinder does
+
+        Args:
+            last_frame (int): frame received last
+
+        Returns:
+            list: potentiel corner kicks found
+        """
+        events = []
+        while self._pending and self._pending[0][3] is not None:
+            _, frame_id, frame_time, decision = self._pending.popleft()
+            if not decision:
+                continue
+            if (
+                self._last_candidate is not None
+                and frame_id - self._last_candidate
+                > self.config["min_frames_between"]
+            ):
+                events.append(
+                    {"frame": frame_id, "time": frame_time, "detected_at": last_frame}
+                )
+            self._last_candidate = frame_id
+        self.events.extend(events)
+        return events
+
+
+def replay(
+    match_id: int,
+    data_dir: str = "data/matches",
+    rate: float = 10.0,
+    batch_size: int = 1,
+    **config,
+) -> tuple:
+    """
+    Give the frames of a saved match to a LiveCornerDetector as a live feed would
+
+    Args:
+        match_id (int): identifier of the match
+        data_dir (str): folder with one folder by match
+        rate (float): number of frames sent by second, as fast as possible if None
+        batch_size (int): number of frames sent together
+        config: thresholds of the conditions replacing the ones of DEFAULT_CONFIG
+
+    Returns:
+        df_events : pandas.DataFrame with the columns frame, time, detected_at and
+            delay (number of frames between the frame and its detection)
+        latencies : np.ndarray, seconds between the arrival of each batch and the end
+            of its processing
+    """
+    with open(
+        os.path.join(data_dir, str(match_id), "match_data.json"), "r", encoding="utf-8"
+    ) as file:
+        match_data = json.load(file)
+    detector = LiveCornerDetector(match_data, match_id=match_id, **config)
+
+    latencies = []
+    batch = []
+    start = time.perf_counter()
+    n_frames = 0
+    frames = iter_frames(os.path.join(data_dir, str(match_id), "structured_data.json"))
+    for frame in frames:
+        batch.append(frame)
+        n_frames += 1
+        if len(batch) < batch_size:
+            continue
+        if rate:
+            # The batch arrives when its last frame is sent
+            arrival = start + n_frames / rate
+            time.sleep(max(arrival - time.perf_counter(), 0))
+        else:
+            arrival = time.perf_counter()
+        detector.push_frames(batch)
+        latencies.append(time.perf_counter() - arrival)
+        batch = []
+    if batch:
+        arrival = time.perf_counter()
+        detector.push_frames(batch)
+        latencies.append(time.perf_counter() - arrival)
+    detector.flush()
+
+    df_events = pd.DataFrame(
+        detector.events, columns=["frame", "time", "detected_at"]
+    )
+    df_events["delay"] = df_events["detected_at"] - df_events["frame"]
+    return df_events, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a saved match as a live feed and detect the corner kicks"
+    )
+    parser.add_argument("match_id", type=int, help="identifier of the match")
+    parser.add_argument(
+        "--data-dir", default="data/matches", help="folder with one folder by match"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=10.0,
+        help="frames sent by second, 0 to send them as fast as possible",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="number of frames sent together"
+    )
+    args = parser.parse_args()
+
+    df_events, latencies = replay(
+        args.match_id,
+        data_dir=args.data_dir,
+        rate=args.rate or None,
+        batch_size=args.batch_size,
+    )
+    print(df_events.to_string(index=False))
+    print(
+        f"{len(df_events)} potentiel corner kicks, "
+        f"detected {df_events['delay'].max() if len(df_events) else 0} frames "
+        f"after their beginning at most"
+    )
+    latencies = latencies * 1000
+    print(
+        f"latency by batch of {args.batch_size} frames (ms) : "
+        f"p50 {np.percentile(latencies, 50):.3f} - "
+        f"p99 {np.percentile(latencies, 99):.3f} - max {latencies.max():.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,30 @@
 Define the class Match
 Author : Chloe Gobe
 Date : 20.05.2023
+
+The loading, the access to the frames and the information used by the detection
+only need NumPy and pandas. Matplotlib, IPython and the drawing modules (pitch,
+gif_renderer) are imported on the first call of plot_frame or draw_gif_actions,
+so that the batch workers do not load them.
 """
 
 import json
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-import imageio
 import os
-import matplotlib.pyplot as plt
-from IPython.display import display, Image
-from code.pitch import plot_pitch
+from code.archive import TrackingArchive
+from code.cache import load_match, save_match
+from code.frame import Frame
+from code.interpolation import interpolate_gaps
+from code.kinematics import Kinematics
+from code.profiling import profiled
+from code.regions import SIDES, SpatialIndex, pitch_regions
+from code.tracking_store import GROUP_CODES, GROUP_NAMES, TrackingStore
+
+# Number of frames of the parts of the trajectories interpolated and cached together
+TRACK_CHUNK_SIZE = 1000
 
-def extract_values(row):
-    return pd.Series(row['data'])
 
 class Match:
     """
@@ -22,32 +33,122 @@ class Match:
     and information to analyze the games
     """
 
-    def __init__(self, match_id: int):
+    def __init__(
+        self,
+        match_id: int,
+        data_dir: str = "data/matches",
+        cache_dir: str = "data/cache",
+        archive=None,
+    ):
+        """
+        Args:
+            match_id (int): identifier of the match
+            data_dir (str): folder with one folder by match holding match_data.json
+                and structured_data.json
+            cache_dir (str): folder of the binary cache of the parsed matches,
+                no cache if None
+            archive (TrackingArchive or str): archive holding the match, or its
+                folder, read instead of the files of the match if given and if
+                they did not change since the match was archived
+        """
         self.match_id = match_id
+        if isinstance(archive, str):
+            archive = TrackingArchive(archive)
+        self.archive = archive
+        self.match_data_path = os.path.join(data_dir, str(match_id), "match_data.json")
+        self.tracking_data_path = os.path.join(
+            data_dir, str(match_id), "structured_data.json"
+        )
+        self.cache_dir = (
+            None if cache_dir is None else os.path.join(cache_dir, str(match_id))
+        )
         self.match_data = None
         self.df_tracking = None
+        self.tracking = None
         self.teams = None
         self.df_teams = None
         self.df_players = None
         self.pitch_size = (None, None)
+        self.regions = None
         self.id_referee = None
         self.id_ball = None
-
+        # Lookup tables by tracked object, see _build_lookup_tables
+        self.team_keys = None
+        self.team_ids = None
+        self.team_short_names = None
+        self.team_jersey_colors = None
+        self.entry_team = None
+        self.object_team = None
+        self.object_number = None
+        self.object_first_name = None
+        self.object_last_name = None
+        self.object_jersey_color = None
+        self.object_is_ball = None
+        self.object_is_referee = None
+        self._ball_tracks = {}
+        self._track_chunks = {}
+        self._spatial_indexes = {}
+        self._kinematics = {}
+
+    @profiled("Match.load_match_data")
     def _load_match_data(self):
-        with open(
-            f"data/matches/{self.match_id}/match_data.json", "r", encoding="utf-8"
-        ) as file:
+        with open(self.match_data_path, "r", encoding="utf-8") as file:
             self.match_data = json.load(file)
 
+    @profiled("Match.load_tracking_data")
     def _load_tracking_data(self):
-        self.df_tracking = pd.read_json(
-            f"data/matches/{self.match_id}/structured_data.json"
-        )
-        default_value = (
-            {"y": None, "x": None, "trackable_object": None, "track_id": None},
+        # The file is read as a stream, directly into the arrays of the store
+        self.tracking = TrackingStore.from_file(self.tracking_data_path)
+
+    @profiled("Match.load_cache")
+    def _load_cache(self) -> bool:
+        """Load the parsed data from the cache, return False if it is missing or stale"""
+        if self.cache_dir is None:
+            return False
+        cached = load_match(
+            self.cache_dir, [self.match_data_path, self.tracking_data_path]
         )
-        self.df_tracking["data"] = self.df_tracking["data"].apply(
-            lambda x: default_value if x == [] else x
+        if cached is None:
+            return False
+        self.match_data, self.tracking = cached
+        return True
+
+    @profiled("Match.load_archive")
+    def _load_archive(self) -> bool:
+        """Load the match from the archive, return False if there is no archive, if
+        the match is not in it or if its source files changed since it was archived"""
+        if (
+            self.archive is None
+            or self.match_id not in self.archive
+            or not self.archive.is_up_to_date(
+                self.match_id, [self.match_data_path, self.tracking_data_path]
+            )
+        ):
+            return False
+        self.match_data = self.archive.match_data(self.match_id)
+        self.tracking = self.archive.tracking(self.match_id)
+        return True
+
+    @profiled("Match.save_cache")
+    def _save_cache(self):
+        if self.cache_dir is not None:
+            save_match(
+                self.cache_dir,
+                [self.match_data_path, self.tracking_data_path],
+                self.match_data,
+                self.tracking,
+            )
+
+    @profiled("Match.get_frames_info")
+    def _get_frames_info(self):
+        self.df_tracking = pd.DataFrame(
+            {
+                "frame": self.tracking.frames,
+                "time": self.tracking.time,
+                "period": np.where(
+                    self.tracking.period == -1, np.nan, self.tracking.period
+                ),
+            }
         )
 
     def _get_team_info(self):
@@ -77,56 +178,471 @@ class Match:
             self.match_data["pitch_length"],
             self.match_data["pitch_width"],
         )
+        self.regions = pitch_regions(self.pitch_size)
 
+    @profiled("Match.gather_information")
     def gather_information(self):
         """
         Use all the methods to collect information about the game
         and load it into the object
         """
-        self._load_match_data()
-        self._load_tracking_data()
+        if not self._load_archive() and not self._load_cache():
+            self._load_match_data()
+            self._load_tracking_data()
+            self._save_cache()
+        self._get_frames_info()
+        self.set_match_data(self.match_data)
+
+    @profiled("Match.set_match_data")
+    def set_match_data(self, match_data: dict):
+        """
+        Collect the information about the teams, the players, the referees, the ball
+        and the pitch from the content of match_data.json. Used alone when the
+        tracking data is not in a file, like for a live feed.
+
+        Args:
+            match_data (dict): content of match_data.json
+        """
+        self.match_data = match_data
         self._get_team_info()
         self._get_players_info()
         self._get_referees_id()
         self._get_ball_id()
         self._get_pitch_dimensions()
+        self._build_lookup_tables()
+
+    def _build_lookup_tables(self):
+        """
+        Build once the tables giving the information of a tracked object from its
+        trackable_object, instead of merging the players and the teams in each frame.
+        The teams are indexed by 0 for the home team and 1 for the away team.
+        The row of an object in the object_* tables is given by _object_rows.
+        """
+        self.team_keys = self.df_teams["team"].to_numpy()
+        self.team_ids = self.df_teams["team_id"].to_numpy()
+        self.team_short_names = self.df_teams["short_name"].to_numpy()
+        self.team_jersey_colors = self.df_teams["jersey_color"].to_numpy()
+        teams = {team_id: index for index, team_id in enumerate(self.team_ids)}
+
+        # One row by trackable_object, the first one for the entries without
+        # trackable_object and the last one for the objects missing from match_data
+        known_objects = [
+            *self.df_players["trackable_object"],
+            *self.id_referee,
+            self.id_ball,
+        ]
+        size = max(known_objects, default=-1) + 3
+        self.object_team = np.full(size, -1, dtype=np.int8)
+        self.object_number = np.full(size, np.nan)
+        self.object_first_name = np.full(size, np.nan, dtype=object)
+        self.object_last_name = np.full(size, np.nan, dtype=object)
+        self.object_jersey_color = np.full(size, "grey", dtype=object)
+        self.object_is_ball = np.zeros(size, dtype=bool)
+        self.object_is_referee = np.zeros(size, dtype=bool)
+
+        rows = self.df_players["trackable_object"].to_numpy() + 1
+        team = np.array(
+            [teams.get(team_id, -1) for team_id in self.df_players["team_id"]],
+            dtype=np.int8,
+        )
+        self.object_team[rows] = team
+        self.object_number[rows] = self.df_players["number"]
+        self.object_first_name[rows] = self.df_players["first_name"]
+        self.object_last_name[rows] = self.df_players["last_name"]
+        has_team = team >= 0
+        self.object_jersey_color[rows[has_team]] = self.team_jersey_colors[
+            team[has_team]
+        ]
+        self.object_is_referee[np.asarray(self.id_referee, dtype=np.int64) + 1] = True
+        self.object_is_ball[self.id_ball + 1] = True
+
+        # Team of an entry by trackable_object and group_name: the team of the
+        # player, else the team given by the group_name, -1 for what is not a player
+        group_team = np.full(len(GROUP_NAMES) + 1, -1, dtype=np.int8)
+        for group in ("home team", "away team"):
+            group_team[GROUP_CODES[group]] = teams.get(
+                self.teams[group.replace(" ", "_")]["team_id"], -1
+            )
+        self.entry_team = np.tile(group_team, (size, 1))
+        self.entry_team[rows] = team[:, None]
+        self.entry_team[0] = -1
+        self.entry_team[self.object_is_ball | self.object_is_referee] = -1
+        self.entry_team[:, GROUP_CODES["referee"]] = -1
+
+    def _object_rows(self, trackable_object: np.ndarray) -> np.ndarray:
+        """
+        Give the rows of the object_* tables of some tracked objects
+
+        Args:
+            trackable_object (np.ndarray): trackable_object of the entries, -1 if unknown
+
+        Returns:
+            np.ndarray: trackable_object + 1, the last row for the objects missing
+            from match_data.json
+        """
+        return np.clip(trackable_object + 1, 0, len(self.object_team) - 1)
+
+    def team_of_entries(
+        self, trackable_object: np.ndarray, group: np.ndarray
+    ) -> np.ndarray:
+        """
+        Give the team of tracking entries: first from the player, then from the
+        group_name. The ball, the referees and the objects without team are -1.
+
+        Args:
+            trackable_object (np.ndarray): trackable_object of the entries, -1 if unknown
+            group (np.ndarray): code of the group_name of the entries, see GROUP_CODES
+
+        Returns:
+            np.ndarray: 0 for the home team, 1 for the away team, -1 otherwise
+        """
+        return self.entry_team[self._object_rows(trackable_object), group]
 
 
     # _________________________________________________________________
 
-    def _is_in_boxes(self, x:float, y:float) ->bool:
+    @profiled("Match.count_players_in_box")
+    def count_players_in_box(self, frame_id: int) -> tuple:
         """
-        Check how many players in the box
+        Count the players of each team in the boxes
 
         Args:
-            x (float): _description_
-            y (float): _description_
+            frame_id (int): identifier of a frame
 
         Returns:
-            bool: _description_
-        """
-        length, _ = self.pitch_size
-        area_width = 44 * 0.9144
-        area_length = 18 * 0.9144
-        condition_y = -area_width/2 < y < area_width/2
-        condition_x_left = -length/2 < x < -length/2 + area_length
-        condition_x_right = length/2 > x > length/2 - area_length
-        return condition_y and (condition_x_right or condition_x_left)
-    
-
-    def count_players_in_box(self, frame_id:int)->tuple:
-        df_players, _, _ = self.get_coordinates_from_frame(frame_id)
-        df_players["in_box"] = df_players.apply(lambda x : self._is_in_boxes(x["x"], x["y"]), axis=1)
-        home_players = df_players[df_players["team"] == "home_team"]["in_box"].sum()
-        away_players = df_players[df_players["team"] == "away_team"]["in_box"].sum()
+            tuple: number of home players and of away players in one of the boxes
+        """
+        frame = self.get_frame(frame_id)
+        in_box = np.zeros(len(frame), dtype=bool)
+        for side in SIDES:
+            in_box |= self.regions[f"box_{side}"].contains(frame.x, frame.y)
+        home_players = np.sum(in_box & (frame.team == 0))
+        away_players = np.sum(in_box & (frame.team == 1))
         return home_players, away_players
 
+    @profiled("Match.box_occupancy")
+    def box_occupancy(self, corner_frames: list, window: int = 100) -> pd.DataFrame:
+        """
+        Count the players of each team in the boxes and in the six yards boxes in
+        every frame following the beginning of corner kicks, for all the corner
+        kicks at once
+
+        Args:
+            corner_frames (list): first frames of the corner kicks
+            window (int): number of frames counted from each first frame
+
+        Returns:
+            pandas.DataFrame indexed by corner (the first frame of the corner kick)
+            and frame_offset (the number of frames since it), with the columns
+            frame, home_box, away_box, home_six_yards_box and away_six_yards_box.
+            The frames missing from the tracking data are left out.
+        """
+        corner_frames = np.asarray(corner_frames, dtype=np.int64)
+        frame_offsets = np.arange(window)
+        frames = (corner_frames[:, None] + frame_offsets).ravel()
+        rows = self.tracking.rows(frames)
+        is_tracked = rows >= 0
+        rows = rows[is_tracked]
+
+        # Only the entries of the frames of the windows are counted
+        is_searched = np.zeros(len(self.tracking), dtype=bool)
+        is_searched[rows] = True
+        index = self.spatial_index()
+        team = self.team_of_entries(self.tracking.trackable_object, self.tracking.group)
+
+        df_occupancy = pd.DataFrame(
+            {
+                "corner": np.repeat(corner_frames, window)[is_tracked],
+                "frame_offset": np.tile(frame_offsets, len(corner_frames))[is_tracked],
+                "frame": frames[is_tracked],
+            }
+        )
+        for zone in ("box", "six_yards_box"):
+            for team_index, team_name in enumerate(("home", "away")):
+                is_team = team == team_index
+                counts = sum(
+                    index.count_by_frame(
+                        self.regions[f"{zone}_{side}"], is_team, is_searched
+                    )
+                    for side in SIDES
+                )
+                df_occupancy[f"{team_name}_{zone}"] = counts[rows]
+        return df_occupancy.set_index(["corner", "frame_offset"])
+
+    # ____________________WHOLE MATCH METHODS__________________________
+
+    @profiled("Match.get_ball_track")
+    def get_ball_track(self, max_gap: int = 100) -> pd.DataFrame:
+        """
+        Give the position of the ball in every frame of the match. When the ball
+        is not visible, its position is linearly interpolated between the frames
+        before and after the gap. Computed once for each max_gap.
+
+        Args:
+            max_gap (int): maximum number of consecutive frames without the ball to fill
+
+        Returns:
+            pandas.DataFrame with the columns frame, x, y, z (NaN when unknown) and
+            interpolated (True when the position comes from the interpolation)
+        """
+        if max_gap not in self._ball_tracks:
+            self._ball_tracks[max_gap] = self.object_track(self.id_ball, max_gap=max_gap)
+        return self._ball_tracks[max_gap]
+
+    @profiled("Match.object_track")
+    def object_track(
+        self,
+        trackable_object: int,
+        frame_start: int = None,
+        frame_end: int = None,
+        max_gap: int = 100,
+        method: str = "linear",
+    ) -> pd.DataFrame:
+        """
+        Give the position of a tracked object in every frame of a window, the gaps
+        where it is not visible being filled. The trajectory is interpolated and
+        cached by parts of TRACK_CHUNK_SIZE frames, only for the parts of the window:
+        the values are the same as the ones of the whole match.
+
+        Args:
+            trackable_object (int): identifier of the object
+            frame_start (int): first frame of the window, the beginning of the match if None
+            frame_end (int): last frame of the window, the end of the match if None
+            max_gap (int): maximum number of consecutive missing frames to fill,
+                no limit if None
+            method (str): "linear" or "spline", see interpolate_gaps
+
+        Returns:
+            pandas.DataFrame with the columns frame, x, y, z (NaN when unknown) and
+            interpolated (True when the position is imputed, False when observed)
+        """
+        row_start, row_end = self.tracking.rows_between(frame_start, frame_end)
+        first_chunk = row_start // TRACK_CHUNK_SIZE
+        chunks = [
+            self._track_chunk(trackable_object, chunk, max_gap, method)
+            for chunk in range(first_chunk, -(-row_end // TRACK_CHUNK_SIZE))
+        ]
+        if chunks:
+            positions = np.concatenate([chunk[0] for chunk in chunks])
+            is_interpolated = np.concatenate([chunk[1] for chunk in chunks])
+        else:
+            positions = np.empty((0, 3))
+            is_interpolated = np.empty(0, dtype=bool)
+        window = slice(
+            row_start - first_chunk * TRACK_CHUNK_SIZE,
+            row_end - first_chunk * TRACK_CHUNK_SIZE,
+        )
+        return pd.DataFrame(
+            {
+                "frame": self.tracking.frames[row_start:row_end],
+                "x": positions[window, 0],
+                "y": positions[window, 1],
+                "z": positions[window, 2],
+                "interpolated": is_interpolated[window],
+            }
+        )
+
+    def _track_chunk(
+        self, trackable_object: int, chunk: int, max_gap: int, method: str
+    ) -> tuple:
+        """
+        Interpolate the trajectory of an object in the rows of a chunk, with the
+        frames around it that can bound a gap of max_gap frames. Computed once.
+
+        Returns:
+            positions : np.ndarray of shape (n_rows, 3), the x, y and z by row
+            is_interpolated : np.ndarray of bool
+        """
+        key = (trackable_object, chunk, max_gap, method)
+        if key not in self._track_chunks:
+            n_rows = len(self.tracking)
+            row_start = chunk * TRACK_CHUNK_SIZE
+            row_end = min(row_start + TRACK_CHUNK_SIZE, n_rows)
+            # The spline also uses the frames next to the known ends of the gaps
+            margin = n_rows if max_gap is None else max_gap + 2
+            context_start = max(row_start - margin, 0)
+            context_end = min(row_end + margin, n_rows)
+            x, y, z = self.tracking.object_track(
+                trackable_object, context_start, context_end
+            )
+            positions, is_interpolated = interpolate_gaps(
+                np.column_stack([x, y, z]), max_gap, method
+            )
+            inside = slice(row_start - context_start, row_end - context_start)
+            self._track_chunks[key] = (positions[inside], is_interpolated[inside])
+        return self._track_chunks[key]
+
+    @profiled("Match.tracks")
+    def tracks(
+        self,
+        frame_start: int,
+        frame_end: int,
+        max_gap: int = 100,
+        method: str = "linear",
+        trackable_objects: list = None,
+    ) -> pd.DataFrame:
+        """
+        Give the gap-filled positions of the tracked objects in a window, see
+        object_track
+
+        Args:
+            frame_start (int): first frame of the window
+            frame_end (int): last frame of the window
+            max_gap (int): maximum number of consecutive missing frames to fill,
+                no limit if None
+            method (str): "linear" or "spline", see interpolate_gaps
+            trackable_objects (list): objects to give, the objects seen in the
+                window or close enough to be interpolated in it if None
+
+        Returns:
+            pandas.DataFrame with the columns trackable_object, frame, x, y, z and
+            interpolated, without the frames where the position is unknown
+        """
+        if trackable_objects is None:
+            row_start, row_end = self.tracking.rows_between(frame_start, frame_end)
+            margin = len(self.tracking) if max_gap is None else max_gap
+            entries = slice(
+                self.tracking.offsets[max(row_start - margin, 0)],
+                self.tracking.offsets[min(row_end + margin, len(self.tracking))],
+            )
+            trackable_objects = np.unique(self.tracking.trackable_object[entries])
+            trackable_objects = trackable_objects[trackable_objects != -1]
+
+        df_tracks = [
+            self.object_track(
+                trackable_object, frame_start, frame_end, max_gap, method
+            ).assign(trackable_object=trackable_object)
+            for trackable_object in trackable_objects
+        ]
+        columns = ["trackable_object", "frame", "x", "y", "z", "interpolated"]
+        if not df_tracks:
+            return pd.DataFrame(columns=columns)
+        df_tracks = pd.concat(df_tracks, ignore_index=True)[columns]
+        return df_tracks[~df_tracks["x"].isna()].reset_index(drop=True)
+
+    @profiled("Match.spatial_index")
+    def spatial_index(self, cell_size: float = 5.0) -> SpatialIndex:
+        """
+        Index the tracking entries of the whole match in a grid to find the entries
+        in the regions of the pitch. Computed once for each cell_size.
+
+        Args:
+            cell_size (float): side of the cells of the grid (m)
+
+        Returns:
+            SpatialIndex
+        """
+        if cell_size not in self._spatial_indexes:
+            length, width = self.pitch_size
+            # The grid covers the pitch and 10 m around it
+            self._spatial_indexes[cell_size] = SpatialIndex.from_tracking(
+                self.tracking,
+                cell_size=cell_size,
+                extent=(
+                    -length / 2 - 10,
+                    length / 2 + 10,
+                    -width / 2 - 10,
+                    width / 2 + 10,
+                ),
+            )
+        return self._spatial_indexes[cell_size]
+
+    @profiled("Match.trajectories")
+    def trajectories(self, frame_start: int, frame_end: int) -> dict:
+        """
+        Give the positions of every tracked object in a window of frames, with a
+        cost proportional to the size of the window
+
+        Args:
+            frame_start (int): first frame of the window
+            frame_end (int): last frame of the window (included)
+
+        Returns:
+            dict: (x, y) arrays of the positions by trackable_object, in the order
+            of the frames, without the entries with an unknown trackable_object
+        """
+        row_start, row_end = self.tracking.rows_between(frame_start, frame_end)
+        entries = slice(self.tracking.offsets[row_start], self.tracking.offsets[row_end])
+        trackable_object = self.tracking.trackable_object[entries]
+
+        # The entries of each object are contiguous once sorted by object
+        order = np.argsort(trackable_object, kind="stable")
+        objects, starts = np.unique(trackable_object[order], return_index=True)
+        x = np.split(self.tracking.x[entries][order], starts[1:])
+        y = np.split(self.tracking.y[entries][order], starts[1:])
+        return {
+            int(trackable_object): (x[i], y[i])
+            for i, trackable_object in enumerate(objects)
+            if trackable_object != -1
+        }
+
+    @profiled("Match.kinematics")
+    def kinematics(
+        self,
+        frame_start: int = None,
+        frame_end: int = None,
+        smoothing: int = 2,
+        max_gap: int = 10,
+    ) -> Kinematics:
+        """
+        Give the smoothed position, the velocity, the speed, the acceleration, the
+        heading and the distance covered of every tracked object in a window of
+        frames. The kinematics of the whole match are computed once and cached for
+        each smoothing and max_gap, a window is a view on them if they are cached,
+        otherwise only the rows of the window and around it are computed. Both give
+        the same values.
+
+        Args:
+            frame_start (int): first frame of the window, the beginning of the match if None
+            frame_end (int): last frame of the window (included), the end of the match if None
+            smoothing (int): half width of the moving average of the positions and
+                of the speeds, in frames, no smoothing if 0
+            max_gap (int): maximum number of consecutive missing frames to fill and
+                to derive across, no limit if None
+
+        Returns:
+            Kinematics
+        """
+        key = (smoothing, max_gap)
+        if frame_start is None and frame_end is None:
+            if key not in self._kinematics:
+                self._kinematics[key] = Kinematics.from_tracking(
+                    self.tracking, smoothing=smoothing, max_gap=max_gap
+                )
+            return self._kinematics[key]
+
+        row_start, row_end = self.tracking.rows_between(frame_start, frame_end)
+        if key in self._kinematics:
+            return self._kinematics[key].window(row_start, row_end)
+        return Kinematics.from_tracking(
+            self.tracking,
+            smoothing=smoothing,
+            max_gap=max_gap,
+            row_start=row_start,
+            row_end=row_end,
+        )
+
     # ____________________FRAME SPECIFIC METHODS_______________________
 
+    def get_frame(self, frame_id: int) -> Frame:
+        """
+        Give the tracked objects of a frame as views on the tracking arrays,
+        without building a DataFrame
+
+        Args:
+            frame_id (int): identifier of a frame
+
+        Returns:
+            Frame
+        """
+        return Frame(self, frame_id)
+
+    @profiled("Match.get_coordinates_from_frame")
     def get_coordinates_from_frame(self, frame_id: int):
         """
         From a given frame, take all the positions of the players,
-        the referee, the ball and give the time.
+        the referee, the ball and give the time. Kept for the notebooks,
+        get_frame is faster when the DataFrame is not needed.
 
         Args:
             frame_id (int): identifier of a frame
@@ -136,49 +652,57 @@ class Match:
             ball_coordinates : position (x,y) of the ball
             time : str giving the time
         """
-        # Take the tracking data that is available for the frame
-        frame_coordinates = self.df_tracking.loc[frame_id]["data"]
+        frame = self.get_frame(frame_id)
 
         # Ball
-        ball_coordinates = next(
-            (
-                position
-                for position in frame_coordinates
-                if position.get("trackable_object") == self.id_ball
-            ),
-            None,
-        )
-
-        # Players
-        player_coordinates = [
-            item
-            for item in frame_coordinates
-            if (
-                item.get("trackable_object") != self.id_ball
-                and item.get("trackable_object") is not None
-                and item.get("trackable_object") not in self.id_referee
-                and item.get("group_name") != "referee"
-            )
-        ]
-        df_player_coordinates = pd.DataFrame(player_coordinates)
-        # Get information regarding the team and the jersey colors
-        if len(player_coordinates) > 0:
-            df_player_coordinates = df_player_coordinates.merge(
-                self.df_players, how="left"
-            )
-            df_player_coordinates["team_id"] = df_player_coordinates.apply(
-                lambda x: self.teams.get(x["group_name"].replace(" ", "_"))["team_id"]
-                if pd.isna(x["team_id"])
-                else x["team_id"],
-                axis=1,
-            )
-            df_player_coordinates = df_player_coordinates.merge(
-                self.df_teams[["team", "short_name", "team_id", "jersey_color"]]
-            )
+        ball_coordinates = None
+        ball_index = frame.ball_index
+        if ball_index is not None:
+            ball_coordinates = {
+                "x": float(frame.x[ball_index]),
+                "y": float(frame.y[ball_index]),
+                "trackable_object": self.id_ball,
+                "track_id": int(frame.track_id[ball_index]),
+            }
+            if not np.isnan(frame.z[ball_index]):
+                ball_coordinates["z"] = float(frame.z[ball_index])
+
+        return frame.to_dataframe(), ball_coordinates, frame.time
+
+    def _get_frame_drawing(self, frame_id: int) -> dict:
+        """
+        Gather what is drawn for a frame: the positions of the ball and of the
+        players of each team, the colors and names of the teams and the time
 
-        time = self.df_tracking.loc[frame_id].time
-        return df_player_coordinates, ball_coordinates, time
+        Args:
+            frame_id (int): identifier of a frame
 
+        Returns:
+            dict, None if the frame is empty
+        """
+        frame = self.get_frame(frame_id)
+        if frame.n_players == 0:
+            return None
+
+        drawing = {"frame": frame_id, "time": frame.time, "ball": None}
+        ball = frame.ball
+        if ball is not None:
+            drawing["ball"] = ball[:2]
+
+        for team, side in enumerate(("home", "away")):
+            drawing[f"{side}_x"], drawing[f"{side}_y"] = frame.team_positions(team)
+            if len(drawing[f"{side}_x"]) > 0:
+                color = self.team_jersey_colors[team]
+                drawing[f"{side}_name"] = self.team_short_names[team]
+            else:
+                color = "black"
+                drawing[f"{side}_name"] = ""
+            drawing[f"{side}_color"] = color
+            # A white title would not be visible
+            drawing[f"{side}_title_color"] = "black" if color == "#ffffff" else color
+        return drawing
+
+    @profiled("Match.plot_frame")
     def plot_frame(self, frame_id: int, trajectories_from:int=None):
         """
         Plot a pitch with what it is visible on the frame
@@ -187,132 +711,113 @@ class Match:
             frame_id (int): identifier of a frame
             trajectories_from (int) : number of frames to take to draw the trajectories before the frame_id
         """
-        # Get the coordinates from the frame
-        df_player_coordinates, ball_coordinates, time = self.get_coordinates_from_frame(
-            frame_id
-        )
+        from matplotlib.collections import LineCollection
+        from code.pitch import plot_pitch, text_positions
 
-        # Draw the pitch
-        fig, ax = plot_pitch()
+        # Get what is visible on the frame
+        drawing = self._get_frame_drawing(frame_id)
+
+        # Draw the pitch, its lines are rendered once for all the frames
+        fig, ax = plot_pitch(field_dimen=self.pitch_size, cached=True)
+        x_clock, y_frame, y_title = text_positions(self.pitch_size)
 
         # If the frame is empty
-        if len(df_player_coordinates) == 0:
+        if drawing is None:
             print("The frame is empty")
             return None, None
 
         # Plot the ball if visible
-        if ball_coordinates is not None:
-            x_ball, y_ball = ball_coordinates["x"], ball_coordinates["y"]
+        if drawing["ball"] is not None:
+            x_ball, y_ball = drawing["ball"]
             ax.plot(x_ball, y_ball, marker="D", markersize=17, color="k", alpha=0.2)
 
         # Plot the home and away players'positions
-        home_team = df_player_coordinates[df_player_coordinates["team"] == "home_team"]
-        away_team = df_player_coordinates[df_player_coordinates["team"] == "away_team"]
-
-        if len(home_team) > 0:
-            home_color = home_team["jersey_color"].unique()[0]
-            home_team_name = home_team["short_name"].unique()[0]
-        else:
-            home_color = 'black'
-            home_team_name = ''
-        if len(away_team) > 0:
-            away_color = away_team["jersey_color"].unique()[0]
-            away_team_name = away_team["short_name"].unique()[0]
-        else:
-            away_color = 'black'
-            away_team_name = ''
-
-        ax.plot(home_team["x"], home_team["y"], "o", color=home_color, markersize=10)
-        ax.plot(away_team["x"], away_team["y"], "o", color=away_color, markersize=10)
+        for side in ("home", "away"):
+            ax.plot(
+                drawing[f"{side}_x"],
+                drawing[f"{side}_y"],
+                "o",
+                color=drawing[f"{side}_color"],
+                markersize=10,
+            )
 
         # Get a legend-title with the color of the teams
-        home_title_x = -len(home_team_name) * 2.5
-        away_title_x = 5
-        if home_color == "#ffffff":
-            home_color = "black"
-        if away_color == "#ffffff":
-            away_color = "black"
-
         ax.text(
-            home_title_x,
-            40,
-            home_team_name,
+            -len(drawing["home_name"]) * 2.5,
+            y_title,
+            drawing["home_name"],
             fontsize=18,
-            color=home_color,
+            color=drawing["home_title_color"],
             weight="black",
         )
-        ax.text(0.5, 40, " - ", fontsize=18, color="black", ha="center", weight="black")
         ax.text(
-            away_title_x,
-            40,
-            away_team_name,
+            0.5, y_title, " - ", fontsize=18, color="black", ha="center", weight="black"
+        )
+        ax.text(
+            5,
+            y_title,
+            drawing["away_name"],
             fontsize=18,
-            color=away_color,
+            color=drawing["away_title_color"],
             weight="black",
         )
 
         # Plot the time to have a clock displayed
-        ax.text(-55, 45, frame_id, fontsize=14, color="black", weight="black")
-        ax.text(-55, 40, time, fontsize=14, color="black", weight="black")
+        ax.text(x_clock, y_frame, frame_id, fontsize=14, color="black", weight="black")
+        ax.text(
+            x_clock, y_title, drawing["time"], fontsize=14, color="black", weight="black"
+        )
 
         if trajectories_from is not None:
-            # Get the data for the chosen interval
-            df_tracking_interval = self.df_tracking[["data", "frame"]].explode("data"
-                                                    ).loc[(frame_id-trajectories_from):frame_id]
-            df_tracking_interval = pd.concat([
-                df_tracking_interval.apply(extract_values, axis=1), 
-                df_tracking_interval[["frame"]]], axis=1)
-            
-            # Get the list of coordinates by object
-            df_tracking_interval = df_tracking_interval[
-                ["trackable_object", "x", "y"]].groupby("trackable_object").agg(list)
-            
-            # Get the information about the color
-            df_tracking_interval = df_tracking_interval.reset_index().merge(
-                                        self.df_players, how="left").merge(
-                                        self.df_teams, how='left')[
-                                            ["trackable_object", "x", "y", "jersey_color"]]
-            df_tracking_interval["jersey_color"] = df_tracking_interval["jersey_color"].fillna("grey")
-            for _, row in df_tracking_interval.iterrows():
-                ax.plot(row["x"], row["y"], color=row["jersey_color"], linewidth=2, linestyle="dotted")
+            # All the trajectories are drawn together, with the color of the team
+            trajectories = self.trajectories(frame_id - trajectories_from, frame_id)
+            colors = self.object_jersey_color[
+                self._object_rows(np.fromiter(trajectories, dtype=np.int64))
+            ]
+            ax.add_collection(
+                LineCollection(
+                    [np.column_stack(xy) for xy in trajectories.values()],
+                    colors=list(colors),
+                    linewidths=2,
+                    linestyles="dotted",
+                    capstyle="butt",
+                    joinstyle="round",
+                    zorder=2,
+                )
+            )
 
         return fig, ax
 
 
-    def draw_gif_actions(self, frame_start: int):
+    @profiled("Match.draw_gif_actions")
+    def draw_gif_actions(self, frame_start: int, workers: int = 1):
         """
         Draw and save a gif animtation of the action
 
         Args:
             frame_start (int): frame from the beginnon
+            workers (int): number of processes drawing the images
         """
-        count = 0
-        images = []
+        from IPython.display import display, Image
+        from code.gif_renderer import write_gif
 
         home = self.match_data["home_team"]["acronym"]
         away = self.match_data["away_team"]["acronym"]
+        path = f"gif/{home}-{away}_{frame_start}.gif"
 
         # First check if the gif has not yet drawn done, otherwise load the gif
-        if os.path.exists(f"gif/{home}-{away}_{frame_start}.gif"):
+        if os.path.exists(path):
             print(f"{self.match_id} : gif exists")
 
         else:
-            # Create the images every two frames
-            for frame in tqdm(range(frame_start, frame_start + 200, 2)):
-                # If the frame is empty
-                if len(self.get_coordinates_from_frame(frame)[0]) > 0:
-                    count += 1
-                    fig, ax = self.plot_frame(frame)
-                    plt.savefig(f"img/{count}.png")
-                    images.append(f"img/{count}.png")
-                    plt.close()
-
-            # Save the gif
-            with imageio.get_writer(
-                f"gif/{home}-{away}_{frame_start}.gif", mode="I"
-            ) as writer:
-                for filename in images:
-                    image = imageio.imread(filename)
-                    writer.append_data(image)
-
-        display(Image(filename=f"gif/{home}-{away}_{frame_start}.gif"))
+            # Get what is visible every two frames, without the empty frames
+            drawings = [
+                self._get_frame_drawing(frame)
+                for frame in tqdm(range(frame_start, frame_start + 200, 2))
+            ]
+            drawings = [drawing for drawing in drawings if drawing is not None]
+
+            # Draw the images and save the gif
+            write_gif(path, drawings, workers=workers, pitch_size=self.pitch_size)
+
+        display(Image(filename=path))
@@ -4,15 +4,24 @@ Function written by Laurie Shaw for Friends of Tracking
 
 # pitch.py
 
+from functools import lru_cache
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
 import numpy as np
-import sys
 
-sys.path.append("code")
+# Number of pitch variants kept in memory
+PITCH_CACHE_SIZE = 8
+BORDER_DIMEN = (3, 3)  # include a border arround of the field of width 3m
 
 
 def plot_pitch(
-    field_dimen=(106.0, 68.0), field_color="green", linewidth=2, markersize=20
+    field_dimen=(106.0, 68.0),
+    field_color="green",
+    linewidth=2,
+    markersize=20,
+    cached=False,
 ):
     """plot_pitch
 
@@ -24,6 +33,8 @@ def plot_pitch(
         field_color: color of field. options are {'green','white'}
         linewidth  : width of lines. default = 2
         markersize : size of markers (e.g. penalty spot, centre spot, posts). default = 20
+        cached     : draw all the lines at once with the geometry computed once for
+                     each set of parameters. default = False
 
     Returrns
     -----------
@@ -31,6 +42,118 @@ def plot_pitch(
 
     """
     fig, ax = plt.subplots(figsize=(12, 8))  # create a figure
+    if cached:
+        layers = _pitch_layers(tuple(field_dimen), field_color, linewidth, markersize)
+        ax.set_facecolor(layers["facecolor"])
+        ax.add_collection(
+            LineCollection(
+                layers["segments"],
+                colors=layers["colors"],
+                linewidths=layers["linewidths"],
+                capstyle="projecting",
+                joinstyle="round",
+                zorder=2,
+            ),
+            autolim=False,
+        )
+        for xy, style in layers["markers"]:
+            ax.plot(xy[:, 0], xy[:, 1], linestyle="None", **style)
+        for offsets, facecolor, sizes in layers["spots"]:
+            ax.scatter(
+                offsets[:, 0],
+                offsets[:, 1],
+                marker="o",
+                facecolor=facecolor,
+                linewidth=0,
+                s=sizes,
+            )
+        _set_axes(ax, field_dimen)
+    else:
+        draw_pitch(ax, field_dimen, field_color, linewidth, markersize)
+        plt.axis()
+    return fig, ax
+
+
+@lru_cache(maxsize=PITCH_CACHE_SIZE)
+def _pitch_layers(field_dimen, field_color, linewidth, markersize):
+    """
+    Draw the pitch once on axes outside of pyplot and gather its lines in one list
+    of segments and its markers by style, so that they are drawn by a few artists
+    instead of one artist for each line
+    """
+    ax = Figure().subplots()
+    draw_pitch(ax, field_dimen, field_color, linewidth, markersize)
+
+    segments, colors, linewidths = [], [], []
+    markers = {}
+    for line in ax.get_lines():
+        xy = line.get_xydata()
+        if line.get_linestyle() != "None":
+            segments.append(xy)
+            colors.append(to_rgba(line.get_color()))
+            linewidths.append(line.get_linewidth())
+        if line.get_marker() != "None":
+            style = {
+                "marker": line.get_marker(),
+                "markersize": line.get_markersize(),
+                "color": line.get_color(),
+            }
+            key = tuple(style.values())
+            if key in markers:
+                xy = np.vstack([markers[key][0], xy])
+            markers[key] = (xy, style)
+
+    return {
+        "facecolor": ax.get_facecolor(),
+        "segments": segments,
+        "colors": colors,
+        "linewidths": linewidths,
+        "markers": list(markers.values()),
+        "spots": [
+            (collection.get_offsets(), collection.get_facecolor(), collection.get_sizes())
+            for collection in ax.collections
+        ],
+    }
+
+
+def text_positions(field_dimen):
+    """
+    Positions of the texts written above the pitch: the x of the clock, the y of
+    the frame number and the y of the names of the teams. For a pitch of 106x68,
+    it gives (-55, 45, 40).
+    """
+    return (
+        -field_dimen[0] / 2.0 - 2,
+        field_dimen[1] / 2.0 + 11,
+        field_dimen[1] / 2.0 + 6,
+    )
+
+
+def _axis_limits(field_dimen):
+    return (
+        field_dimen[0] / 2.0 + BORDER_DIMEN[0],
+        field_dimen[1] / 2.0 + BORDER_DIMEN[1],
+    )
+
+
+def _set_axes(ax, field_dimen):
+    # remove axis labels and ticks
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_xticklabels([])
+    ax.set_yticklabels([])
+    # set axis limits
+    xmax, ymax = _axis_limits(field_dimen)
+    ax.set_xlim([-xmax, xmax])
+    ax.set_ylim([-ymax, ymax])
+    ax.set_axisbelow(True)
+
+
+def draw_pitch(ax, field_dimen, field_color, linewidth, markersize):
+    """draw_pitch
+
+    Draws the lines of a soccer pitch on existing axes (see plot_pitch).
+    """
     # decide what color we want the field to be. Default is green, but can also choose white
     if field_color == "green":
         ax.set_facecolor("#a8bc95")
@@ -40,7 +163,6 @@ def plot_pitch(
         lc = "k"
         pc = "k"
     # ALL DIMENSIONS IN m
-    border_dimen = (3, 3)  # include a border arround of the field of width 3m
     meters_per_yard = 0.9144  # unit conversion from yards to meters
     half_pitch_length = field_dimen[0] / 2.0  # length of half pitch
     half_pitch_width = field_dimen[1] / 2.0  # width of half pitch
@@ -158,16 +280,4 @@ def plot_pitch(
         x = np.sqrt(D_radius**2 - y**2) + D_pos
         ax.plot(s * half_pitch_length - s * x, y, lc, linewidth=linewidth)
 
-    # remove axis labels and ticks
-    ax.set_xticklabels([])
-    ax.set_yticklabels([])
-    ax.set_xticks([])
-    ax.set_yticks([])
-    # set axis limits
-    xmax = field_dimen[0] / 2.0 + border_dimen[0]
-    ymax = field_dimen[1] / 2.0 + border_dimen[1]
-    ax.set_xlim([-xmax, xmax])
-    ax.set_ylim([-ymax, ymax])
-    ax.set_axisbelow(True)
-    plt.axis()
-    return fig, ax
+    _set_axes(ax, field_dimen)
@@ -0,0 +1,487 @@
+"""
+Define the class Playbook
+Author : Chloe Gobe
+Date : 20.05.2023
+
+Group the corner kicks of many matches into routines, following the idea of
+Routine Inspection (L. Shaw, S. Gopaladesikan). For each corner kick, the players
+are taken at the beginning of the situation and at the end of the delivery, the
+coordinates being turned so that every corner kick is taken from the top right
+corner, towards the right goal. The attackers and the defenders are counted in
+zones of the attacked box, which gives a tensor of the same size for every corner
+kick, and the corner kicks are clustered with k-means on the zones of the
+attackers. The features of a match are computed for all its corner kicks at
+once, and the matches are processed in parallel.
+
+Usage (from the root of the repository):
+    python -m code.batch 2068 2269 2417 --output-dir results
+    python -m code.playbook results/corner_kicks.csv --routines 6 --workers 4
+"""
+
+import argparse
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from code.match_toolbox import Match
+from code.regions import CORNERS, METERS_PER_YARD
+
+# Number of frames between the beginning of the situation and the end of the delivery
+DELIVERY_FRAMES = 30
+# Maximum number of players of a team kept in the positions tensor
+MAX_PLAYERS = 11
+
+# Zones of the attacked box, the goal line being at depth 0 and the side of the
+# corner at positive lateral values. The last depth zone is far from the goal.
+DEPTH_EDGES = np.array([6, 12, 18, 33]) * METERS_PER_YARD
+LATERAL_EDGES = np.array([-22, -10, 0, 10, 22]) * METERS_PER_YARD
+N_ZONES = (len(DEPTH_EDGES) + 1) * (len(LATERAL_EDGES) + 1)
+
+ROLES = ("attackers", "defenders")
+MOMENTS = ("start", "end")
+
+
+def zone_of_positions(depth: np.ndarray, lateral: np.ndarray) -> np.ndarray:
+    """
+    Give the zone of positions turned towards the attacked goal
+
+    Args:
+        depth (np.ndarray): distance from the goal line (m)
+        lateral (np.ndarray): distance from the axis of the pitch, positive on the
+            side of the corner (m)
+
+    Returns:
+        np.ndarray: index of the zone, from 0 to N_ZONES - 1
+    """
+    return np.digitize(depth, DEPTH_EDGES) * (len(LATERAL_EDGES) + 1) + np.digitize(
+        lateral, LATERAL_EDGES
+    )
+
+
+def extract_corner_features(
+    match: Match, corner_frames: list, delivery_frames: int = DELIVERY_FRAMES
+) -> dict:
+    """
+    Compute the features of the corner kicks of a match, all at once
+
+    Args:
+        match (Match): the match, with its information gathered
+        corner_frames (list): first frames of the corner kicks
+        delivery_frames (int): number of frames between the beginning of the
+            situation and the end of the delivery
+
+    Returns:
+        dict with
+            corners : pandas.DataFrame with one row per corner kick found in the
+                tracking data, the frame, the end_frame, the corner (see CORNERS),
+                the side of the delivery for the attackers (left or right), the
+                attacking team and the counts of attackers and defenders in the box
+                and the six yards box at the start and at the end
+            zones : np.ndarray of shape (n_corners, 2, 2, N_ZONES), the number of
+                players by role (ROLES), moment (MOMENTS) and zone
+            positions : np.ndarray of shape (n_corners, 2, 2, MAX_PLAYERS, 2), the
+                turned (x, y) of the players by role and moment, the closest to the
+                goal line first, NaN when there are fewer players
+    """
+    tracking = match.tracking
+    length, width = match.pitch_size
+    corner_frames = np.asarray(corner_frames, dtype=np.int64)
+    rows = tracking.rows(corner_frames)
+    corner_frames = corner_frames[rows >= 0]
+    start_rows = rows[rows >= 0]
+    # The last frame of the delivery, or the last frame before it
+    end_rows = np.maximum(
+        np.searchsorted(tracking.frames, corner_frames + delivery_frames, "right") - 1,
+        start_rows,
+    )
+    n_corners = len(corner_frames)
+
+    # Players of the first and the last frames
+    entries, owners = tracking.entries_of_rows(np.concatenate([start_rows, end_rows]))
+    moments = (owners >= n_corners).astype(np.int64)
+    owners = owners % n_corners
+    team = match.team_of_entries(
+        tracking.trackable_object[entries], tracking.group[entries]
+    )
+    x, y = tracking.x[entries], tracking.y[entries]
+    is_player = (team >= 0) & ~np.isnan(x) & ~np.isnan(y)
+    owners, moments, team = owners[is_player], moments[is_player], team[is_player]
+    x, y = x[is_player], y[is_player]
+
+    # Corner of each corner kick: the closest to the ball, or to a player at the
+    # start when the ball is unknown
+    corners = np.array(
+        [(sign[0] * length / 2, sign[1] * width / 2) for sign in CORNERS.values()]
+    )
+    ball = match.get_ball_track()
+    ball_x = ball["x"].to_numpy()[start_rows]
+    ball_y = ball["y"].to_numpy()[start_rows]
+    distances = np.hypot(
+        ball_x[:, None] - corners[:, 0], ball_y[:, None] - corners[:, 1]
+    )
+    at_start = moments == 0
+    player_distances = np.hypot(
+        x[at_start, None] - corners[:, 0], y[at_start, None] - corners[:, 1]
+    )
+    closest_players = np.full((n_corners, len(corners)), np.inf)
+    np.minimum.at(closest_players, owners[at_start], player_distances)
+    distances = np.where(np.isnan(distances), closest_players, distances)
+    corner_index = np.argmin(distances, axis=1)
+    sign_x = np.sign(corners[corner_index, 0])
+    sign_y = np.sign(corners[corner_index, 1])
+
+    # The taker is the player closest to the corner at the start
+    taker_distance = player_distances[
+        np.arange(len(player_distances)), corner_index[owners[at_start]]
+    ]
+    order = np.lexsort((taker_distance, owners[at_start]))
+    first = np.unique(owners[at_start][order], return_index=True)
+    attacking_team = np.full(n_corners, -1)
+    attacking_team[first[0]] = team[at_start][order[first[1]]]
+
+    # Positions turned towards the right goal, with the corner at the top
+    turned_x = x * sign_x[owners]
+    turned_y = y * sign_y[owners]
+    roles = np.where(team == attacking_team[owners], 0, 1)
+    is_known = attacking_team[owners] >= 0
+
+    # Group of each player: corner kick, role and moment
+    groups = (owners * 2 + roles) * 2 + moments
+    depth = length / 2 - turned_x
+    zones = np.bincount(
+        (groups * N_ZONES + zone_of_positions(depth, turned_y))[is_known],
+        minlength=n_corners * 4 * N_ZONES,
+    ).reshape(n_corners, 2, 2, N_ZONES)
+
+    box_counts = {}
+    for region in ("box", "six_yards_box"):
+        is_inside = match.regions[f"{region}_right"].contains(turned_x, turned_y)
+        box_counts[region] = np.bincount(
+            groups[is_known & is_inside], minlength=n_corners * 4
+        ).reshape(n_corners, 2, 2)
+
+    # Positions of each group of players, the closest to the goal line first
+    order = np.lexsort((depth, groups))
+    order = order[is_known[order]]
+    group_start = np.searchsorted(groups[order], groups[order])
+    rank = np.arange(len(order)) - group_start
+    kept = order[rank < MAX_PLAYERS]
+    positions = np.full((n_corners * 4, MAX_PLAYERS, 2), np.nan)
+    positions[groups[kept], rank[rank < MAX_PLAYERS]] = np.column_stack(
+        [turned_x[kept], turned_y[kept]]
+    )
+    positions = positions.reshape(n_corners, 2, 2, MAX_PLAYERS, 2)
+
+    has_team = attacking_team >= 0
+    safe_team = np.maximum(attacking_team, 0)
+    df_corners = pd.DataFrame(
+        {
+            "frame": corner_frames,
+            "end_frame": tracking.frames[end_rows],
+            "corner": np.array(list(CORNERS))[corner_index],
+            # Facing the attacked goal, the corner is on the left when its x and y
+            # have the same sign
+            "side": np.where(sign_x * sign_y > 0, "left", "right"),
+            "attacking_team": np.where(has_team, match.team_keys[safe_team], None),
+            "team_id": np.where(has_team, match.team_ids[safe_team], None),
+            "team": np.where(has_team, match.team_short_names[safe_team], None),
+        }
+    )
+    for region, counts in box_counts.items():
+        for role_index, role in enumerate(ROLES):
+            for moment_index, moment in enumerate(MOMENTS):
+                df_corners[f"{role}_{region}_{moment}"] = counts[
+                    :, role_index, moment_index
+                ]
+
+    # The corner kicks without players are left out
+    return {
+        "corners": df_corners[has_team].reset_index(drop=True),
+        "zones": zones[has_team],
+        "positions": positions[has_team],
+    }
+
+
+def _extract_match(
+    match_id: int, corner_frames: list, data_dir: str, delivery_frames: int
+) -> tuple:
+    """
+    Compute the features of the corner kicks of one match. Run in a worker process,
+    an error is returned instead of being raised so that it does not stop the others.
+
+    Returns:
+        match_id, features (None if it failed), error (None if it succeeded)
+    """
+    try:
+        match = Match(match_id, data_dir=data_dir)
+        match.gather_information()
+        features = extract_corner_features(match, corner_frames, delivery_frames)
+        features["corners"].insert(0, "match_id", match_id)
+        return match_id, features, None
+    except Exception:
+        return match_id, None, traceback.format_exc()
+
+
+def kmeans(
+    features: np.ndarray,
+    n_clusters: int,
+    n_init: int = 10,
+    max_iter: int = 100,
+    seed: int = 0,
+) -> tuple:
+    """
+    Cluster the rows of a matrix with k-means, initialised with k-means++
+
+    Args:
+        features (np.ndarray): matrix of shape (n_samples, n_features)
+        n_clusters (int): number of clusters
+        n_init (int): number of runs, the one with the lowest inertia is kept
+        max_iter (int): maximum number of iterations of a run
+        seed (int): seed of the random generator
+
+    Returns:
+        labels : np.ndarray, cluster of each row
+        centers : np.ndarray of shape (n_clusters, n_features)
+        inertia : float, sum of the squared distances to the centers
+    """
+    features = np.asarray(features, dtype=float)
+    n_clusters = min(n_clusters, len(features))
+    rng = np.random.default_rng(seed)
+    squared_norms = (features**2).sum(axis=1)
+
+    def squared_distances(centers):
+        return np.maximum(
+            squared_norms[:, None]
+            - 2 * features @ centers.T
+            + (centers**2).sum(axis=1)[None, :],
+            0,
+        )
+
+    best = None
+    for _ in range(n_init):
+        # k-means++: the next center is far from the ones already chosen
+        centers = features[[rng.integers(len(features))]]
+        for _ in range(1, n_clusters):
+            closest = squared_distances(centers).min(axis=1)
+            total = closest.sum()
+            probabilities = closest / total if total > 0 else None
+            index = rng.choice(len(features), p=probabilities)
+            centers = np.vstack([centers, features[index]])
+
+        labels = None
+        for _ in range(max_iter):
+            new_labels = squared_distances(centers).argmin(axis=1)
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            counts = np.bincount(labels, minlength=n_clusters)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, features)
+            # An empty cluster keeps its center
+            centers = np.where(
+                counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers
+            )
+        inertia = squared_distances(centers)[np.arange(len(features)), labels].sum()
+        if best is None or inertia < best[2]:
+            best = (labels, centers, float(inertia))
+    return best
+
+
+class Playbook:
+    """
+    Define the class Playbook holding the features of the corner kicks of many
+    matches and their routines
+    """
+
+    def __init__(
+        self, df_corners: pd.DataFrame, zones: np.ndarray, positions: np.ndarray
+    ):
+        """
+        Args:
+            df_corners (pandas.DataFrame): one row per corner kick, see
+                extract_corner_features, with a match_id column
+            zones (np.ndarray): number of players by corner kick, role, moment and zone
+            positions (np.ndarray): turned positions by corner kick, role and moment
+        """
+        self.df_corners = df_corners
+        self.zones = zones
+        self.positions = positions
+        self.centers = None
+
+    @classmethod
+    def from_candidates(
+        cls,
+        df_candidates: pd.DataFrame,
+        data_dir: str = "data/matches",
+        workers: int = None,
+        delivery_frames: int = DELIVERY_FRAMES,
+    ) -> "Playbook":
+        """
+        Compute the features of the corner kicks of many matches with a pool of
+        processes
+
+        Args:
+            df_candidates (pandas.DataFrame): corner kicks with the columns match_id
+                and frame, like the result of run_batch
+            data_dir (str): folder with one folder by match
+            workers (int): number of processes, the number of CPUs if None
+            delivery_frames (int): number of frames between the beginning of the
+                situation and the end of the delivery
+
+        Returns:
+            Playbook, the errors by match_id are in df_corners.attrs["failures"]
+        """
+        results = {}
+        failures = {}
+        frames_by_match = df_candidates.groupby("match_id")["frame"].apply(list)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _extract_match, match_id, frames, data_dir, delivery_frames
+                )
+                for match_id, frames in frames_by_match.items()
+            ]
+            for future in tqdm(
+                as_completed(futures), total=len(futures), desc="Matches"
+            ):
+                match_id, features, error = future.result()
+                if error is None:
+                    results[match_id] = features
+                else:
+                    failures[match_id] = error
+                    tqdm.write(f"{match_id} : failed - {error.splitlines()[-1]}")
+
+        # The corner kicks are kept in the order of the matches
+        results = [results[match_id] for match_id in sorted(results)]
+        if results:
+            df_corners = pd.concat(
+                [features["corners"] for features in results], ignore_index=True
+            )
+            zones = np.concatenate([features["zones"] for features in results])
+            positions = np.concatenate(
+                [features["positions"] for features in results]
+            )
+        else:
+            df_corners = pd.DataFrame(columns=["match_id", "frame"])
+            zones = np.zeros((0, 2, 2, N_ZONES), dtype=np.int64)
+            positions = np.zeros((0, 2, 2, MAX_PLAYERS, 2))
+        df_corners.attrs["failures"] = failures
+        return cls(df_corners, zones, positions)
+
+    def features(self) -> np.ndarray:
+        """
+        Features of the routines: the number of attackers in each zone at the start
+        and at the end of the delivery
+
+        Returns:
+            np.ndarray of shape (n_corners, 2 * N_ZONES)
+        """
+        return self.zones[:, 0].reshape(len(self.zones), -1)
+
+    def cluster(self, n_routines: int = 6, seed: int = 0) -> pd.DataFrame:
+        """
+        Group the corner kicks into routines with k-means on their features, the
+        routine of each corner kick is added to df_corners
+
+        Args:
+            n_routines (int): number of routines
+            seed (int): seed of the random generator
+
+        Returns:
+            pandas.DataFrame: df_corners with the column routine
+        """
+        if len(self.df_corners) == 0:
+            self.df_corners["routine"] = pd.Series(dtype=np.int64)
+            return self.df_corners
+        labels, self.centers, _ = kmeans(self.features(), n_routines, seed=seed)
+        self.df_corners["routine"] = labels
+        return self.df_corners
+
+    def routines(self, team: str = None) -> pd.DataFrame:
+        """
+        Summary of the routines, of all the teams or of one team
+
+        Args:
+            team (str): short name of a team, all the teams if None
+
+        Returns:
+            pandas.DataFrame indexed by routine with the number and the share of the
+            corner kicks, the part delivered from the left and the mean number of
+            attackers and defenders in the box and the six yards box at the end
+        """
+        if "routine" not in self.df_corners:
+            raise RuntimeError("The corner kicks are not clustered, use cluster()")
+        df_corners = self.df_corners
+        if team is not None:
+            df_corners = df_corners[df_corners["team"] == team]
+        columns = [
+            f"{role}_{region}_end"
+            for region in ("box", "six_yards_box")
+            for role in ROLES
+        ]
+        df_routines = df_corners.groupby("routine").agg(
+            corners=("frame", "size"),
+            left=("side", lambda side: (side == "left").mean()),
+            **{column: (column, "mean") for column in columns},
+        )
+        df_routines.insert(1, "share", df_routines["corners"] / len(df_corners))
+        return df_routines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Group the corner kicks of many matches into routines"
+    )
+    parser.add_argument(
+        "candidates",
+        help="CSV file of the corner kicks with the columns match_id and frame, "
+        "like the corner_kicks.csv of code.batch",
+    )
+    parser.add_argument("--routines", type=int, default=6, help="number of routines")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--data-dir", default="data/matches", help="folder with one folder by match"
+    )
+    parser.add_argument(
+        "--delivery-frames",
+        type=int,
+        default=DELIVERY_FRAMES,
+        help="frames between the beginning of the situation and the end of delivery",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="CSV file of the corner kicks with their routine, next to the candidates "
+        "by default",
+    )
+    args = parser.parse_args()
+
+    playbook = Playbook.from_candidates(
+        pd.read_csv(args.candidates),
+        data_dir=args.data_dir,
+        workers=args.workers,
+        delivery_frames=args.delivery_frames,
+    )
+    df_corners = playbook.cluster(args.routines)
+    output = args.output or os.path.join(
+        os.path.dirname(args.candidates), "playbook.csv"
+    )
+    df_corners.to_csv(output, index=False)
+
+    if len(df_corners):
+        print(playbook.routines().to_string(float_format=lambda value: f"{value:.2f}"))
+    print(
+        f"{len(df_corners)} corner kicks in {df_corners['match_id'].nunique()} "
+        f"matches, {len(df_corners.attrs['failures'])} failed - saved in {output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Opt-in profiling of the stages of the analysis
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The stages of Match and CornerKickFinder are wrapped with profiled or stage.
+When the profiling is disabled, the default, a stage only checks a flag.
+When it is enabled, the wall time, the number of calls and the peak memory
+(tracemalloc) of every stage are recorded, and a summary table is printed at the
+end of the run.
+
+Enabled from the environment, for example:
+    CORNER_KICKS_PROFILE=1 python -m code.batch 2068
+    CORNER_KICKS_PROFILE=1 CORNER_KICKS_PROFILE_TRACE=trace.json python -m code.batch 2068
+or from the code with enable(), report() and print_report().
+
+CORNER_KICKS_PROFILE_TRACE saves the stages in the Chrome trace format
+(chrome://tracing or https://ui.perfetto.dev) and CORNER_KICKS_PROFILE_CPROFILE
+saves the cProfile statistics of the main process (snakeviz, pstats). The workers
+of the batch runner inherit these variables: they record their stages and give
+them to the main process, which writes the only report and files.
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+from contextlib import nullcontext
+import pandas as pd
+
+ENV_VARIABLE = "CORNER_KICKS_PROFILE"
+TRACE_ENV_VARIABLE = "CORNER_KICKS_PROFILE_TRACE"
+CPROFILE_ENV_VARIABLE = "CORNER_KICKS_PROFILE_CPROFILE"
+
+_enabled = False
+_memory = False
+_trace = False
+_profile = None
+
+# Statistics by stage: [number of calls, total time (s), peak memory (bytes)]
+_stats = {}
+# Stages in the Chrome trace format
+_events = []
+# Stages running, the last one is the innermost
+_stack = []
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    """Record the time and the memory of one run of a stage"""
+
+    __slots__ = ("name", "start", "memory_start", "peak")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        if _memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak of the stage running is kept before the new measure
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+            self.peak = current
+        _stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        _stack.pop()
+        memory = 0
+        if _memory:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            memory = peak - self.memory_start
+
+        stats = _stats.setdefault(self.name, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += end - self.start
+        stats[2] = max(stats[2], memory)
+        if _trace:
+            _events.append(
+                {
+                    "name": self.name,
+                    "ph": "X",
+                    # The clock of perf_counter is shared by the worker processes
+                    "ts": self.start * 1e6,
+                    "dur": (end - self.start) * 1e6,
+                    "pid": os.getpid(),
+                    "tid": 0,
+                }
+            )
+        return False
+
+
+def stage(name: str):
+    """
+    Context manager recording a stage when the profiling is enabled
+
+    Args:
+        name (str): name of the stage in the report
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def profiled(name: str):
+    """
+    Decorator recording each call of a function as a stage
+
+    Args:
+        name (str): name of the stage in the report
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(memory: bool = True, trace: bool = False, cprofile: bool = False):
+    """
+    Start recording the stages
+
+    Args:
+        memory (bool): record the peak memory of the stages, which slows down
+            the allocations
+        trace (bool): keep every run of the stages for export_chrome_trace
+        cprofile (bool): run cProfile on the whole process for export_cprofile
+    """
+    global _enabled, _memory, _trace, _profile
+    _enabled = True
+    _memory = memory
+    _trace = trace
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if cprofile and _profile is None:
+        _profile = cProfile.Profile()
+        _profile.enable()
+
+
+def disable():
+    """Stop recording the stages, the records are kept"""
+    global _enabled, _memory, _trace, _profile
+    _enabled = False
+    _memory = False
+    _trace = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if _profile is not None:
+        _profile.disable()
+
+
+def reset():
+    """Remove the records"""
+    _stats.clear()
+    _events.clear()
+
+
+def snapshot() -> dict:
+    """Records of the process, to be merged in another process"""
+    return {
+        "stats": {name: list(stats) for name, stats in _stats.items()},
+        "events": list(_events),
+    }
+
+
+def merge(records: dict):
+    """
+    Add the records of another process, like a worker of the batch runner
+
+    Args:
+        records (dict): result of snapshot in the other process
+    """
+    for name, (calls, total, memory) in records["stats"].items():
+        stats = _stats.setdefault(name, [0, 0.0, 0])
+        stats[0] += calls
+        stats[1] += total
+        stats[2] = max(stats[2], memory)
+    _events.extend(records["events"])
+
+
+def report() -> pd.DataFrame:
+    """
+    Summary of the stages recorded, the longest first
+
+    Returns:
+        pandas.DataFrame with the columns stage, calls, total (s), mean (ms) and
+        peak memory (MB), the memory allocated by the stage above its start
+    """
+    df_report = pd.DataFrame(
+        [
+            {
+                "stage": name,
+                "calls": calls,
+                "total (s)": total,
+                "mean (ms)": total / calls * 1000,
+                "peak memory (MB)": memory / 1e6 if _memory or memory else None,
+            }
+            for name, (calls, total, memory) in _stats.items()
+        ],
+        columns=["stage", "calls", "total (s)", "mean (ms)", "peak memory (MB)"],
+    )
+    return df_report.sort_values("total (s)", ascending=False, ignore_index=True)
+
+
+def print_report():
+    df_report = report()
+    if len(df_report) > 0:
+        print(df_report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+
+def export_chrome_trace(path: str):
+    """
+    Save the runs of the stages in the Chrome trace format, the trace must have
+    been enabled
+
+    Args:
+        path (str): JSON file
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, file)
+
+
+def export_cprofile(path: str):
+    """
+    Save the statistics of cProfile, it must have been enabled
+
+    Args:
+        path (str): file readable with pstats
+    """
+    if _profile is None:
+        raise RuntimeError("cProfile is not enabled, use enable(cprofile=True)")
+    _profile.dump_stats(path)
+
+
+def _is_worker() -> bool:
+    """Check if the process was started by multiprocessing, like the workers of
+    the batch runner, which give their records to the main process"""
+    return multiprocessing.parent_process() is not None
+
+
+def _report_at_exit():
+    # A forked worker inherits the handler of the main process
+    if _is_worker():
+        return
+    trace_path = os.environ.get(TRACE_ENV_VARIABLE)
+    cprofile_path = os.environ.get(CPROFILE_ENV_VARIABLE)
+    if _profile is not None:
+        _profile.disable()
+    print_report()
+    if trace_path:
+        export_chrome_trace(trace_path)
+    if cprofile_path:
+        export_cprofile(cprofile_path)
+
+
+if os.environ.get(ENV_VARIABLE, "0") not in ("", "0"):
+    # The workers inherit the environment, only the main process prints the
+    # report and writes the files, with the records of the workers merged
+    enable(
+        trace=bool(os.environ.get(TRACE_ENV_VARIABLE)),
+        cprofile=bool(os.environ.get(CPROFILE_ENV_VARIABLE)) and not _is_worker(),
+    )
+    if not _is_worker():
+        atexit.register(_report_at_exit)
@@ -0,0 +1,330 @@
+"""
+Define the regions of the pitch and the class SpatialIndex
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The regions (corner arcs, 10 yards circles, boxes, six yards boxes, the D, the
+halves, the centre circle and spot and the touchlines) are built from the size of
+the pitch of the match. The SpatialIndex puts the tracking
+entries of many frames in the cells of a grid, so that a region only tests the
+entries of the cells it covers instead of all the entries of the match.
+
+Usage:
+    regions = pitch_regions(match.pitch_size)
+    index = SpatialIndex.from_tracking(match.tracking)
+    entries = index.query(regions["box_right"])
+    players_in_box = index.count_by_frame(regions["box_right"], where=team == 0)
+"""
+
+import numpy as np
+
+METERS_PER_YARD = 0.9144
+
+# Corners of the pitch, in the order of CornerKickFinder._corner_coordinates
+CORNERS = {
+    "right_top": (1, 1),
+    "right_bottom": (1, -1),
+    "left_top": (-1, 1),
+    "left_bottom": (-1, -1),
+}
+SIDES = {"right": 1, "left": -1}
+TOUCHLINES = {"top": 1, "bottom": -1}
+
+
+class Region:
+    """Define a region of the pitch, a zone tested on arrays of positions"""
+
+    def __init__(self, name: str, bounds: tuple):
+        """
+        Args:
+            name (str): name of the region
+            bounds (tuple): (x_min, x_max, y_min, y_max) of a rectangle holding the region
+        """
+        self.name = name
+        self.bounds = bounds
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Check which positions are in the region
+
+        Args:
+            x (np.ndarray): x of the positions, NaN if unknown
+            y (np.ndarray): y of the positions, NaN if unknown
+
+        Returns:
+            np.ndarray: True for the positions in the region
+        """
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class Circle(Region):
+    """Disc around a point, possibly without the part inside another region"""
+
+    def __init__(
+        self,
+        name: str,
+        center: tuple,
+        radius: float,
+        inclusive: bool = False,
+        outside: Region = None,
+    ):
+        """
+        Args:
+            name (str): name of the region
+            center (tuple): (x, y) of the center
+            radius (float): radius (m)
+            inclusive (bool): a position at the radius from the center is in the region
+            outside (Region): region removed from the disc
+        """
+        super().__init__(
+            name,
+            (
+                center[0] - radius,
+                center[0] + radius,
+                center[1] - radius,
+                center[1] + radius,
+            ),
+        )
+        self.center = center
+        self.radius = radius
+        self.inclusive = inclusive
+        self.outside = outside
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        distance = np.sqrt((x - self.center[0]) ** 2 + (y - self.center[1]) ** 2)
+        if self.inclusive:
+            is_inside = distance <= self.radius
+        else:
+            is_inside = distance < self.radius
+        if self.outside is not None:
+            is_inside &= ~self.outside.contains(x, y)
+        return is_inside
+
+
+class Rectangle(Region):
+    """Rectangle aligned with the lines of the pitch, without its borders"""
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        x_min, x_max, y_min, y_max = self.bounds
+        return (x_min < x) & (x < x_max) & (y_min < y) & (y < y_max)
+
+
+def pitch_regions(
+    pitch_size: tuple,
+    corner_radius: float = 1.0,
+    distance_limit: float = 10 * METERS_PER_YARD,
+    spot_radius: float = 1.0,
+    touchline_margin: float = 1.0,
+) -> dict:
+    """
+    Build the named regions of a pitch, centered on (0, 0)
+
+    Args:
+        pitch_size (tuple): length and width of the pitch (m)
+        corner_radius (float): radius of the corner arcs (m)
+        distance_limit (float): radius of the circles around the corners that the
+            opponents of the corner taker stay out of (m)
+        spot_radius (float): radius of the centre spot (m)
+        touchline_margin (float): distance from the touchlines of the bands along
+            them, on both sides of the line (m)
+
+    Returns:
+        dict: regions by name, corner_arc_<corner> and ten_yards_circle_<corner> for
+        the corners of CORNERS, box_<side>, six_yards_box_<side>,
+        penalty_arc_<side> (the D) and half_<side> for the sides of SIDES,
+        touchline_<touchline> for the touchlines of TOUCHLINES, centre_spot and
+        centre_circle
+    """
+    length, width = pitch_size
+    regions = {}
+    for corner, (sign_x, sign_y) in CORNERS.items():
+        center = (sign_x * length / 2, sign_y * width / 2)
+        regions[f"corner_arc_{corner}"] = Circle(
+            f"corner_arc_{corner}", center, corner_radius
+        )
+        regions[f"ten_yards_circle_{corner}"] = Circle(
+            f"ten_yards_circle_{corner}", center, distance_limit, inclusive=True
+        )
+
+    for side, sign in SIDES.items():
+        for name, depth, box_width in (
+            ("box", 18, 44),
+            ("six_yards_box", 6, 20),
+        ):
+            goal_line = sign * length / 2
+            line = goal_line - sign * depth * METERS_PER_YARD
+            regions[f"{name}_{side}"] = Rectangle(
+                f"{name}_{side}",
+                (
+                    min(goal_line, line),
+                    max(goal_line, line),
+                    -box_width * METERS_PER_YARD / 2,
+                    box_width * METERS_PER_YARD / 2,
+                ),
+            )
+        penalty_spot = (sign * (length / 2 - 12 * METERS_PER_YARD), 0.0)
+        regions[f"penalty_arc_{side}"] = Circle(
+            f"penalty_arc_{side}",
+            penalty_spot,
+            10 * METERS_PER_YARD,
+            outside=regions[f"box_{side}"],
+        )
+        regions[f"half_{side}"] = Rectangle(
+            f"half_{side}",
+            (min(0.0, goal_line), max(0.0, goal_line), -width / 2, width / 2),
+        )
+
+    for touchline, sign in TOUCHLINES.items():
+        regions[f"touchline_{touchline}"] = Rectangle(
+            f"touchline_{touchline}",
+            (
+                -length / 2,
+                length / 2,
+                sign * width / 2 - touchline_margin,
+                sign * width / 2 + touchline_margin,
+            ),
+        )
+    regions["centre_spot"] = Circle("centre_spot", (0.0, 0.0), spot_radius)
+    regions["centre_circle"] = Circle(
+        "centre_circle", (0.0, 0.0), 10 * METERS_PER_YARD, inclusive=True
+    )
+    return regions
+
+
+class SpatialIndex:
+    """
+    Define the class SpatialIndex, a grid holding the tracking entries of many
+    frames to find the entries in a region without testing all of them
+    """
+
+    def __init__(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        entry_rows: np.ndarray,
+        n_rows: int,
+        cell_size: float = 5.0,
+        extent: tuple = (-60.0, 60.0, -40.0, 40.0),
+    ):
+        """
+        Args:
+            x (np.ndarray): x of the entries, NaN if unknown
+            y (np.ndarray): y of the entries, NaN if unknown
+            entry_rows (np.ndarray): row of the frame of each entry
+            n_rows (int): number of frames
+            cell_size (float): side of the cells of the grid (m)
+            extent (tuple): (x_min, x_max, y_min, y_max) covered by the grid, the
+                entries outside are put in the cells of the border
+        """
+        self.x = x
+        self.y = y
+        self.entry_rows = entry_rows
+        self.n_rows = n_rows
+        self.cell_size = cell_size
+        self.extent = extent
+        self.shape = (
+            max(int(np.ceil((extent[1] - extent[0]) / cell_size)), 1),
+            max(int(np.ceil((extent[3] - extent[2]) / cell_size)), 1),
+        )
+        n_cells = self.shape[0] * self.shape[1]
+
+        # Cell of each entry, the entries without position are in an extra cell.
+        # Small cell numbers are stored in int16 to be sorted with a radix sort.
+        cells = self._cell_indices(x, 0) * self.shape[1] + self._cell_indices(y, 1)
+        cells[np.isnan(x) | np.isnan(y)] = n_cells
+        if n_cells < np.iinfo(np.int16).max:
+            cells = cells.astype(np.int16)
+        self._order = np.argsort(cells, kind="stable")
+        self._offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(cells, minlength=n_cells + 1))]
+        )
+
+    @classmethod
+    def from_tracking(cls, tracking, cell_size: float = 5.0, extent: tuple = None):
+        """
+        Index the entries of a TrackingStore
+
+        Args:
+            tracking (TrackingStore): tracking data of the match or of some frames
+            cell_size (float): side of the cells of the grid (m)
+            extent (tuple): (x_min, x_max, y_min, y_max) covered by the grid,
+                by default a pitch of 120 x 80 m
+        """
+        kwargs = {} if extent is None else {"extent": extent}
+        return cls(
+            tracking.x,
+            tracking.y,
+            tracking.entry_rows,
+            len(tracking),
+            cell_size=cell_size,
+            **kwargs,
+        )
+
+    def _cell_indices(self, values: np.ndarray, axis: int) -> np.ndarray:
+        start = self.extent[2 * axis]
+        with np.errstate(invalid="ignore"):
+            indices = np.floor((values - start) / self.cell_size)
+        return np.clip(np.nan_to_num(indices), 0, self.shape[axis] - 1).astype(np.int32)
+
+    def query(self, region: Region, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Find the entries in a region
+
+        Args:
+            region (Region): region of the pitch
+            rows (np.ndarray): True for the rows of the frames to search, all the
+                frames if None
+
+        Returns:
+            np.ndarray: indices of the entries in the region, sorted
+        """
+        x_min, x_max, y_min, y_max = region.bounds
+        first_x, last_x = self._cell_indices(np.array([x_min, x_max]), 0)
+        first_y, last_y = self._cell_indices(np.array([y_min, y_max]), 1)
+
+        # The cells of a column of the grid are contiguous in the sorted entries
+        columns = np.arange(first_x, last_x + 1) * self.shape[1]
+        starts = self._offsets[columns + first_y]
+        ends = self._offsets[columns + last_y + 1]
+        candidates = np.concatenate(
+            [self._order[start:end] for start, end in zip(starts, ends)]
+        )
+        if rows is not None:
+            candidates = candidates[rows[self.entry_rows[candidates]]]
+        entries = candidates[region.contains(self.x[candidates], self.y[candidates])]
+        entries.sort()
+        return entries
+
+    def mask(self, region: Region, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Same as query, as a mask of the entries
+
+        Returns:
+            np.ndarray: True for the entries in the region
+        """
+        is_inside = np.zeros(len(self.x), dtype=bool)
+        is_inside[self.query(region, rows)] = True
+        return is_inside
+
+    def count_by_frame(
+        self, region: Region, where: np.ndarray = None, rows: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Count the entries in a region in every frame
+
+        Args:
+            region (Region): region of the pitch
+            where (np.ndarray): True for the entries counted, all the entries if None
+            rows (np.ndarray): True for the rows of the frames to search, all the
+                frames if None
+
+        Returns:
+            np.ndarray: number of entries in the region by row of frame
+        """
+        entries = self.query(region, rows)
+        if where is not None:
+            entries = entries[where[entries]]
+        return np.bincount(self.entry_rows[entries], minlength=self.n_rows)
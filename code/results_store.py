@@ -0,0 +1,204 @@
+"""
+Define the class ResultsStore
+Author : Chloe Gobe
+Date : 20.05.2023
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id INTEGER PRIMARY KEY,
+    date_time TEXT,
+    home_team TEXT,
+    away_team TEXT,
+    home_acronym TEXT,
+    away_acronym TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    match_id INTEGER NOT NULL,
+    config_hash TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    config TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (match_id, config_hash, code_version)
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    match_id INTEGER NOT NULL,
+    config_hash TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    time TEXT
+);
+CREATE INDEX IF NOT EXISTS candidates_run
+    ON candidates (match_id, config_hash, code_version);
+"""
+
+
+class ResultsStore:
+    """
+    Define the class ResultsStore saving the potentiel corner kicks found
+    in all the matches in one SQLite database.
+
+    The results of a match are identified by the hash of the configuration of the
+    finder and the version of the detection code, so that the results of another
+    configuration are computed again while the others are read from the store.
+    """
+
+    def __init__(self, path: str = "results/corner_kicks.sqlite"):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Several workers of the batch runner can write at the same time
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def has(self, match_id: int, config_hash: str, code_version: str) -> bool:
+        """Check if the results of a match have already been saved"""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM runs "
+                "WHERE match_id = ? AND config_hash = ? AND code_version = ?",
+                (match_id, config_hash, code_version),
+            ).fetchone()
+        return row is not None
+
+    def load(self, match_id: int, config_hash: str, code_version: str) -> pd.DataFrame:
+        """
+        Load the potentiel corner kicks of a match
+
+        Returns:
+            pd.DataFrame with the columns frame and time
+        """
+        with self._connect() as connection:
+            return pd.read_sql_query(
+                "SELECT frame, time FROM candidates "
+                "WHERE match_id = ? AND config_hash = ? AND code_version = ? "
+                "ORDER BY frame",
+                connection,
+                params=(match_id, config_hash, code_version),
+            )
+
+    def save(
+        self,
+        match_id: int,
+        config_hash: str,
+        code_version: str,
+        config: dict,
+        df_potential: pd.DataFrame,
+        match_data: dict,
+    ):
+        """
+        Save the potentiel corner kicks of a match, replacing the previous results
+        of the same configuration and code version
+
+        Args:
+            match_id (int): identifier of the match
+            config_hash (str): hash of the configuration of the finder
+            code_version (str): version of the detection code
+            config (dict): configuration of the finder
+            df_potential (pd.DataFrame): potentiel corner kicks with the columns frame and time
+            match_data (dict): content of match_data.json, to describe the match
+        """
+        key = (match_id, config_hash, code_version)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    match_id,
+                    match_data.get("date_time"),
+                    match_data["home_team"]["short_name"],
+                    match_data["away_team"]["short_name"],
+                    match_data["home_team"].get("acronym"),
+                    match_data["away_team"].get("acronym"),
+                ),
+            )
+            connection.execute(
+                "DELETE FROM candidates "
+                "WHERE match_id = ? AND config_hash = ? AND code_version = ?",
+                key,
+            )
+            connection.executemany(
+                "INSERT INTO candidates VALUES (?, ?, ?, ?, ?)",
+                [
+                    key + (int(frame), time)
+                    for frame, time in zip(df_potential["frame"], df_potential["time"])
+                ],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                key
+                + (
+                    json.dumps(config, sort_keys=True),
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+
+    def query(
+        self,
+        team: str = None,
+        match_id: int = None,
+        config_hash: str = None,
+        code_version: str = None,
+        all_versions: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Get the potentiel corner kicks of all the matches meeting the filters
+
+        Args:
+            team (str): short name or acronym of a team playing the match
+            match_id (int): identifier of the match
+            config_hash (str): hash of the configuration of the finder
+            code_version (str): version of the detection code, the current version
+                of CornerKickFinder if None
+            all_versions (bool): also give the results of the other versions of the
+                detection code, which may be outdated
+
+        Returns:
+            pd.DataFrame with the columns match_id, date_time, home_team, away_team,
+            config_hash, code_version, frame and time
+        """
+        # Imported here, the finder imports the store
+        from code.corner_kicks_finder import DETECTOR_VERSION
+
+        if code_version is None and not all_versions:
+            code_version = DETECTOR_VERSION
+        conditions, params = [], []
+        if team is not None:
+            conditions.append(
+                "? IN (m.home_team, m.away_team, m.home_acronym, m.away_acronym)"
+            )
+            params.append(team)
+        for column, value in (
+            ("match_id", match_id),
+            ("config_hash", config_hash),
+            ("code_version", code_version),
+        ):
+            if value is not None:
+                conditions.append(f"c.{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._connect() as connection:
+            return pd.read_sql_query(
+                "SELECT c.match_id, m.date_time, m.home_team, m.away_team, "
+                "c.config_hash, c.code_version, c.frame, c.time "
+                "FROM candidates c JOIN matches m ON c.match_id = m.match_id "
+                f"{where} ORDER BY c.match_id, c.frame",
+                connection,
+                params=params,
+            )
@@ -0,0 +1,503 @@
+"""
+Sweep of the thresholds of the corner kicks finder
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The conditions of CornerKickFinder only compare distances and heights with its
+thresholds. For each match, the distances of the ball and of the players of each
+team to the corners, the height of the ball and the flags of the frames are
+computed once and cached in data/sweep. A set of thresholds is then evaluated
+with a few comparisons on arrays of one value per frame, and gives the same frames
+as the finder. The frames found are compared with labelled corner kicks to give
+the precision and the recall of each set of thresholds.
+
+Usage (from the root of the repository):
+    python -m code.sweep labels.csv --workers 4 --output results/sweep.csv
+    python -m code.sweep labels.csv --grid corner_radius=1,2,3 --grid ball_window=50
+"""
+
+import argparse
+import itertools
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from code import conditions
+from code.cache import source_key
+from code.corner_kicks_finder import DEFAULT_CONFIG
+from code.match_toolbox import Match
+from code.regions import CORNERS
+
+# Increase when the content of the cached features changes
+SWEEP_VERSION = 2
+
+# Values of the thresholds tried by default
+SWEEP_GRID = {
+    "corner_radius": [0.5, 1, 1.5, 2, 3],
+    "max_ball_height": [0.2, 0.5, 1.0],
+    "distance_limit": [7.0, 10 * 0.9144, 12.0],
+    "ball_window": [25, 50, 100],
+    "max_ball_gap": [100],
+    "min_frames_between": [10, 50, 100],
+}
+INTEGER_PARAMETERS = ("ball_window", "max_ball_gap", "min_frames_between")
+
+# Maximum number of frames between a labelled corner kick and a frame found
+TOLERANCE = 100
+
+
+def parameter_grid(grid: dict) -> list:
+    """
+    List the sets of thresholds of a grid
+
+    Args:
+        grid (dict): values tried by threshold, the other thresholds keep the
+            value of DEFAULT_CONFIG
+
+    Returns:
+        list: configurations of CornerKickFinder
+    """
+    unknown = set(grid) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise TypeError(f"Unknown parameters of CornerKickFinder: {sorted(unknown)}")
+    names = list(grid)
+    return [
+        DEFAULT_CONFIG | dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def _min_by_row(values: np.ndarray, rows: np.ndarray, n_rows: int) -> np.ndarray:
+    """Minimum of the values of each row, inf for the rows without value. The
+    rows must be in increasing order."""
+    result = np.full(n_rows, np.inf)
+    if len(values) > 0:
+        starts = np.flatnonzero(np.concatenate([[True], rows[1:] != rows[:-1]]))
+        result[rows[starts]] = np.minimum.reduceat(values, starts)
+    return result
+
+
+def compute_features(match: Match, max_ball_gaps: list) -> dict:
+    """
+    Compute the values compared with the thresholds of the finder in every frame
+
+    Args:
+        match (Match): match with its information gathered
+        max_ball_gaps (list): values of max_ball_gap, the ball is interpolated
+            with each of them
+
+    Returns:
+        dict: arrays of one value per frame: frames, is_timed, has_players,
+        ball_visible, ball_z, ball_distance_<max_ball_gap> (to the closest corner,
+        NaN without ball) and team_distance of shape (corners, teams, frames), the
+        distance of the closest player of each team to each corner (inf without
+        player)
+    """
+    tracking = match.tracking
+    n_frames = len(tracking)
+    rows = tracking.entry_rows
+    team = match.team_of_entries(tracking.trackable_object, tracking.group)
+    features = {
+        "frames": tracking.frames.astype(np.int64),
+        "is_timed": ~pd.isna(tracking.time),
+        "has_players": np.bincount(rows[team >= 0], minlength=n_frames) > 0,
+    }
+
+    centers = _corner_centers(match)
+    team_distance = np.full((len(CORNERS), 2, n_frames), np.inf)
+    for corner, center in enumerate(centers):
+        distance = np.sqrt(
+            (tracking.x - center[0]) ** 2 + (tracking.y - center[1]) ** 2
+        )
+        distance[np.isnan(distance)] = np.inf
+        for side in (0, 1):
+            is_team = team == side
+            team_distance[corner, side] = _min_by_row(
+                distance[is_team], rows[is_team], n_frames
+            )
+    features["team_distance"] = team_distance
+
+    # The observed ball, without any gap filled
+    ball = match.get_ball_track(0)
+    features["ball_visible"] = ~np.isnan(ball["x"].to_numpy())
+    features["ball_z"] = ball["z"].to_numpy()
+    features.update(_ball_distances(match, max_ball_gaps))
+    return features
+
+
+def _corner_centers(match: Match) -> list:
+    """Corners of the pitch, computed as in Circle.contains to give the same
+    comparisons"""
+    length, width = match.pitch_size
+    return [
+        (sign_x * length / 2, sign_y * width / 2) for sign_x, sign_y in CORNERS.values()
+    ]
+
+
+def _ball_distances(match: Match, max_ball_gaps: list) -> dict:
+    """Distance of the ball to the closest corner, ball_distance_<max_ball_gap>"""
+    features = {}
+    for max_gap in max_ball_gaps:
+        ball = match.get_ball_track(max_gap)
+        x, y = ball["x"].to_numpy(), ball["y"].to_numpy()
+        distances = [
+            np.sqrt((x - center[0]) ** 2 + (y - center[1]) ** 2)
+            for center in _corner_centers(match)
+        ]
+        features[f"ball_distance_{max_gap}"] = np.min(distances, axis=0)
+    return features
+
+
+def _load_features(path: str, sources: list) -> tuple:
+    """Read the cached features and the values of max_ball_gap they hold, None if
+    they are missing or not up to date"""
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != SWEEP_VERSION or meta["sources"] != [
+                source_key(source) for source in sources
+            ]:
+                return None
+            features = {name: data[name] for name in data.files if name != "meta"}
+            return features, meta["max_ball_gaps"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def match_features(
+    match_id: int,
+    max_ball_gaps: list,
+    data_dir: str = "data/matches",
+    cache_dir: str = "data/cache",
+    features_dir: str = "data/sweep",
+) -> dict:
+    """
+    Give the features of a match for the sweep, from the cache if they are up to
+    date. The distances of the ball for the values of max_ball_gap missing from
+    the cache are computed and added to it, the other values are kept.
+
+    Args:
+        match_id (int): identifier of the match
+        max_ball_gaps (list): values of max_ball_gap needed
+        data_dir (str): folder with one folder by match
+        cache_dir (str): folder of the binary cache of the parsed matches
+        features_dir (str): folder of the cached features, nothing is cached if None
+
+    Returns:
+        dict: see compute_features, with at least the values of max_ball_gaps
+    """
+    match = Match(match_id, data_dir=data_dir, cache_dir=cache_dir)
+    sources = [match.match_data_path, match.tracking_data_path]
+    path = None
+    cached = None
+    if features_dir is not None:
+        path = os.path.join(features_dir, f"{match_id}.npz")
+        cached = _load_features(path, sources)
+
+    if cached is None:
+        missing_gaps = list(max_ball_gaps)
+        cached_gaps = []
+    else:
+        features, cached_gaps = cached
+        missing_gaps = [gap for gap in max_ball_gaps if gap not in cached_gaps]
+        if not missing_gaps:
+            return features
+
+    match.gather_information()
+    if cached is None:
+        features = compute_features(match, missing_gaps)
+    else:
+        features.update(_ball_distances(match, missing_gaps))
+    if path is not None:
+        os.makedirs(features_dir, exist_ok=True)
+        meta = {
+            "version": SWEEP_VERSION,
+            "sources": [source_key(source) for source in sources],
+            "max_ball_gaps": sorted(set(cached_gaps) | set(missing_gaps)),
+        }
+        # Written next to its final place and renamed, for the parallel workers
+        temporary_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(temporary_path, meta=json.dumps(meta), **features)
+        os.replace(temporary_path, path)
+    return features
+
+
+def candidate_frames(features: dict, config: dict, memo: dict = None) -> np.ndarray:
+    """
+    Find the starting frames of the potentiel corner kicks with a set of thresholds,
+    the same frames as CornerKickFinder with this configuration
+
+    Args:
+        features (dict): features of the match, see compute_features
+        config (dict): configuration of CornerKickFinder
+        memo (dict): conditions already evaluated for other configurations, the
+            conditions of this configuration are added to it
+
+    Returns:
+        np.ndarray: frames found
+    """
+    memo = {} if memo is None else memo
+    radius = config["corner_radius"]
+    height = config["max_ball_height"]
+    limit = config["distance_limit"]
+    window = config["ball_window"]
+    max_gap = config["max_ball_gap"]
+
+    # A. Ball low in a corner coin, or in a corner coin around the frame if hidden
+    key = ("A", max_gap, radius, height, window)
+    if key not in memo:
+        ball_in_corner = features[f"ball_distance_{max_gap}"] < radius
+        memo[key] = conditions.condition_on_ball(
+            features["ball_visible"],
+            ball_in_corner,
+            features["ball_z"],
+            height,
+            conditions.any_around(ball_in_corner, window),
+        )
+
+    # B. Player in a corner coin
+    if ("B", radius) not in memo:
+        memo[("B", radius)] = conditions.condition_on_players_coordinates(
+            list(features["team_distance"].min(axis=1) < radius)
+        )
+
+    # C. Not two opponents in the 10 yards circle of at least one corner
+    if ("C", limit) not in memo:
+        is_inside = features["team_distance"] <= limit
+        memo[("C", limit)] = conditions.condition_on_distance_limit(
+            [(home, away) for home, away in is_inside]
+        )
+
+    is_eligible = conditions.is_eligible(
+        features["is_timed"], features["has_players"], memo[("C", limit)]
+    )
+    is_candidate = conditions.is_candidate(
+        is_eligible, memo[key], memo[("B", radius)]
+    )
+    frames = features["frames"][is_candidate]
+
+    # To be detected as a new situation, as in CornerKickFinder
+    return frames[1:][np.diff(frames) > config["min_frames_between"]]
+
+
+def score(found: np.ndarray, labels: np.ndarray, tolerance: int = TOLERANCE) -> tuple:
+    """
+    Compare the frames found with the labelled corner kicks of a match. A frame
+    found and a labelled corner kick match when they are at most tolerance frames
+    apart.
+
+    Args:
+        found (np.ndarray): frames found, in increasing order
+        labels (np.ndarray): frames of the labelled corner kicks, in increasing order
+        tolerance (int): maximum number of frames between two matching frames
+
+    Returns:
+        tuple: number of frames found, of frames found matching a labelled corner
+        kick and of labelled corner kicks matching a frame found
+    """
+
+    def n_close(frames: np.ndarray, references: np.ndarray) -> int:
+        if len(references) == 0:
+            return 0
+        after = np.clip(np.searchsorted(references, frames), 0, len(references) - 1)
+        before = np.clip(after - 1, 0, len(references) - 1)
+        distance = np.minimum(
+            np.abs(references[after] - frames), np.abs(references[before] - frames)
+        )
+        return int(np.count_nonzero(distance <= tolerance))
+
+    return len(found), n_close(found, labels), n_close(labels, found)
+
+
+def _sweep_match(
+    match_id: int,
+    labels: np.ndarray,
+    configs: list,
+    data_dir: str,
+    cache_dir: str,
+    features_dir: str,
+    tolerance: int,
+) -> tuple:
+    """
+    Evaluate all the configurations on one match. Run in a worker process, an error
+    is returned instead of being raised so that it does not stop the others.
+
+    Returns:
+        match_id, counts of score by configuration (None if it failed), error (None
+        if it succeeded)
+    """
+    try:
+        max_ball_gaps = sorted({config["max_ball_gap"] for config in configs})
+        features = match_features(
+            match_id, max_ball_gaps, data_dir, cache_dir, features_dir
+        )
+        memo = {}
+        counts = np.array(
+            [
+                score(candidate_frames(features, config, memo), labels, tolerance)
+                for config in configs
+            ],
+            dtype=np.int64,
+        ).reshape(len(configs), 3)
+        return match_id, counts, None
+    except Exception:
+        return match_id, None, traceback.format_exc()
+
+
+def run_sweep(
+    df_labels: pd.DataFrame,
+    grid: dict = None,
+    match_ids: list = None,
+    workers: int = None,
+    data_dir: str = "data/matches",
+    cache_dir: str = "data/cache",
+    features_dir: str = "data/sweep",
+    tolerance: int = TOLERANCE,
+) -> pd.DataFrame:
+    """
+    Evaluate a grid of thresholds of the finder on labelled corner kicks, the
+    matches being processed in parallel
+
+    Args:
+        df_labels (pandas.DataFrame): labelled corner kicks with the columns
+            match_id and frame
+        grid (dict): values tried by threshold, SWEEP_GRID if None
+        match_ids (list): matches evaluated, the matches of df_labels if None. A
+            match without label only counts the frames found.
+        workers (int): number of processes, the number of CPUs if None
+        data_dir (str): folder with one folder by match
+        cache_dir (str): folder of the binary cache of the parsed matches
+        features_dir (str): folder of the cached features of the matches
+        tolerance (int): maximum number of frames between a labelled corner kick
+            and a frame found
+
+    Returns:
+        pandas.DataFrame: one row by configuration with its thresholds and the
+        columns found, true_positives, labelled, recovered, precision and recall,
+        the best recall first. The errors by match_id are in attrs["failures"].
+
+    Raises:
+        ValueError: if the grid has no configuration
+    """
+    configs = parameter_grid(SWEEP_GRID if grid is None else grid)
+    if not configs:
+        raise ValueError("The grid of the sweep has no configuration")
+    if match_ids is None:
+        match_ids = sorted(df_labels["match_id"].unique())
+    labels = {
+        match_id: np.sort(frames.to_numpy(dtype=np.int64))
+        for match_id, frames in df_labels.groupby("match_id")["frame"]
+    }
+
+    counts = np.zeros((len(configs), 3), dtype=np.int64)
+    n_labelled = 0
+    failures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _sweep_match,
+                match_id,
+                labels.get(match_id, np.zeros(0, dtype=np.int64)),
+                configs,
+                data_dir,
+                cache_dir,
+                features_dir,
+                tolerance,
+            )
+            for match_id in match_ids
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Matches"):
+            match_id, match_counts, error = future.result()
+            if error is None:
+                counts += match_counts
+                n_labelled += len(labels.get(match_id, []))
+            else:
+                failures[match_id] = error
+                tqdm.write(f"{match_id} : failed - {error.splitlines()[-1]}")
+
+    df_sweep = pd.DataFrame(configs)
+    df_sweep["found"] = counts[:, 0]
+    df_sweep["true_positives"] = counts[:, 1]
+    df_sweep["labelled"] = n_labelled
+    df_sweep["recovered"] = counts[:, 2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df_sweep["precision"] = counts[:, 1] / counts[:, 0]
+        df_sweep["recall"] = counts[:, 2] / n_labelled
+    df_sweep = df_sweep.sort_values(
+        ["recall", "precision"], ascending=False, ignore_index=True
+    )
+    df_sweep.attrs["failures"] = failures
+    return df_sweep
+
+
+def _parse_grid(values: list) -> dict:
+    """Read the values of the --grid options, like corner_radius=1,1.5,2"""
+    grid = dict(SWEEP_GRID)
+    for value in values:
+        name, _, text = value.partition("=")
+        kind = int if name in INTEGER_PARAMETERS else float
+        grid[name] = [kind(item) for item in text.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate a grid of thresholds of the corner kicks finder"
+    )
+    parser.add_argument(
+        "labels", help="CSV file of the labelled corner kicks (match_id, frame)"
+    )
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        help="values of a threshold replacing the default ones, like corner_radius=1,2",
+    )
+    parser.add_argument(
+        "--match-ids",
+        type=int,
+        nargs="+",
+        default=None,
+        help="matches evaluated (default: the matches of the labels)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--data-dir", default="data/matches", help="folder with one folder by match"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=TOLERANCE,
+        help="maximum number of frames between a label and a frame found",
+    )
+    parser.add_argument(
+        "--output", default=None, help="CSV file where the results are saved"
+    )
+    args = parser.parse_args()
+
+    df_sweep = run_sweep(
+        pd.read_csv(args.labels),
+        grid=_parse_grid(args.grid),
+        match_ids=args.match_ids,
+        workers=args.workers,
+        data_dir=args.data_dir,
+        tolerance=args.tolerance,
+    )
+    failures = df_sweep.attrs["failures"]
+    if failures:
+        print(f"{len(failures)} matches failed: {sorted(failures)}")
+    print(df_sweep.head(10).to_string(index=False))
+    if args.output is not None:
+        df_sweep.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Define the class TrackingStore
+Author : Chloe Gobe
+Date : 20.05.2023
+"""
+
+import json
+import re
+import numpy as np
+
+# Codes used to store the group_name of every tracked object
+GROUP_NAMES = ("home team", "away team", "referee", "balls")
+GROUP_CODES = {name: code for code, name in enumerate(GROUP_NAMES)}
+MISSING = -1
+
+# Type of the per entry arrays
+ENTRY_DTYPES = {
+    "frame": np.int32,
+    "trackable_object": np.int32,
+    "track_id": np.int32,
+    "group": np.int8,
+    "x": np.float64,
+    "y": np.float64,
+    "z": np.float64,
+}
+
+_WHITESPACE = re.compile(r"[\s,]*")
+
+
+def iter_frames(path: str, buffer_size: int = 1 << 20):
+    """
+    Read the frames of a structured_data.json file one by one, without loading
+    the whole file. Only the current part of the file is kept in memory.
+
+    Args:
+        path (str): path of the structured_data.json file
+        buffer_size (int): number of characters read at once
+
+    Yields:
+        dict: a frame with the keys frame, time, period and data
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer = file.read(buffer_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} is not a list of frames")
+        position = 1
+
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                frame, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The frame is not complete, read the next part of the file
+                text = file.read(buffer_size)
+                if not text:
+                    raise
+                buffer = buffer[position:] + text
+                position = 0
+                continue
+            yield frame
+
+
+def iter_frame_chunks(path: str, chunk_size: int = 1000):
+    """
+    Read a structured_data.json file by chunks of frames, so that a chunk can be
+    analysed before the whole match is loaded
+
+    Args:
+        path (str): path of the structured_data.json file
+        chunk_size (int): number of frames by chunk
+
+    Yields:
+        TrackingStore: the tracking data of chunk_size consecutive frames
+    """
+    chunk = []
+    for frame in iter_frames(path):
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield TrackingStore.from_frames(chunk)
+            chunk = []
+    if chunk:
+        yield TrackingStore.from_frames(chunk)
+
+
+class _GrowableArray:
+    """NumPy array whose capacity doubles when it is full"""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def extend(self, values):
+        end = self._size + len(values)
+        if end > len(self._data):
+            self._data = np.resize(self._data, max(end, 2 * len(self._data)))
+        self._data[self._size : end] = values
+        self._size = end
+
+    def to_array(self) -> np.ndarray:
+        return self._data[: self._size].copy()
+
+
+class _TrackingBuilder:
+    """
+    Fill the arrays of a TrackingStore frame by frame. The entries are gathered in
+    lists and moved to the arrays every flush_size entries.
+    """
+
+    def __init__(self, flush_size: int = 10_000):
+        self.flush_size = flush_size
+        self.columns = {
+            name: _GrowableArray(dtype) for name, dtype in ENTRY_DTYPES.items()
+        }
+        self.pending = {name: [] for name in ENTRY_DTYPES}
+
+        # Per frame values
+        self.frames = []
+        self.time = []
+        self.period = []
+        self.offsets = [0]
+
+    def add_frame(self, item: dict):
+        data = item.get("data") or []
+        self.frames.append(item["frame"])
+        self.time.append(item.get("time"))
+        period = item.get("period")
+        self.period.append(MISSING if period is None else period)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+        pending = self.pending
+        nan = float("nan")
+        for position in data:
+            pending["frame"].append(item["frame"])
+            value = position.get("trackable_object")
+            pending["trackable_object"].append(MISSING if value is None else value)
+            value = position.get("track_id")
+            pending["track_id"].append(MISSING if value is None else value)
+            pending["group"].append(
+                GROUP_CODES.get(position.get("group_name"), MISSING)
+            )
+            value = position.get("x")
+            pending["x"].append(nan if value is None else value)
+            value = position.get("y")
+            pending["y"].append(nan if value is None else value)
+            value = position.get("z")
+            pending["z"].append(nan if value is None else value)
+
+        if len(pending["frame"]) >= self.flush_size:
+            self._flush()
+
+    def _flush(self):
+        for name, values in self.pending.items():
+            self.columns[name].extend(values)
+            values.clear()
+
+    def build(self) -> "TrackingStore":
+        self._flush()
+        time = np.empty(len(self.time), dtype=object)
+        time[:] = self.time
+        return TrackingStore(
+            np.array(self.frames, dtype=np.int64),
+            time,
+            np.array(self.period, dtype=np.int8),
+            np.array(self.offsets, dtype=np.int64),
+            {name: array.to_array() for name, array in self.columns.items()},
+        )
+
+
+class TrackingStore:
+    """
+    Define the class TrackingStore holding the tracking data of a match
+    in contiguous NumPy arrays.
+
+    Every object tracked in every frame is one entry of the flat arrays
+    (frame, trackable_object, track_id, group, x, y, z). The entries of the
+    frame stored at row i are the entries offsets[i]:offsets[i + 1] (CSR layout),
+    so that getting the content of a frame is a zero-copy slice.
+
+    Missing integer values are stored as -1 and missing coordinates as NaN.
+    """
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        time: np.ndarray,
+        period: np.ndarray,
+        offsets: np.ndarray,
+        columns: dict,
+    ):
+        # Per frame arrays
+        self.frames = frames
+        self.time = time
+        self.period = period
+        self.offsets = offsets
+
+        # Per entry arrays
+        self.frame = columns["frame"]
+        self.trackable_object = columns["trackable_object"]
+        self.track_id = columns["track_id"]
+        self.group = columns["group"]
+        self.x = columns["x"]
+        self.y = columns["y"]
+        self.z = columns["z"]
+
+        # Frame numbers are usually contiguous, which gives a direct lookup
+        self._first_frame = int(frames[0]) if len(frames) > 0 else 0
+        self._contiguous = bool(
+            np.array_equal(frames, self._first_frame + np.arange(len(frames)))
+        )
+        self._rows = (
+            None
+            if self._contiguous
+            else {int(frame): row for row, frame in enumerate(frames)}
+        )
+        self._entry_rows = None
+
+    @classmethod
+    def from_frames(cls, frames) -> "TrackingStore":
+        """
+        Build the store from the frames of a structured_data.json file
+
+        Args:
+            frames (iterable): dict with the keys frame, time, period and data
+
+        Returns:
+            TrackingStore
+        """
+        builder = _TrackingBuilder()
+        for frame in frames:
+            builder.add_frame(frame)
+        return builder.build()
+
+    @classmethod
+    def from_file(cls, path: str) -> "TrackingStore":
+        """
+        Build the store from a structured_data.json file read as a stream, so that
+        the memory used stays proportional to the arrays of the store
+
+        Args:
+            path (str): path of the structured_data.json file
+
+        Returns:
+            TrackingStore
+        """
+        return cls.from_frames(iter_frames(path))
+
+    # _________________________________________________________________
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def n_entries(self) -> int:
+        return len(self.x)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the numeric arrays of the store"""
+        arrays = (self.frames, self.period, self.offsets) + tuple(
+            self.columns().values()
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def columns(self) -> dict:
+        """Per entry arrays by name"""
+        return {
+            "frame": self.frame,
+            "trackable_object": self.trackable_object,
+            "track_id": self.track_id,
+            "group": self.group,
+            "x": self.x,
+            "y": self.y,
+            "z": self.z,
+        }
+
+    @property
+    def entry_rows(self) -> np.ndarray:
+        """Row of the frame of every entry, computed once"""
+        if self._entry_rows is None:
+            self._entry_rows = np.repeat(
+                np.arange(len(self.frames), dtype=np.int32), np.diff(self.offsets)
+            )
+        return self._entry_rows
+
+    def entries_of_rows(self, rows: np.ndarray) -> tuple:
+        """
+        Give the entries of several frames, without going through all the entries
+
+        Args:
+            rows (np.ndarray): rows of the frames
+
+        Returns:
+            entries : np.ndarray, indices of the entries
+            owners : np.ndarray, index in rows of the frame of each entry
+        """
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entries = np.arange(lengths.sum()) - first + np.repeat(starts, lengths)
+        return entries, owners
+
+    def row(self, frame_id: int) -> int:
+        """
+        Give the row of a frame in the per frame arrays
+
+        Args:
+            frame_id (int): identifier of a frame
+
+        Raises:
+            KeyError: if the frame is not in the tracking data
+        """
+        if self._contiguous:
+            row = int(frame_id) - self._first_frame
+            if 0 <= row < len(self.frames):
+                return row
+            raise KeyError(frame_id)
+        return self._rows[int(frame_id)]
+
+    def rows(self, frame_ids: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of row for many frames
+
+        Args:
+            frame_ids (np.ndarray): identifiers of frames
+
+        Returns:
+            np.ndarray: rows of the frames, -1 for the frames not in the tracking data
+        """
+        frame_ids = np.asarray(frame_ids, dtype=np.int64)
+        if len(self.frames) == 0:
+            return np.full(len(frame_ids), -1, dtype=np.int64)
+        if self._contiguous:
+            rows = frame_ids - self._first_frame
+        else:
+            order = np.argsort(self.frames, kind="stable")
+            positions = np.searchsorted(self.frames[order], frame_ids)
+            rows = order[np.clip(positions, 0, len(self.frames) - 1)]
+            rows[self.frames[rows] != frame_ids] = -1
+        rows[(rows < 0) | (rows >= len(self.frames))] = -1
+        return rows
+
+    def frame_slice(self, frame_id: int) -> slice:
+        """Slice of the entries of a frame"""
+        row = self.row(frame_id)
+        return slice(self.offsets[row], self.offsets[row + 1])
+
+    def window_slice(self, frame_start: int, frame_end: int) -> slice:
+        """Slice of the entries of the frames frame_start to frame_end (both included)"""
+        start = self.row(frame_start)
+        end = self.row(frame_end)
+        return slice(self.offsets[start], self.offsets[end + 1])
+
+    def get_frame(self, frame_id: int) -> dict:
+        """
+        Give the content of a frame as views on the per entry arrays
+
+        Args:
+            frame_id (int): identifier of a frame
+
+        Returns:
+            dict: per entry arrays restricted to the frame
+        """
+        entries = self.frame_slice(frame_id)
+        return {name: array[entries] for name, array in self.columns().items()}
+
+    def get_time(self, frame_id: int):
+        return self.time[self.row(frame_id)]
+
+    def rows_between(self, frame_start: int = None, frame_end: int = None) -> tuple:
+        """
+        Give the rows of the frames from frame_start to frame_end (both included),
+        the frames being in increasing order
+
+        Args:
+            frame_start (int): first frame, the first frame of the match if None
+            frame_end (int): last frame, the last frame of the match if None
+
+        Returns:
+            tuple: first row and row after the last one
+        """
+        row_start = (
+            0 if frame_start is None else int(np.searchsorted(self.frames, frame_start))
+        )
+        row_end = (
+            len(self.frames)
+            if frame_end is None
+            else int(np.searchsorted(self.frames, frame_end, side="right"))
+        )
+        return row_start, max(row_end, row_start)
+
+    def object_track(
+        self, trackable_object: int, row_start: int = 0, row_end: int = None
+    ) -> tuple:
+        """
+        Give the position of an object in every frame
+
+        Args:
+            trackable_object (int): identifier of the object
+            row_start (int): first row of the frames
+            row_end (int): row after the last one, the end of the match if None
+
+        Returns:
+            x, y, z : np.ndarray with one value per frame, NaN when the object is not visible
+        """
+        row_end = len(self.frames) if row_end is None else row_end
+        x = np.full(row_end - row_start, np.nan)
+        y = np.full(row_end - row_start, np.nan)
+        z = np.full(row_end - row_start, np.nan)
+
+        # Keep the first entry of the object in each frame
+        first_entry = self.offsets[row_start]
+        entries = first_entry + np.flatnonzero(
+            self.trackable_object[first_entry : self.offsets[row_end]]
+            == trackable_object
+        )
+        rows, first = np.unique(self.entry_rows[entries], return_index=True)
+        entries = entries[first]
+        rows -= row_start
+        x[rows] = self.x[entries]
+        y[rows] = self.y[entries]
+        z[rows] = self.z[entries]
+        return x, y, z
@@ -0,0 +1,76 @@
+"""
+Check the reading of the matches from an archive
+Author : Chloe Gobe
+Date : 20.05.2023
+
+Usage (from the root of the repository):
+    python -m pytest tests
+"""
+
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic_match import generate_match
+from code.archive import TrackingArchive, write_archive
+from code.match_toolbox import Match
+
+ARCHIVED_ID = 1
+OTHER_ID = 2
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory) -> str:
+    data_dir = str(tmp_path_factory.mktemp("matches"))
+    for match_id in (ARCHIVED_ID, OTHER_ID):
+        generate_match(data_dir, match_id, n_frames=500, n_corners=1, seed=match_id)
+    return data_dir
+
+
+@pytest.fixture(scope="module")
+def archive_path(data_dir, tmp_path_factory) -> str:
+    # The archive only holds one of the matches
+    path = str(tmp_path_factory.mktemp("archive") / "archive")
+    write_archive(path, [ARCHIVED_ID], data_dir=data_dir, cache_dir=None)
+    return path
+
+
+def _load(match_id: int, data_dir: str, archive=None) -> Match:
+    match = Match(match_id, data_dir=data_dir, cache_dir=None, archive=archive)
+    match.gather_information()
+    return match
+
+
+def test_archived_match(data_dir, archive_path):
+    match = _load(ARCHIVED_ID, data_dir, archive_path)
+    expected = _load(ARCHIVED_ID, data_dir)
+    # Read from the memory mapped files of the archive
+    assert isinstance(match.tracking.x.base, np.memmap)
+    assert np.array_equal(match.tracking.frames, expected.tracking.frames)
+    assert np.array_equal(match.tracking.x, expected.tracking.x, equal_nan=True)
+
+
+def test_match_not_in_archive(data_dir, archive_path):
+    archive = TrackingArchive(archive_path)
+    match = _load(OTHER_ID, data_dir, archive)
+    expected = _load(OTHER_ID, data_dir)
+    assert OTHER_ID not in archive
+    assert not archive.is_up_to_date(
+        OTHER_ID, [match.match_data_path, match.tracking_data_path]
+    )
+    assert np.array_equal(match.tracking.frames, expected.tracking.frames)
+    assert np.array_equal(match.tracking.x, expected.tracking.x, equal_nan=True)
+
+
+def test_changed_source_files(data_dir, archive_path):
+    match = Match(ARCHIVED_ID, data_dir=data_dir, cache_dir=None)
+    stat = os.stat(match.match_data_path)
+    archive = TrackingArchive(archive_path)
+    sources = [match.match_data_path, match.tracking_data_path]
+    try:
+        os.utime(match.match_data_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        assert not archive.is_up_to_date(ARCHIVED_ID, sources)
+        match = _load(ARCHIVED_ID, data_dir, archive)
+        assert not isinstance(match.tracking.x.base, np.memmap)
+    finally:
+        os.utime(match.match_data_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert archive.is_up_to_date(ARCHIVED_ID, sources)
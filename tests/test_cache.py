@@ -0,0 +1,64 @@
+"""
+Check the binary cache of the parsed matches
+Author : Chloe Gobe
+Date : 20.05.2023
+
+Usage (from the root of the repository):
+    python -m pytest tests
+"""
+
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic_match import generate_match
+from code.match_toolbox import Match
+
+MATCH_ID = 1
+
+
+@pytest.fixture
+def data_dir(tmp_path) -> str:
+    data_dir = str(tmp_path / "matches")
+    generate_match(data_dir, MATCH_ID, n_frames=500, n_corners=1, seed=MATCH_ID)
+    return data_dir
+
+
+def _load(data_dir: str, cache_dir: str) -> Match:
+    match = Match(MATCH_ID, data_dir=data_dir, cache_dir=cache_dir)
+    match.gather_information()
+    return match
+
+
+def _is_cached(match: Match) -> bool:
+    # Read from the memory mapped files of the cache
+    return isinstance(match.tracking.x, np.memmap)
+
+
+def test_cached_match(data_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    written = _load(data_dir, cache_dir)
+    assert not _is_cached(written)
+    assert os.listdir(os.path.join(cache_dir, str(MATCH_ID)))
+
+    match = _load(data_dir, cache_dir)
+    expected = _load(data_dir, None)
+    assert _is_cached(match)
+    assert match.match_data == expected.match_data
+    assert np.array_equal(match.tracking.frames, expected.tracking.frames)
+    assert np.array_equal(match.tracking.x, expected.tracking.x, equal_nan=True)
+    assert np.array_equal(
+        match.tracking.trackable_object, expected.tracking.trackable_object
+    )
+
+
+@pytest.mark.parametrize("source", ["match_data_path", "tracking_data_path"])
+def test_changed_source_file(data_dir, tmp_path, source):
+    cache_dir = str(tmp_path / "cache")
+    _load(data_dir, cache_dir)
+    path = getattr(Match(MATCH_ID, data_dir=data_dir), source)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    # Read again from the files, then from the rebuilt cache
+    assert not _is_cached(_load(data_dir, cache_dir))
+    assert _is_cached(_load(data_dir, cache_dir))
@@ -0,0 +1,131 @@
+"""
+Check that the paths of the detection find the same frames
+Author : Chloe Gobe
+Date : 20.05.2023
+
+The corner kicks are found frame by frame by CornerKickFinder._candidate_frames_loop
+and by several faster paths that must give the same frames. A synthetic match is
+generated once and every path is compared with the loop, with the default
+thresholds and with other ones.
+
+Usage (from the root of the repository):
+    python -m pytest tests
+"""
+
+import json
+import os
+import numpy as np
+import pytest
+from benchmarks.synthetic_match import generate_match
+from code.corner_kicks_finder import DEFAULT_CONFIG, CornerKickFinder
+from code.events import EventDetector
+from code.live_detector import LiveCornerDetector
+from code.match_toolbox import Match
+from code.sweep import candidate_frames, match_features
+from code.tracking_store import iter_frames
+
+MATCH_ID = 1
+
+# Thresholds replacing the ones of DEFAULT_CONFIG
+CONFIGS = [
+    {},
+    {"corner_radius": 2, "max_ball_height": 1.0, "ball_window": 10, "max_ball_gap": 20},
+]
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory) -> str:
+    data_dir = str(tmp_path_factory.mktemp("matches"))
+    generate_match(data_dir, MATCH_ID, n_frames=6000, n_corners=4, seed=1)
+    return data_dir
+
+
+@pytest.fixture(scope="module")
+def match(data_dir) -> Match:
+    match = Match(MATCH_ID, data_dir=data_dir, cache_dir=None)
+    match.gather_information()
+    return match
+
+
+def _finder_frames(match: Match, config: dict, **kwargs) -> list:
+    finder = CornerKickFinder(MATCH_ID, store_path=None, match=match, **config)
+    finder.find_potentiel_corner_kicks(**kwargs)
+    return finder.df_potential["frame"].tolist()
+
+
+@pytest.fixture(scope="module")
+def loop_frames(match) -> list:
+    """Frames found frame by frame, by index of CONFIGS"""
+    frames = [_finder_frames(match, config, vectorized=False) for config in CONFIGS]
+    # The comparisons are only meaningful if corner kicks are found
+    assert all(frames)
+    return frames
+
+
+@pytest.mark.parametrize("config", range(len(CONFIGS)))
+def test_vectorized_finder(match, loop_frames, config):
+    frames = _finder_frames(match, CONFIGS[config], vectorized=True, prune=False)
+    assert frames == loop_frames[config]
+
+
+@pytest.mark.parametrize("config", range(len(CONFIGS)))
+def test_pruned_finder(match, loop_frames, config):
+    frames = _finder_frames(match, CONFIGS[config], vectorized=True, prune=True)
+    assert frames == loop_frames[config]
+
+
+@pytest.mark.parametrize("batch_size", [3, 50])
+@pytest.mark.parametrize("config", range(len(CONFIGS)))
+def test_live_detector(data_dir, loop_frames, config, batch_size):
+    match_dir = os.path.join(data_dir, str(MATCH_ID))
+    with open(os.path.join(match_dir, "match_data.json"), "r", encoding="utf-8") as file:
+        match_data = json.load(file)
+    detector = LiveCornerDetector(match_data, match_id=MATCH_ID, **CONFIGS[config])
+    batch = []
+    for frame in iter_frames(os.path.join(match_dir, "structured_data.json")):
+        batch.append(frame)
+        if len(batch) == batch_size:
+            detector.push_frames(batch)
+            batch = []
+    detector.push_frames(batch)
+    detector.flush()
+    assert [event["frame"] for event in detector.events] == loop_frames[config]
+
+
+@pytest.mark.parametrize("config", range(len(CONFIGS)))
+def test_event_detector(match, loop_frames, config):
+    # All the rules share the features, the other ones must not change the corners
+    df_events = EventDetector(match, **CONFIGS[config]).detect()
+    frames = df_events.loc[df_events["event"] == "corner_kick", "frame"].tolist()
+    assert frames == loop_frames[config]
+
+
+def test_sweep(data_dir, loop_frames, tmp_path):
+    configs = [DEFAULT_CONFIG | config for config in CONFIGS]
+    max_ball_gaps = sorted({config["max_ball_gap"] for config in configs})
+    # Computed and cached, then read from the cache
+    for _ in range(2):
+        features = match_features(
+            MATCH_ID, max_ball_gaps, data_dir, None, str(tmp_path / "sweep")
+        )
+        # The conditions are shared between the configurations, as in run_sweep
+        memo = {}
+        frames = [
+            candidate_frames(features, config, memo).tolist() for config in configs
+        ]
+        assert frames == loop_frames
+
+
+def test_sweep_new_gaps(data_dir, loop_frames, tmp_path):
+    configs = [DEFAULT_CONFIG | config for config in CONFIGS]
+    max_ball_gaps = [config["max_ball_gap"] for config in configs]
+    features_dir = str(tmp_path / "sweep")
+    # The cache of the first value of max_ball_gap is completed with the second one
+    for gaps in ([max_ball_gaps[0]], [max_ball_gaps[1]]):
+        match_features(MATCH_ID, gaps, data_dir, None, features_dir)
+    with np.load(os.path.join(features_dir, f"{MATCH_ID}.npz")) as data:
+        assert json.loads(str(data["meta"]))["max_ball_gaps"] == sorted(max_ball_gaps)
+    features = match_features(MATCH_ID, max_ball_gaps, data_dir, None, features_dir)
+    memo = {}
+    frames = [candidate_frames(features, config, memo).tolist() for config in configs]
+    assert frames == loop_frames
@@ -0,0 +1,95 @@
+"""
+Check that a window of the kinematics gives the values of the whole match
+Author : Chloe Gobe
+Date : 20.05.2023
+
+A window is computed with the rows around it that can change its values. It is
+compared with the same rows of the kinematics of the whole match, for windows at
+the beginning and at the end of the match and for windows of one row.
+
+Usage (from the root of the repository):
+    python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+from benchmarks.synthetic_match import generate_match
+from code.kinematics import Kinematics
+from code.match_toolbox import Match
+
+MATCH_ID = 1
+N_FRAMES = 3000
+
+# Rows of the windows, the end is excluded
+WINDOWS = [
+    (0, N_FRAMES),
+    (0, 1),
+    (0, 40),
+    (1, 2),
+    (1500, 1501),
+    (1000, 1300),
+    (N_FRAMES - 40, N_FRAMES),
+    (N_FRAMES - 1, N_FRAMES),
+]
+
+# (smoothing, max_gap)
+SETTINGS = [(2, 10), (0, 0), (5, None)]
+
+
+@pytest.fixture(scope="module")
+def match(tmp_path_factory) -> Match:
+    data_dir = str(tmp_path_factory.mktemp("matches"))
+    # Players and ball missing in some frames, to have gaps to fill and to cut
+    generate_match(
+        data_dir,
+        MATCH_ID,
+        n_frames=N_FRAMES,
+        dropout_rate=0.05,
+        missing_ball_rate=0.2,
+        n_corners=2,
+        seed=MATCH_ID,
+    )
+    match = Match(MATCH_ID, data_dir=data_dir, cache_dir=None)
+    match.gather_information()
+    return match
+
+
+def _assert_same(window: Kinematics, expected: Kinematics):
+    assert np.array_equal(window.frames, expected.frames)
+    index = np.searchsorted(expected.trackable_objects, window.trackable_objects)
+    assert np.array_equal(expected.trackable_objects[index], window.trackable_objects)
+    # The objects outside the window and its context are never tracked in the window
+    is_absent = np.ones(len(expected.trackable_objects), dtype=bool)
+    is_absent[index] = False
+    for name in Kinematics.QUANTITIES:
+        values, expected_values = getattr(window, name), getattr(expected, name)
+        assert np.array_equal(values, expected_values[index], equal_nan=True), name
+        assert np.isnan(expected_values[is_absent]).all(), name
+    assert np.array_equal(window.interpolated, expected.interpolated[index])
+    assert np.array_equal(window.distance, expected.distance[index])
+
+
+@pytest.mark.parametrize("smoothing, max_gap", SETTINGS)
+@pytest.mark.parametrize("row_start, row_end", WINDOWS)
+def test_window(match, smoothing, max_gap, row_start, row_end):
+    whole = Kinematics.from_tracking(
+        match.tracking, smoothing=smoothing, max_gap=max_gap
+    )
+    window = Kinematics.from_tracking(
+        match.tracking,
+        smoothing=smoothing,
+        max_gap=max_gap,
+        row_start=row_start,
+        row_end=row_end,
+    )
+    _assert_same(window, whole.window(row_start, row_end))
+
+
+def test_match_window(match):
+    frames = match.tracking.frames
+    frame_start, frame_end = int(frames[1000]), int(frames[1299])
+    # Computed around the window, then a view on the cached whole match
+    window = match.kinematics(frame_start, frame_end)
+    match.kinematics()
+    _assert_same(window, match.kinematics(frame_start, frame_end))
+    assert window.frames[0] == frame_start and window.frames[-1] == frame_end
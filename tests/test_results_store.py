@@ -0,0 +1,62 @@
+"""
+Check the results store of the corner kicks finder
+Author : Chloe Gobe
+Date : 20.05.2023
+
+Usage (from the root of the repository):
+    python -m pytest tests
+"""
+
+import os
+from unittest import mock
+import pytest
+from benchmarks.synthetic_match import generate_match
+from code.corner_kicks_finder import DETECTOR_VERSION, CornerKickFinder
+from code.match_toolbox import Match
+from code.results_store import ResultsStore
+
+MATCH_ID = 1
+
+
+@pytest.fixture(scope="module")
+def data_dir(tmp_path_factory) -> str:
+    data_dir = str(tmp_path_factory.mktemp("matches"))
+    generate_match(data_dir, MATCH_ID, n_frames=2000, n_corners=2, seed=MATCH_ID)
+    return data_dir
+
+
+def _finder(data_dir: str, store_path: str) -> CornerKickFinder:
+    match = Match(MATCH_ID, data_dir=data_dir, cache_dir=None)
+    return CornerKickFinder(MATCH_ID, store_path=store_path, match=match)
+
+
+def test_stored_match_not_loaded(data_dir, tmp_path):
+    store_path = str(tmp_path / "corner_kicks.sqlite")
+    finder = _finder(data_dir, store_path)
+    finder.find_potentiel_corner_kicks()
+    assert len(finder.df_potential) > 0
+    # The second finder reads the store without loading the match
+    with mock.patch.object(Match, "gather_information", side_effect=AssertionError):
+        stored = _finder(data_dir, store_path)
+        stored.find_potentiel_corner_kicks()
+    assert stored.df_potential["frame"].tolist() == finder.df_potential["frame"].tolist()
+
+
+def test_query_current_version(data_dir, tmp_path):
+    store_path = str(tmp_path / "corner_kicks.sqlite")
+    finder = _finder(data_dir, store_path)
+    finder.find_potentiel_corner_kicks()
+    store = ResultsStore(store_path)
+    outdated = finder.df_potential.head(1)
+    store.save(
+        MATCH_ID,
+        finder.config_hash,
+        "0",
+        finder.config,
+        outdated,
+        finder.match.match_data,
+    )
+    assert set(store.query()["code_version"]) == {DETECTOR_VERSION}
+    assert len(store.query()) == len(finder.df_potential)
+    assert len(store.query(all_versions=True)) == len(finder.df_potential) + 1
+    assert len(store.query(code_version="0")) == 1